@@ -0,0 +1,178 @@
+import gzip
+import json
+import time
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterator
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import delete, inspect
+
+from . import config
+from .db import DB_DIR, LEGACY_OBSERVATIONS, Log, WeatherObservation, get_db, select
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+archive_stats = Counter()
+
+
+def archive_dir() -> Path:
+    return Path(config.ARCHIVE_DIR) if config.ARCHIVE_DIR else DB_DIR / "archive"
+
+
+def _month(observed_at: int) -> str:
+    return datetime.fromtimestamp(observed_at, timezone.utc).strftime("%Y-%m")
+
+
+def _observation_file(month: str, city_id: int) -> Path:
+    return archive_dir() / "observations" / month / f"city_{city_id}.ndjson.gz"
+
+
+def _append(path: Path, records: list[dict]) -> None:
+    # Every append adds a gzip member, 'gzip.open' reads the members of a file back as one stream
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path, "at", encoding="utf-8") as file:
+        file.writelines(json.dumps(record) + "\n" for record in records)
+
+
+def _move_batches(stmt, model, write: Callable[[list], None], batch_size: int) -> int:
+    """
+    Moves the rows of 'stmt' (an id column first) to the archive in batches of 'batch_size' rows.
+
+    Every batch is written to the archive before it is deleted, in its own short transaction, so writers wait for at
+    most one batch. A crash between the two archives a batch twice, readers drop the repeated rows.
+    """
+    moved = 0
+    while True:
+        db = get_db()
+        try:
+            rows = db.execute(stmt.order_by(model.id).limit(batch_size)).all()
+            if not rows:
+                return moved
+            write(rows)
+            db.execute(delete(model).where(model.id.in_([row[0] for row in rows])))
+            db.commit()
+        finally:
+            db.close()
+
+        moved += len(rows)
+        if len(rows) < batch_size:
+            return moved
+        # Lets waiting writers take the database lock before the next batch
+        time.sleep(config.RETENTION_BATCH_PAUSE_MS / 1000)
+
+
+def _write_observations(rows: list) -> None:
+    partitions = defaultdict(list)
+    for observation_id, city_id, observed_at, temperature_c in rows:
+        record = {"id": observation_id, "city_id": city_id, "observed_at": observed_at, "temperature_c": temperature_c}
+        partitions[(_month(observed_at), city_id)].append(record)
+
+    for (month, city_id), records in partitions.items():
+        _append(_observation_file(month, city_id), records)
+
+
+def _write_logs(rows: list) -> None:
+    partitions = defaultdict(list)
+    for log_id, timestamp, level, message in rows:
+        record = {"id": log_id, "timestamp": timestamp.isoformat() if timestamp else None, "level": level, "message": message}
+        partitions[timestamp.strftime("%Y-%m") if timestamp else "unknown"].append(record)
+
+    for month, records in partitions.items():
+        _append(archive_dir() / "logs" / f"{month}.ndjson.gz", records)
+
+
+def archive_observations(cutoff: int, batch_size: int | None = None) -> int:
+    """Moves observations from before 'cutoff' (UTC epoch seconds) to the archive. Rollups are kept."""
+    stmt = select(
+        WeatherObservation.id,
+        WeatherObservation.city_id,
+        WeatherObservation.observed_at,
+        WeatherObservation.temperature_c,
+    ).where(WeatherObservation.observed_at < cutoff)
+    return _move_batches(stmt, WeatherObservation, _write_observations, batch_size or config.RETENTION_BATCH_SIZE)
+
+
+def archive_logs(cutoff: datetime, batch_size: int | None = None) -> int:
+    """Moves log rows from before 'cutoff' (local time, as the rows are written) to the archive."""
+    stmt = select(Log.id, Log.timestamp, Log.level, Log.message).where(Log.timestamp < cutoff)
+    return _move_batches(stmt, Log, _write_logs, batch_size or config.RETENTION_BATCH_SIZE)
+
+
+def archived_until() -> int | None:
+    """
+    UTC epoch seconds every archived observation is older than, the end of the latest month with an archive file.
+    None if no observations were archived.
+    """
+    root = archive_dir() / "observations"
+    months = [path.name for path in root.iterdir() if path.is_dir()] if root.is_dir() else []
+    if not months:
+        return None
+
+    latest = datetime.strptime(max(months), "%Y-%m").replace(tzinfo=timezone.utc)
+    return int((latest + timedelta(days=32)).replace(day=1).timestamp())
+
+
+def retention_enabled() -> bool:
+    return config.OBSERVATION_RETENTION_DAYS > 0 or config.LOG_RETENTION_DAYS > 0
+
+
+def _legacy_copy_pending() -> bool:
+    db = get_db()
+    try:
+        return inspect(db.get_bind()).has_table(LEGACY_OBSERVATIONS)
+    finally:
+        db.close()
+
+
+def run_retention() -> None:
+    """Archives the observations and logs that are older than their retention, scheduled every 'RETENTION_INTERVAL_HOURS'."""
+    try:
+        # Copied legacy observations only get their rollups once the copy is done, they are not archived before that
+        if _legacy_copy_pending():
+            logger.info("Retention waits until the legacy observations are copied")
+            return
+        if config.OBSERVATION_RETENTION_DAYS > 0:
+            cutoff = int(time.time() - config.OBSERVATION_RETENTION_DAYS * 86400)
+            archive_stats["observations_archived"] += archive_observations(cutoff)
+        if config.LOG_RETENTION_DAYS > 0:
+            archive_stats["logs_archived"] += archive_logs(datetime.now() - timedelta(days=config.LOG_RETENTION_DAYS))
+        archive_stats["runs"] += 1
+    except Exception as e:
+        archive_stats["errors"] += 1
+        logger.critical(f"Error archiving old rows: '{str(e)}'")
+
+
+def _months(start: int | None, end: int | None) -> list[str]:
+    root = archive_dir() / "observations"
+    if not root.is_dir():
+        return []
+    months = sorted(path.name for path in root.iterdir() if path.is_dir())
+    first = _month(start) if start is not None else ""
+    last = _month(end) if end is not None else "9999-99"
+    return [month for month in months if first <= month <= last]
+
+
+def iter_archived_observations(city_id: int, start: int | None = None, end: int | None = None) -> Iterator[list[tuple[int, int, float]]]:
+    """
+    Reads a city's archived (id, observed_at, temperature_c) rows in time order, one month per chunk.
+
+    'start' is inclusive and 'end' exclusive (UTC epoch seconds), as for '/reports/'.
+    """
+    for month in _months(start, end):
+        path = _observation_file(month, city_id)
+        if not path.is_file():
+            continue
+
+        rows = {}
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            for line in file:
+                record = json.loads(line)
+                observed_at = record["observed_at"]
+                if (start is None or observed_at >= start) and (end is None or observed_at < end):
+                    # One row per time, a batch archived twice is read once
+                    rows[observed_at] = (record["id"], observed_at, record["temperature_c"])
+
+        if rows:
+            yield [rows[observed_at] for observed_at in sorted(rows)]
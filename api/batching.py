@@ -0,0 +1,195 @@
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable
+from typing import Any
+
+# Queued by 'stop' to wake a waiting writer thread right away
+_WAKE_UP = object()
+
+
+class BatchWriter:
+    """
+    Collects items from any thread and hands them to 'flush' in batches, on a single background thread.
+
+    A batch is flushed once it holds 'batch_size' items or 'flush_interval' seconds after its first item arrived.
+    The queue is bounded, when it is full 'drop_policy' decides whether the new item ("newest")
+    or the oldest queued item ("oldest") is dropped, or whether 'put' waits for room ("block").
+    A batch whose flush raises is tried again up to 'retries' times, with a doubling delay from 'retry_delay' seconds,
+    before it is counted as failed and reported to 'logger'.
+    The thread starts on the first 'put', and 'stop' flushes everything still queued before returning.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush: Callable[[list[Any]], None],
+        batch_size: int,
+        flush_interval: float,
+        max_queue: int,
+        drop_policy: str = "newest",
+        retries: int = 0,
+        retry_delay: float = 0.5,
+        logger: logging.Logger | None = None,
+    ):
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.logger = logger or logging.getLogger(__name__)
+        self.stats: Counter[str] = Counter()
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self._flush = flush
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        # Set while 'stop' waits for the thread, a 'put' meanwhile must not start a second thread
+        self._stopping = False
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def put(self, item: Any) -> bool:
+        """Queues an item, only waits with the "block" drop policy. Returns False if an item had to be dropped."""
+        self.start()
+
+        if self.drop_policy == "block":
+            self._queue.put(item)
+            return True
+
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+
+        self.stats["dropped"] += 1
+        if self.drop_policy == "oldest":
+            try:
+                self._queue.get_nowait()
+                self._queue.put_nowait(item)
+            except (queue.Empty, queue.Full):
+                pass
+
+        return False
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+
+        with self._lock:
+            # Items put while stopping are flushed by 'stop' itself
+            if self._thread is None and not self._stopping:
+                self._stop_event.clear()
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stops the background thread after it has flushed every queued item."""
+        with self._lock:
+            if self._stopping:
+                return
+            thread, self._thread = self._thread, None
+            self._stopping = thread is not None
+
+        if thread is None:
+            return
+
+        try:
+            self._stop_event.set()
+            try:
+                self._queue.put_nowait(_WAKE_UP)
+            except queue.Full:
+                pass  # The writer is busy flushing and will see the stop event
+            thread.join(timeout)
+
+            if not thread.is_alive():
+                # Items put after the thread's last look at the queue
+                self._drain()
+        finally:
+            with self._lock:
+                self._stopping = False
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = [] if first is _WAKE_UP else [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and not self._stop_event.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is not _WAKE_UP:
+                    batch.append(item)
+
+            if batch:
+                self._flush_batch(batch)
+
+        self._drain()
+
+    def _drain(self) -> None:
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if item is _WAKE_UP:
+                continue
+            batch.append(item)
+
+            if len(batch) >= self.batch_size:
+                self._flush_batch(batch)
+                batch = []
+
+        if batch:
+            self._flush_batch(batch)
+
+    def _flush_batch(self, batch: list[Any]) -> None:
+        start = time.perf_counter()
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    self._flush(batch)
+                    self.stats["flushed"] += len(batch)
+                    return
+                except Exception as e:
+                    error = e
+                if attempt < self.retries:
+                    self.stats["retries"] += 1
+                    time.sleep(self.retry_delay * 2**attempt)
+
+            self.stats["failed"] += len(batch)
+            self.logger.error(f"Failed to flush {len(batch)} item(s) in '{self.name}' after {self.retries + 1} attempt(s): '{str(error)}'")
+        finally:
+            self.stats["flushes"] += 1
+            self.last_flush_seconds = time.perf_counter() - start
+            self.max_flush_seconds = max(self.max_flush_seconds, self.last_flush_seconds)
+
+    def snapshot(self) -> dict[str, float]:
+        return {
+            "queue_depth": self.queue_depth,
+            "flushed": self.stats["flushed"],
+            "flushes": self.stats["flushes"],
+            "failed": self.stats["failed"],
+            "retries": self.stats["retries"],
+            "dropped": self.stats["dropped"],
+            "last_flush_seconds": round(self.last_flush_seconds, 6),
+            "max_flush_seconds": round(self.max_flush_seconds, 6),
+        }
@@ -0,0 +1,191 @@
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import config
+from .db import GeocodeCacheEntry, get_db
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+Coordinates = tuple[float, float]
+
+
+class LRUCache:
+    """A thread-safe, size-bounded mapping that evicts the least recently used key first."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class GeocodeCache:
+    """
+    Two-layer cache for geocoding results: an in-process LRU in front of the 'geocode_cache' table.
+
+    Not-found results are cached too (as None), with their own, shorter TTL.
+    """
+
+    def __init__(self, maxsize: int):
+        self.memory = LRUCache(maxsize)
+        self.stats: Counter[str] = Counter()
+
+    @staticmethod
+    def _key(name: str, country_code: str) -> tuple[str, str]:
+        return name.strip().upper(), country_code.strip().upper()
+
+    @staticmethod
+    def _is_fresh(coordinates: Coordinates | None, cached_at: float) -> bool:
+        ttl_hours = config.GEOCODE_CACHE_TTL_HOURS if coordinates else config.GEOCODE_NEGATIVE_TTL_HOURS
+        return time.time() - cached_at < ttl_hours * 3600
+
+    def get(self, name: str, country_code: str) -> tuple[bool, Coordinates | None]:
+        """
+        Looks up a (name, country_code) pair.
+
+        Returns:
+            tuple[bool, Coordinates | None]: Whether the pair was cached, and its coordinates (None if it was not found upstream).
+        """
+        key = self._key(name, country_code)
+
+        entry = self.memory.get(key)
+        if entry and self._is_fresh(*entry):
+            self.stats["memory_hits"] += 1
+            return True, entry[0]
+
+        try:
+            db = get_db()
+            row = db.get(GeocodeCacheEntry, key)
+            if row:
+                coordinates = (row.latitude, row.longitude) if row.latitude is not None else None
+                if self._is_fresh(coordinates, row.cached_at):
+                    self.memory.set(key, (coordinates, row.cached_at))
+                    self.stats["db_hits"] += 1
+                    return True, coordinates
+        except SQLAlchemyError as e:
+            logger.warning(f"Geocode cache lookup failed for '{key}': '{e}'")
+        finally:
+            db.close()
+
+        self.stats["misses"] += 1
+        return False, None
+
+    def set(self, name: str, country_code: str, coordinates: Coordinates | None) -> None:
+        key = self._key(name, country_code)
+        cached_at = time.time()
+        self.memory.set(key, (coordinates, cached_at))
+
+        latitude, longitude = coordinates or (None, None)
+        try:
+            db = get_db()
+            db.merge(GeocodeCacheEntry(name=key[0], country_code=key[1], latitude=latitude, longitude=longitude, cached_at=cached_at))
+            db.commit()
+        except SQLAlchemyError as e:
+            logger.warning(f"Geocode cache store failed for '{key}': '{e}'")
+        finally:
+            db.close()
+
+    def clear(self) -> None:
+        """Empties the in-process layer only, entries in the database stay until they expire."""
+        self.memory.clear()
+
+    def snapshot(self) -> dict[str, int]:
+        return {
+            "size": len(self.memory),
+            "memory_hits": self.stats["memory_hits"],
+            "db_hits": self.stats["db_hits"],
+            "misses": self.stats["misses"],
+        }
+
+
+class ResponseCache:
+    """
+    In-process cache of serialized responses with their ETags, for endpoints that only change through this process.
+
+    Writers invalidate the keys they change. Every invalidation bumps 'version', and a response built from data read
+    before an invalidation is not stored, so a concurrent read can never put a stale response back in the cache.
+    """
+
+    def __init__(self, maxsize: int):
+        self.memory = LRUCache(maxsize)
+        self.stats: Counter[str] = Counter()
+        self.version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return config.RESPONSE_CACHE_SIZE > 0 and not config.LEADER_ELECTION
+
+    @staticmethod
+    def etag(body: bytes) -> str:
+        return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+    def get(self, key: Hashable) -> tuple[bytes, str] | None:
+        """Returns the cached (body, ETag) of a key, or None."""
+        entry = self.memory.get(key)
+        self.stats["hits" if entry else "misses"] += 1
+        return entry
+
+    def set(self, key: Hashable, body: bytes, version: int) -> tuple[bytes, str]:
+        """Caches a body built from data read at 'version', unless a key was invalidated since. Returns (body, ETag)."""
+        entry = body, self.etag(body)
+        with self._lock:
+            if version == self.version and self.enabled:
+                self.memory.set(key, entry)
+        return entry
+
+    def invalidate(self, *keys: Hashable) -> None:
+        with self._lock:
+            self.version += 1
+            for key in keys:
+                self.memory.delete(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.version += 1
+            self.memory.clear()
+
+    def snapshot(self) -> dict[str, float]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "size": len(self.memory),
+            "hits": self.stats["hits"],
+            "misses": self.stats["misses"],
+            "not_modified": self.stats["not_modified"],
+            "hit_ratio": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+geocode_cache = GeocodeCache(config.GEOCODE_CACHE_SIZE)
+response_cache = ResponseCache(config.RESPONSE_CACHE_SIZE)
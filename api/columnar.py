@@ -0,0 +1,120 @@
+import io
+from collections.abc import Iterator, Sequence
+from datetime import datetime
+
+from sqlalchemy import Integer, Select, type_coerce
+
+from . import config
+from .db import WeatherObservation, get_db, select
+from .utils import to_epoch
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # Optional, installed with the 'analytics' extra
+    pa = pc = pq = None
+
+
+def columnar_available() -> bool:
+    return pa is not None
+
+
+def columnar_query(city_ids: Sequence[int], start: datetime | None = None, end: datetime | None = None) -> Select:
+    """
+    Selects plain (city_id, id, observed_at, temperature_c) rows of several cities, ordered by city and time.
+
+    'temperature_c' is the stored integer count of hundredths of a degree, it is scaled as a column afterwards.
+    """
+    stmt = (
+        select(
+            WeatherObservation.city_id,
+            WeatherObservation.id,
+            WeatherObservation.observed_at,
+            type_coerce(WeatherObservation.temperature_c, Integer).label("temperature_c"),
+        )
+        .where(WeatherObservation.city_id.in_(city_ids))
+        .order_by(WeatherObservation.city_id, WeatherObservation.observed_at, WeatherObservation.id)
+    )
+
+    if start:
+        stmt = stmt.where(WeatherObservation.observed_at >= to_epoch(start))
+
+    if end:
+        stmt = stmt.where(WeatherObservation.observed_at < to_epoch(end))
+
+    return stmt
+
+
+def _schema(temperature_unit: str, timezone: str) -> "pa.Schema":
+    return pa.schema(
+        [
+            pa.field("city_id", pa.int64()),
+            pa.field("id", pa.int64()),
+            pa.field("timestamp", pa.timestamp("s", tz=timezone)),
+            pa.field("temperature", pa.float64()),
+        ],
+        metadata={"temperature_unit": temperature_unit},
+    )
+
+
+def _record_batch(rows: Sequence[tuple[int, int, int, int]], schema: "pa.Schema", temperature_unit: str) -> "pa.RecordBatch":
+    city_ids, ids, observed_at, hundredths = zip(*rows)
+
+    temperature = pc.divide(pa.array(hundredths, pa.float64()), 100)
+    if temperature_unit == "F":
+        temperature = pc.round(pc.add(pc.multiply(temperature, 1.8), 32), 2)
+
+    # Epoch seconds are already the storage of a timestamp column, the timezone is only the column's type
+    timestamps = pa.array(observed_at, pa.int64()).cast(schema.field("timestamp").type)
+
+    return pa.record_batch([pa.array(city_ids, pa.int64()), pa.array(ids, pa.int64()), timestamps, temperature], schema=schema)
+
+
+class _Drain(io.RawIOBase):
+    """A write-only file whose written bytes are taken out as they are streamed, keeping the position for writers."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_columnar(stmt: Select, temperature_unit: str, timezone: str, format: str) -> Iterator[bytes]:
+    """
+    Streams the rows of 'columnar_query' as an Arrow IPC stream or a Parquet file, one record batch or row group per chunk.
+    """
+    schema = _schema(temperature_unit, timezone)
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, schema) if format == "parquet" else pa.ipc.new_stream(sink, schema)
+
+    # Opens its own session, the request's session is closed before a streaming response is sent
+    db = get_db()
+    try:
+        result = db.execute(stmt.execution_options(yield_per=config.EXPORT_CHUNK_SIZE, stream_results=True))
+        for partition in result.partitions():
+            writer.write_batch(_record_batch(partition, schema, temperature_unit))
+            yield sink.drain()
+    finally:
+        db.close()
+
+    # The end-of-stream marker or Parquet footer
+    writer.close()
+    yield sink.drain()
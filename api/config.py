@@ -0,0 +1,144 @@
+import os
+
+
+def _env_str(name: str, default: str) -> str:
+    return os.getenv(name, default)
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# SQLite database file (default: data/weather_data.db) and engine profile, "production" or "default".
+# The production profile applies the SQLITE_* pragmas on connect and sizes the pool for the scheduler's workers.
+DATABASE_FILE = _env_str("DATABASE_FILE", "")
+DB_PROFILE = _env_str("DB_PROFILE", "production")
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", 0)  # 0: SCHEDULER_MAX_WORKERS + 5
+DB_MAX_OVERFLOW = _env_int("DB_MAX_OVERFLOW", 20)
+SQLITE_JOURNAL_MODE = _env_str("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = _env_str("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+SQLITE_CACHE_SIZE_KB = _env_int("SQLITE_CACHE_SIZE_KB", 20_000)
+SQLITE_MMAP_SIZE = _env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+
+# Threads the scheduler runs jobs on
+SCHEDULER_MAX_WORKERS = _env_int("SCHEDULER_MAX_WORKERS", 10)
+# Each city job runs at a fixed per-city offset within its interval, plus a random delay of up to this many seconds
+SCHEDULER_JITTER_SECONDS = _env_int("SCHEDULER_JITTER_SECONDS", 10)
+# City jobs and their next run times are kept in the database ('apscheduler_jobs' table) across restarts
+SCHEDULER_PERSIST_JOBS = _env_bool("SCHEDULER_PERSIST_JOBS", True)
+# A run missed by more than this (e.g. while the server was down) is skipped, several missed runs are run only once
+SCHEDULER_MISFIRE_GRACE_SECONDS = _env_int("SCHEDULER_MISFIRE_GRACE_SECONDS", 60)
+
+# With several server workers (e.g. 'uvicorn --workers 4') only the worker holding the lease runs the scheduler.
+# The leader renews its lease every heartbeat, another worker takes over once the lease has expired.
+LEADER_ELECTION = _env_bool("LEADER_ELECTION", False)
+LEADER_LEASE_SECONDS = _env_float("LEADER_LEASE_SECONDS", 15.0)
+LEADER_HEARTBEAT_SECONDS = _env_float("LEADER_HEARTBEAT_SECONDS", 2.0)
+
+# Open-Meteo endpoints, e.g. a local stand-in for benchmarks
+WEATHER_API_URL = _env_str("WEATHER_API_URL", "https://api.open-meteo.com/v1/forecast")
+GEOCODE_API_URL = _env_str("GEOCODE_API_URL", "https://geocoding-api.open-meteo.com/v1/search")
+
+# Outbound calls to Open-Meteo: a token bucket shared by all calls (0 calls per second disables it, Open-Meteo's free
+# tier allows 10), and the longest a call waits for a token before it gives up.
+OUTBOUND_RATE_PER_SECOND = _env_float("OUTBOUND_RATE_PER_SECOND", 0.0)
+OUTBOUND_BURST = _env_int("OUTBOUND_BURST", 20)
+OUTBOUND_MAX_WAIT_SECONDS = _env_float("OUTBOUND_MAX_WAIT_SECONDS", 30.0)
+# Per-request timeouts, and retries of transient errors (connection errors, timeouts, 429 and 5xx) with
+# exponential backoff and full jitter: a random delay of up to BASE * 2^attempt seconds, at most MAX.
+OUTBOUND_CONNECT_TIMEOUT_SECONDS = _env_float("OUTBOUND_CONNECT_TIMEOUT_SECONDS", 5.0)
+OUTBOUND_READ_TIMEOUT_SECONDS = _env_float("OUTBOUND_READ_TIMEOUT_SECONDS", 10.0)
+OUTBOUND_RETRIES = _env_int("OUTBOUND_RETRIES", 2)
+OUTBOUND_BACKOFF_BASE_SECONDS = _env_float("OUTBOUND_BACKOFF_BASE_SECONDS", 0.5)
+OUTBOUND_BACKOFF_MAX_SECONDS = _env_float("OUTBOUND_BACKOFF_MAX_SECONDS", 10.0)
+# After this many transient failures in a row calls are not made for CIRCUIT_RESET_SECONDS, 0 disables the breaker
+CIRCUIT_FAILURE_THRESHOLD = _env_int("CIRCUIT_FAILURE_THRESHOLD", 5)
+CIRCUIT_RESET_SECONDS = _env_float("CIRCUIT_RESET_SECONDS", 30.0)
+
+# How scheduled weather jobs are executed:
+#   "sync":  every job fetches its own city on a scheduler thread (default)
+#   "batch": due jobs are queued and fetched together, many cities per request
+#   "async": jobs are handed to an asyncio fetch engine with a shared keep-alive HTTP client
+FETCH_MODE = _env_str("FETCH_MODE", "sync")
+
+# Open-Meteo's current weather only changes every 15 minutes. A city whose latest stored observation is from the
+# current slot is not fetched again, 0 always fetches.
+OBSERVATION_SLOT_SECONDS = _env_int("OBSERVATION_SLOT_SECONDS", 900)
+
+# A city that missed runs, because the scheduler was down or Open-Meteo was unavailable, fetches the hourly temperatures
+# since its latest observation (up to BACKFILL_MAX_HOURS hours) in the same request as the current weather. 0 disables it.
+BACKFILL_MAX_HOURS = _env_int("BACKFILL_MAX_HOURS", 72)
+# Cities with an interval of an hour or more are fetched every HOURLY_SERIES_HOURS hours instead, storing every hourly
+# temperature since their previous run, which cuts their calls to Open-Meteo by that factor. 0 fetches on the interval.
+HOURLY_SERIES_HOURS = _env_int("HOURLY_SERIES_HOURS", 0)
+
+# Cities whose coordinates round to the same grid cell of GRID_RESOLUTION_DEG degrees share one fetch per slot,
+# Open-Meteo answers them with the same model grid point. 0 fetches every city on its own, 0.01 (about 1 km) is recommended.
+# GRID_CACHE_SIZE is the number of cells whose current weather is kept for the other cities in the cell.
+GRID_RESOLUTION_DEG = _env_float("GRID_RESOLUTION_DEG", 0)
+GRID_CACHE_SIZE = _env_int("GRID_CACHE_SIZE", 10_000)
+
+# Batch mode: maximum number of cities per Open-Meteo request,
+# and how long (seconds) due jobs are collected before a batch is sent.
+BATCH_CHUNK_SIZE = _env_int("BATCH_CHUNK_SIZE", 100)
+BATCH_WINDOW_SECONDS = _env_float("BATCH_WINDOW_SECONDS", 30.0)
+
+# Async mode: connection pool size of the shared HTTP client, concurrent requests allowed per host,
+# and worker threads used for the database work of async fetches.
+ASYNC_MAX_CONNECTIONS = _env_int("ASYNC_MAX_CONNECTIONS", 100)
+ASYNC_MAX_PER_HOST = _env_int("ASYNC_MAX_PER_HOST", 50)
+ASYNC_DB_WORKERS = _env_int("ASYNC_DB_WORKERS", 4)
+
+# Threads geocoding the cities of a 'POST /jobs/bulk' request concurrently.
+BULK_GEOCODE_WORKERS = _env_int("BULK_GEOCODE_WORKERS", 8)
+
+# Geocoding cache: in-process LRU size, and how long (hours) found and not-found lookups are trusted.
+GEOCODE_CACHE_SIZE = _env_int("GEOCODE_CACHE_SIZE", 10_000)
+GEOCODE_CACHE_TTL_HOURS = _env_float("GEOCODE_CACHE_TTL_HOURS", 720.0)
+GEOCODE_NEGATIVE_TTL_HOURS = _env_float("GEOCODE_NEGATIVE_TTL_HOURS", 24.0)
+
+# Serialized '/jobs/' and '/job/{city_id}' responses kept in memory, 0 disables the cache.
+# The cache is per process, so it is not used with LEADER_ELECTION, where other workers can change jobs.
+RESPONSE_CACHE_SIZE = _env_int("RESPONSE_CACHE_SIZE", 1024)
+
+# Observations and log rows older than their retention (days) are moved out of the database into gzip'd NDJSON files
+# under ARCHIVE_DIR (default: data/archive), 0 keeps them in the database. The move runs every RETENTION_INTERVAL_HOURS
+# in transactions of RETENTION_BATCH_SIZE rows, pausing RETENTION_BATCH_PAUSE_MS between them for other writers.
+OBSERVATION_RETENTION_DAYS = _env_float("OBSERVATION_RETENTION_DAYS", 0.0)
+LOG_RETENTION_DAYS = _env_float("LOG_RETENTION_DAYS", 0.0)
+ARCHIVE_DIR = _env_str("ARCHIVE_DIR", "")
+RETENTION_INTERVAL_HOURS = _env_float("RETENTION_INTERVAL_HOURS", 24.0)
+RETENTION_BATCH_SIZE = _env_int("RETENTION_BATCH_SIZE", 1000)
+RETENTION_BATCH_PAUSE_MS = _env_int("RETENTION_BATCH_PAUSE_MS", 50)
+
+# Rows fetched and converted per chunk by the streaming '/reports/export' endpoint.
+EXPORT_CHUNK_SIZE = _env_int("EXPORT_CHUNK_SIZE", 1000)
+
+# Database log handler: rows per bulk insert, maximum seconds a row waits before it is written,
+# and the bounded queue in front of the writer. When the queue is full the "newest" or "oldest" row is dropped.
+LOG_BATCH_SIZE = _env_int("LOG_BATCH_SIZE", 500)
+LOG_FLUSH_INTERVAL_SECONDS = _env_float("LOG_FLUSH_INTERVAL_SECONDS", 1.0)
+LOG_QUEUE_SIZE = _env_int("LOG_QUEUE_SIZE", 10_000)
+LOG_DROP_POLICY = _env_str("LOG_DROP_POLICY", "newest")
+
+# Write-behind buffer for observations: when enabled, fetches queue observations and one writer thread
+# inserts them in bulk every OBSERVATION_BATCH_SIZE rows or OBSERVATION_FLUSH_INTERVAL_MS milliseconds.
+# Fetches wait when OBSERVATION_QUEUE_SIZE observations are already queued. A batch that fails to insert, e.g. while the
+# database is locked, is tried OBSERVATION_FLUSH_RETRIES more times before its observations are counted as failed.
+WRITE_BEHIND = _env_bool("WRITE_BEHIND", False)
+OBSERVATION_BATCH_SIZE = _env_int("OBSERVATION_BATCH_SIZE", 500)
+OBSERVATION_FLUSH_INTERVAL_MS = _env_int("OBSERVATION_FLUSH_INTERVAL_MS", 200)
+OBSERVATION_QUEUE_SIZE = _env_int("OBSERVATION_QUEUE_SIZE", 100_000)
+OBSERVATION_FLUSH_RETRIES = _env_int("OBSERVATION_FLUSH_RETRIES", 3)
@@ -5,25 +5,90 @@ from typing import Any
 from sqlalchemy import (
     Column,
     DateTime,
+    Engine,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
+    TypeDecorator,
     create_engine,
+    event,
     func,
     select,
 )
 from sqlalchemy.orm import Session, declarative_base, relationship, sessionmaker
 
+from . import config
+from .metrics import instrument_engine
+
 DB_DIR = Path(__file__).parent.parent / "data"
 DB_DIR.mkdir(exist_ok=True)
-FILE = DB_DIR / "weather_data.db"
+FILE = Path(config.DATABASE_FILE) if config.DATABASE_FILE else DB_DIR / "weather_data.db"
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{FILE}"
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT_MS)}")
+        # A negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size={-int(config.SQLITE_CACHE_SIZE_KB)}")
+        cursor.execute(f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}")
+    finally:
+        cursor.close()
+
+
+def create_db_engine(url: str, profile: str | None = None) -> Engine:
+    """
+    Creates a SQLite engine for the given profile (defaults to 'DB_PROFILE').
+
+    "default" is SQLAlchemy's stock engine. "production" shares connections across the API and scheduler threads,
+    sizes the pool for the scheduler's workers and applies the 'SQLITE_*' pragmas (WAL, synchronous, busy timeout,
+    cache and mmap size) to every new connection, so API readers and scheduler writers stop blocking each other.
+    """
+    profile = profile or config.DB_PROFILE
+
+    if profile != "production":
+        engine = create_engine(url)
+        instrument_engine(engine)
+        return engine
+
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_size=config.DB_POOL_SIZE or config.SCHEDULER_MAX_WORKERS + 5,
+        max_overflow=config.DB_MAX_OVERFLOW,
+    )
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+    instrument_engine(engine)
+    return engine
+
+
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+class ScaledFloat(TypeDecorator):
+    """Stores a float as an integer count of 1/scale units, e.g. 17.63 as 1763 with scale 100."""
+
+    impl = Integer
+    cache_ok = True
+
+    def __init__(self, scale: int):
+        super().__init__()
+        self.scale = scale
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else round(value * self.scale)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else value / self.scale
+
+
 class City(Base):
     __tablename__ = "cities"
 
@@ -41,10 +106,64 @@ class WeatherObservation(Base):
 
     id: int = Column(Integer, primary_key=True, index=True)
     city_id: int = Column(Integer, ForeignKey("cities.id"), index=True)
-    utc_iso_time: str = Column(String)
-    temperature_c: float = Column(Float)
+    # UTC time as integer epoch seconds: compact, range-scans as a number and needs no parsing on read
+    observed_at: int = Column(Integer)
+    # Celsius, stored as integer hundredths of a degree
+    temperature_c: float = Column(ScaledFloat(100))
     city = relationship("City", back_populates="weather_observations")
 
+    # One observation per city and time, refetched or re-run observations are not stored again.
+    # Also serves '/reports/' time-range and keyset-pagination queries, which filter by city and order by time.
+    __table_args__ = (Index("uq_weather_observations_city_id_observed_at", "city_id", "observed_at", unique=True),)
+
+
+# Observations in the old ISO-string schema, while 'copy_legacy_observations' copies them over in the background
+LEGACY_OBSERVATIONS = "weather_observations_legacy"
+
+
+# Per-city temperature aggregates for hourly, daily and monthly UTC buckets, kept up to date on every observation write.
+class WeatherRollup(Base):
+    __tablename__ = "weather_rollups"
+
+    city_id: int = Column(Integer, ForeignKey("cities.id"), primary_key=True)
+    period: str = Column(String, primary_key=True)
+    # UTC start of the bucket as epoch seconds
+    bucket_start: int = Column(Integer, primary_key=True)
+    count: int = Column(Integer)
+    sum_c: float = Column(Float)
+    min_c: float = Column(Float)
+    max_c: float = Column(Float)
+
+
+class GeocodeCacheEntry(Base):
+    __tablename__ = "geocode_cache"
+
+    name: str = Column(String, primary_key=True)
+    country_code: str = Column(String, primary_key=True)
+    # Both coordinates are NULL for a negative (not found) entry
+    latitude: float = Column(Float, nullable=True)
+    longitude: float = Column(Float, nullable=True)
+    cached_at: float = Column(Float)
+
+
+# Which process runs the scheduler when several server workers share the database, see 'api.leader'.
+class SchedulerLease(Base):
+    __tablename__ = "scheduler_lease"
+
+    name: str = Column(String, primary_key=True)
+    holder: str = Column(String)
+    # Epoch seconds, the lease is free for any process to take after this
+    expires_at: float = Column(Float)
+
+
+# Job changes made on any worker, applied to the schedule by the leader. 'interval_hours' is NULL for a removed job.
+class JobEvent(Base):
+    __tablename__ = "job_events"
+
+    id: int = Column(Integer, primary_key=True)
+    city_id: int = Column(Integer)
+    interval_hours: float = Column(Float, nullable=True)
+
 
 class Log(Base):
     __tablename__ = "logs"
@@ -57,6 +176,10 @@ class Log(Base):
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    # create_all() skips tables that already exist, so indexes added later are created here for existing databases
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 
 def get_db_gen() -> Generator[Session, Any, None]:
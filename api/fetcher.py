@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from collections.abc import Coroutine
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
+import httpx
+
+from . import config, outbound
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+# A single event loop runs in a background thread and owns the shared HTTP client.
+# Scheduler threads only hand coroutines over to it, so they are free again right away.
+_loop: asyncio.AbstractEventLoop | None = None
+_thread: threading.Thread | None = None
+_client: httpx.AsyncClient | None = None
+_host_limits: dict[str, asyncio.Semaphore] = {}
+_lock = threading.Lock()
+
+
+def start_fetcher() -> None:
+    global _loop, _thread
+
+    with _lock:
+        if _loop is not None:
+            return
+
+        _loop = asyncio.new_event_loop()
+        # Blocking work (database reads and writes) is moved off the loop onto this small pool
+        _loop.set_default_executor(ThreadPoolExecutor(max_workers=config.ASYNC_DB_WORKERS, thread_name_prefix="async-fetcher-db"))
+        _thread = threading.Thread(target=_loop.run_forever, name="async-fetcher", daemon=True)
+        _thread.start()
+
+    logger.info("Async fetch engine started")
+
+
+def stop_fetcher(timeout: float = 10.0) -> None:
+    global _loop, _thread
+
+    with _lock:
+        loop, thread = _loop, _thread
+        _loop, _thread = None, None
+
+    if loop is None:
+        return
+
+    try:
+        asyncio.run_coroutine_threadsafe(_close_client(), loop).result(timeout)
+        asyncio.run_coroutine_threadsafe(loop.shutdown_default_executor(), loop).result(timeout)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        loop.close()
+        _host_limits.clear()
+
+    logger.info("Async fetch engine stopped")
+
+
+def submit(coroutine: Coroutine[Any, Any, Any]) -> Future:
+    """Runs a coroutine on the fetch engine's event loop, starting the engine if needed."""
+    start_fetcher()
+    return asyncio.run_coroutine_threadsafe(coroutine, _loop)
+
+
+def get_client() -> httpx.AsyncClient:
+    """Returns the shared keep-alive client. Must be called from the fetch engine's event loop."""
+    global _client
+
+    if _client is None:
+        limits = httpx.Limits(
+            max_connections=config.ASYNC_MAX_CONNECTIONS,
+            max_keepalive_connections=config.ASYNC_MAX_CONNECTIONS,
+        )
+        _client = httpx.AsyncClient(limits=limits, timeout=outbound.httpx_timeout())
+
+    return _client
+
+
+def host_limit(host: str) -> asyncio.Semaphore:
+    """Returns the semaphore bounding concurrent requests to one host."""
+    if host not in _host_limits:
+        _host_limits[host] = asyncio.Semaphore(config.ASYNC_MAX_PER_HOST)
+    return _host_limits[host]
+
+
+async def _close_client() -> None:
+    global _client
+
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,150 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from collections.abc import Callable
+
+from sqlalchemy import delete, func, or_, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import config
+from .db import JobEvent, SchedulerLease, get_db, select
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class LeaderElection:
+    """
+    Elects one of several processes sharing the database as leader, through a lease row in 'scheduler_lease'.
+
+    Every process tries to take or renew the lease once per heartbeat. A lease is taken only when it is free or expired,
+    so at most one process holds it at a time, and when the leader dies another process takes over after
+    'LEADER_LEASE_SECONDS'. 'on_elected' and 'on_demoted' are called on the election thread when this process
+    gains or loses the lease, 'on_heartbeat' is called after every renewal while it is the leader.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        on_elected: Callable[[], None],
+        on_demoted: Callable[[], None],
+        on_heartbeat: Callable[[], None] | None = None,
+    ):
+        self.name = name
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+        self._on_heartbeat = on_heartbeat
+        self._expires_at = 0.0
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-election", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Steps down if this process is the leader and releases the lease, so another process can take over right away."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self.is_leader:
+            self._demote()
+            try:
+                self._release()
+            except SQLAlchemyError as e:
+                logger.error(f"Failed to release the '{self.name}' lease: '{str(e)}'")
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.critical(f"Error in the '{self.name}' election heartbeat: '{str(e)}'")
+            self._stop_event.wait(config.LEADER_HEARTBEAT_SECONDS)
+
+    def heartbeat(self) -> None:
+        """Takes or renews the lease and calls the callbacks for any change of leadership."""
+        try:
+            held = self._acquire()
+        except SQLAlchemyError as e:
+            logger.error(f"Failed to renew the '{self.name}' lease: '{str(e)}'")
+            # Still the leader until the lease it holds runs out
+            held = self.is_leader and time.time() < self._expires_at
+
+        if held and not self.is_leader:
+            logger.warning(f"'{self.holder}' is now the '{self.name}' leader")
+            self.is_leader = True
+            self._on_elected()
+        elif not held and self.is_leader:
+            logger.warning(f"'{self.holder}' lost the '{self.name}' lease")
+            self._demote()
+
+        if self.is_leader and self._on_heartbeat:
+            self._on_heartbeat()
+
+    def _demote(self) -> None:
+        self.is_leader = False
+        self._on_demoted()
+
+    def _acquire(self) -> bool:
+        now = time.time()
+        expires_at = now + config.LEADER_LEASE_SECONDS
+        db = get_db()
+        try:
+            db.execute(insert(SchedulerLease).values(name=self.name, holder="", expires_at=0.0).on_conflict_do_nothing())
+            stmt = (
+                update(SchedulerLease)
+                .where(SchedulerLease.name == self.name)
+                .where(or_(SchedulerLease.holder == self.holder, SchedulerLease.expires_at < now))
+                .values(holder=self.holder, expires_at=expires_at)
+            )
+            held = db.execute(stmt).rowcount == 1
+            db.commit()
+        finally:
+            db.close()
+
+        if held:
+            self._expires_at = expires_at
+        return held
+
+    def _release(self) -> None:
+        db = get_db()
+        try:
+            stmt = update(SchedulerLease).where(SchedulerLease.name == self.name, SchedulerLease.holder == self.holder)
+            db.execute(stmt.values(expires_at=0.0))
+            db.commit()
+        finally:
+            db.close()
+
+
+def publish_job_event(db, city_id: int, interval_hours: float | None) -> None:
+    """Records a job change for the leader, in the caller's transaction so it is published exactly when the change is committed."""
+    db.add(JobEvent(city_id=city_id, interval_hours=interval_hours))
+
+
+def take_job_events() -> dict[int, float | None]:
+    """
+    Removes the published job events and returns the latest interval per city, None for removed jobs.
+    """
+    db = get_db()
+    try:
+        last_id = db.execute(select(func.max(JobEvent.id))).scalar()
+        if last_id is None:
+            return {}
+
+        stmt = select(JobEvent.city_id, JobEvent.interval_hours).where(JobEvent.id <= last_id).order_by(JobEvent.id)
+        changes = {city_id: interval_hours for city_id, interval_hours in db.execute(stmt)}
+        # Events published after 'last_id' was read are left for the next heartbeat
+        db.execute(delete(JobEvent).where(JobEvent.id <= last_id))
+        db.commit()
+        return changes
+    finally:
+        db.close()
@@ -1,7 +1,12 @@
+import atexit
 import logging
 from datetime import datetime
 from pathlib import Path
 
+from sqlalchemy import insert
+
+from . import config
+from .batching import BatchWriter
 from .db import Log, get_db
 
 LOG_DIR = Path(__file__).parent.parent / "logs"
@@ -9,20 +14,29 @@ LOG_DIR.mkdir(exist_ok=True)
 LOG_FILE = LOG_DIR / "logs.txt"
 
 
+def _write_logs(rows: list[dict]) -> None:
+    try:
+        db = get_db()
+        db.execute(insert(Log), rows)
+        db.commit()
+    finally:
+        db.close()
+
+
 class DBHandler(logging.Handler):
     def emit(self, record):
         try:
-            db = get_db()
-            log_in_db = Log(timestamp=datetime.fromtimestamp(record.created), level=record.levelname, message=self.format(record))
-            db.add(log_in_db)
-            db.commit()
+            log_writer.put({"timestamp": datetime.fromtimestamp(record.created), "level": record.levelname, "message": self.format(record)})
         except Exception as e:
             print(f"Error logging to DB: {e}")
-        finally:
-            db.close()
 
 
-def get_logger(name: str) -> logging.Logger:
+def shutdown_logging() -> None:
+    """Flushes queued log rows to the database and stops the writer thread."""
+    log_writer.stop()
+
+
+def get_logger(name: str, to_db: bool = True) -> logging.Logger:
     logger = logging.getLogger(name)
     file_handler = logging.FileHandler(LOG_FILE)
     console_handler = logging.StreamHandler()
@@ -36,7 +50,22 @@ def get_logger(name: str) -> logging.Logger:
         console_handler.setFormatter(formatter)
         file_handler.setFormatter(formatter)
         logger.addHandler(console_handler)
-        logger.addHandler(db_handler)
+        if to_db:
+            logger.addHandler(db_handler)
         logger.addHandler(file_handler)
         logger.propagate = False
     return logger
+
+
+# Log rows are written in bulk by one background thread, so logging never waits on (or competes for) the SQLite writer lock.
+# Its own failures are not logged to the database, where they would queue up behind the rows that failed.
+log_writer = BatchWriter(
+    "db-log-writer",
+    _write_logs,
+    batch_size=config.LOG_BATCH_SIZE,
+    flush_interval=config.LOG_FLUSH_INTERVAL_SECONDS,
+    max_queue=config.LOG_QUEUE_SIZE,
+    drop_policy=config.LOG_DROP_POLICY,
+    logger=get_logger(f"{__name__}.writer", to_db=False),
+)
+atexit.register(log_writer.stop)
@@ -1,45 +1,168 @@
+import itertools
+import threading
+from collections.abc import Callable, Hashable
 from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 
 import requests
-from fastapi import Depends, FastAPI, HTTPException, Request, responses, status
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response, responses, status
+from pydantic import TypeAdapter
+from sqlalchemy import or_, tuple_
 from sqlalchemy.orm import Session
 
-from .db import City, WeatherObservation, get_db, get_db_gen, init_db, select
-from .logging import get_logger
+from . import config, outbound
+from .archive import archive_stats, iter_archived_observations, retention_enabled, run_retention
+from .cache import geocode_cache, response_cache
+from .columnar import columnar_available, columnar_query, stream_columnar
+from .db import City, WeatherObservation, WeatherRollup, get_db, get_db_gen, init_db, select
+from .fetcher import start_fetcher, stop_fetcher
+from .leader import LeaderElection, publish_job_event, take_job_events
+from .logging import get_logger, log_writer, shutdown_logging
+from .metrics import RequestMetricsMiddleware, render_metrics
+from .migrations import copy_legacy_observations, dedupe_observations, prepare_observation_migration
 from .models import *
-from .scheduler import add_job, remove_job, shutdown_scheduler, start_scheduler, update_job_interval
-from .utils import celsius_to_fahrenheit, convert_utc_iso_to_target_timezone
-from .weather import fetch_weather_job, get_coordinates
+from .scheduler import (
+    add_interval_job,
+    add_job,
+    expected_load,
+    reconcile_jobs,
+    remove_job,
+    shutdown_scheduler,
+    start_scheduler,
+    update_job_interval,
+)
+from .reports import convert_rows, iter_converted_rows, observations_query, stream_csv, stream_ndjson
+from .rollups import ensure_rollups
+from .utils import celsius_to_fahrenheit, convert_observations, decode_cursor, encode_cursor, to_epoch
+from .weather import (
+    batch_stats,
+    fetch_stats,
+    flush_weather_batch,
+    get_coordinates,
+    get_coordinates_many,
+    observation_writer,
+    run_weather_job,
+)
 
 logger = get_logger(__name__)
 
 ALREADY_EXISTS = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Job already exists")
 NOT_FOUND = HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
 OK = responses.JSONResponse({"status": "ok"}, status_code=status.HTTP_200_OK)
+CITY_LIST = TypeAdapter(list[CitySchema])
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # On startup do this
+    migrating = prepare_observation_migration()
+    dedupe_observations()
     init_db()
+    if migrating is not None:
+        # Old observations are copied in the background so the server can start serving right away
+        threading.Thread(
+            target=copy_legacy_observations, kwargs={"copied": migrating}, name="observation-migration", daemon=True
+        ).start()
     try:
         db = get_db()
-        jobs = db.execute(select(City)).scalars().all()
-        for job in jobs:
-            add_job(job.id, job.interval_hours, fetch_weather_job, job.id)
-        start_scheduler()
-        logger.warning("API server started and existing jobs are scheduled")
-
+        ensure_rollups(db)
     finally:
         db.close()
 
+    if config.FETCH_MODE == "async":
+        start_fetcher()
+    if config.LEADER_ELECTION:
+        # Only the worker holding the lease runs the scheduler, the others serve requests and publish job changes
+        app.state.leader = LeaderElection("scheduler", _start_scheduling, _stop_scheduling, _apply_job_events)
+        app.state.leader.start()
+    else:
+        _start_scheduling()
+    logger.warning("API server started, existing jobs are being scheduled")
+
     yield
     # On shutdown do this
-    shutdown_scheduler()
+    if config.LEADER_ELECTION:
+        app.state.leader.stop()
+    else:
+        _stop_scheduling()
+    stop_fetcher()
+    # Buffered observations are written before the process exits
+    observation_writer.stop()
     logger.warning("API server stopped, and scheduled jobs are shutdown")
+    shutdown_logging()
+
+
+def _cached_json(request: Request, key: Hashable, build: Callable[[], bytes]) -> Response:
+    """
+    Serves a JSON body from 'response_cache', building and caching it on a miss.
+
+    A request whose 'If-None-Match' matches the body's ETag gets a 304 without a body.
+    """
+    entry = response_cache.get(key) if response_cache.enabled else None
+
+    if entry is None:
+        # Read before the body is built, an invalidation in between keeps the body out of the cache
+        version = response_cache.version
+        entry = response_cache.set(key, build(), version)
+
+    body, etag = entry
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        response_cache.stats["not_modified"] += 1
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+
+def _start_scheduling():
+    if config.FETCH_MODE == "batch":
+        add_interval_job("weather_batch_flush", config.BATCH_WINDOW_SECONDS, flush_weather_batch)
+    if retention_enabled():
+        add_interval_job("retention", config.RETENTION_INTERVAL_HOURS * 3600, run_retention)
+    if config.LEADER_ELECTION:
+        # Changes published so far are already in 'cities', which the reconciler reads
+        take_job_events()
+    # Persisted jobs start running right away, the rest of the schedule is reconciled while requests are served
+    start_scheduler()
+    app.state.job_reconciler = threading.Thread(target=_reconcile_city_jobs, name="job-reconciler", daemon=True)
+    app.state.job_reconciler.start()
+
+
+def _stop_scheduling():
+    app.state.job_reconciler.join(timeout=10)
+    shutdown_scheduler()
+
+
+def _apply_job_events():
+    for city_id, interval_hours in take_job_events().items():
+        if interval_hours is None:
+            remove_job(city_id)
+        else:
+            update_job_interval(city_id, interval_hours, run_weather_job, city_id)
+
+
+def _publish_job_change(db: Session, city_id: int, interval_hours: float | None) -> None:
+    # With leader election the change is committed with the city, the leader applies it on its next heartbeat.
+    # Otherwise the endpoint changes this process's schedule once the city is committed.
+    if config.LEADER_ELECTION:
+        publish_job_event(db, city_id, interval_hours)
+
+
+def _reconcile_city_jobs():
+    db = get_db()
+    try:
+        # Plain (id, interval) rows, fetched in chunks, instead of every city as an ORM object
+        rows = db.execute(select(City.id, City.interval_hours).execution_options(yield_per=1000))
+        stats = reconcile_jobs(rows, run_weather_job)
+        logger.warning(f"Scheduled city jobs reconciled: {dict(stats)}")
+    except Exception as e:
+        logger.critical(f"Failed to reconcile scheduled city jobs: '{str(e)}'")
+    finally:
+        db.close()
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestMetricsMiddleware)
 
 
 @app.get("/")
@@ -47,6 +170,26 @@ def root():
     return OK
 
 
+@app.get("/stats/")
+def get_stats():
+    return {
+        "geocode_cache": geocode_cache.snapshot(),
+        "response_cache": response_cache.snapshot(),
+        "batch_fetch": dict(batch_stats),
+        "fetch": dict(fetch_stats),
+        "outbound": outbound.snapshot(),
+        "log_writer": log_writer.snapshot(),
+        "observation_writer": observation_writer.snapshot(),
+        "archive": dict(archive_stats),
+        "scheduler": {"leader_election": config.LEADER_ELECTION, "leader": app.state.leader.is_leader if config.LEADER_ELECTION else True},
+    }
+
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.post("/job/", response_model=CitySchema)
 def create_city_job(city: CityCreate, db: Session = Depends(get_db_gen)):
     try:
@@ -69,26 +212,98 @@ def create_city_job(city: CityCreate, db: Session = Depends(get_db_gen)):
             interval_hours=city.interval_hours,
         )
         db.add(city_in_db)
+        db.flush()
+        _publish_job_change(db, city_in_db.id, city_in_db.interval_hours)
         db.commit()
         db.refresh(city_in_db)
-        add_job(city_in_db.id, city_in_db.interval_hours, fetch_weather_job, city_in_db.id)
+        response_cache.invalidate(("jobs",), ("job", city_in_db.id))
+        if not config.LEADER_ELECTION:
+            add_job(city_in_db.id, city_in_db.interval_hours, run_weather_job, city_in_db.id)
 
         return city_in_db
 
+    except outbound.UpstreamUnavailable as e:
+        logger.warning(f"Status code: 503 - Detail: '{e}'")
+        return responses.JSONResponse({"detail": "Geocoding is unavailable, try again later"}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+
     except requests.RequestException as e:
         logger.critical(f"Status code: 500 - Detail: '{e}'")
         return responses.JSONResponse({"detail": "Internal Server Error"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@app.post("/jobs/bulk", response_model=list[CityBulkResultSchema])
+def create_city_jobs(bulk: CityBulkCreate, db: Session = Depends(get_db_gen)):
+    results = [CityBulkResultSchema(name=city.name, country_code=city.country_code, status="created") for city in bulk.cities]
+
+    # The first occurrence of a city in the request is the one that counts
+    first_index: dict[tuple[str, str], int] = {}
+    for index, city in enumerate(bulk.cities):
+        if (city.name, city.country_code) in first_index:
+            results[index].status = "duplicate"
+        else:
+            first_index[(city.name, city.country_code)] = index
+
+    # Cities that already have a job, in one query
+    stmt = select(City.id, City.name, City.country_code).where(tuple_(City.name, City.country_code).in_(list(first_index)))
+    for city_id, name, country_code in db.execute(stmt):
+        index = first_index.pop((name, country_code), None)
+        if index is not None:
+            results[index].status = "exists"
+            results[index].id = city_id
+
+    new_cities: list[tuple[int, City]] = []
+    for (name, country_code), coordinates in zip(first_index, get_coordinates_many(list(first_index))):
+        index = first_index[(name, country_code)]
+
+        if isinstance(coordinates, requests.RequestException):
+            logger.error(f"Error geocoding '{name}, {country_code}': '{coordinates}'")
+            results[index].status = "error"
+            continue
+
+        if not coordinates:
+            results[index].status = "not_found"
+            continue
+
+        city = City(
+            name=name,
+            country_code=country_code,
+            latitude=coordinates[0],
+            longitude=coordinates[1],
+            interval_hours=bulk.cities[index].interval_hours,
+        )
+        new_cities.append((index, city))
+
+    # All new cities in one transaction
+    db.add_all(city for _, city in new_cities)
+    db.flush()
+    for index, city in new_cities:
+        results[index].id = city.id
+        _publish_job_change(db, city.id, city.interval_hours)
+    db.commit()
+
+    if new_cities:
+        response_cache.invalidate(("jobs",), *(("job", city.id) for _, city in new_cities))
+    if not config.LEADER_ELECTION:
+        # Each job gets its own offset within its interval, see 'api.scheduler.job_phase'
+        for _, city in new_cities:
+            add_job(city.id, city.interval_hours, run_weather_job, city.id)
+
+    logger.warning(f"Bulk created {len(new_cities)} of {len(bulk.cities)} city job(s)")
+    return results
+
+
 @app.get("/job/{city_id}", response_model=CitySchema)
-def get_city_job(city_id: int, db: Session = Depends(get_db_gen)):
-    stmt = select(City).where(City.id == city_id)
-    city_job = db.execute(stmt).scalar()
+def get_city_job(city_id: int, request: Request, db: Session = Depends(get_db_gen)):
+    def build() -> bytes:
+        stmt = select(City).where(City.id == city_id)
+        city_job = db.execute(stmt).scalar()
 
-    if not city_job:
-        raise NOT_FOUND
+        if not city_job:
+            raise NOT_FOUND
 
-    return city_job
+        return CitySchema.model_validate(city_job, from_attributes=True).model_dump_json().encode()
+
+    return _cached_json(request, ("job", city_id), build)
 
 
 @app.put("/job/{city_id}", response_model=CitySchema)
@@ -100,9 +315,12 @@ def update_city_job(city_id: int, update: UpdateJobInterval, db: Session = Depen
         raise NOT_FOUND
 
     city_job.interval_hours = update.interval_hours
+    _publish_job_change(db, city_job.id, update.interval_hours)
     db.commit()
     db.refresh(city_job)
-    update_job_interval(city_job.id, update.interval_hours, fetch_weather_job, city_job.id)
+    response_cache.invalidate(("jobs",), ("job", city_id))
+    if not config.LEADER_ELECTION:
+        update_job_interval(city_job.id, update.interval_hours, run_weather_job, city_job.id)
 
     return city_job
 
@@ -115,49 +333,195 @@ def delete_city_job(city_id: int, db: Session = Depends(get_db_gen)):
         raise NOT_FOUND
 
     db.delete(city)
+    _publish_job_change(db, city_id, None)
     db.commit()
-    remove_job(city_id)
+    response_cache.invalidate(("jobs",), ("job", city_id))
+    if not config.LEADER_ELECTION:
+        remove_job(city_id)
     return responses.JSONResponse({"status": f"City ID '{city_id}' deleted"}, status_code=status.HTTP_200_OK)
 
 
 @app.get("/jobs/", response_model=list[CitySchema])
-def get_city_jobs(db: Session = Depends(get_db_gen)):
-    city_jobs = db.execute(select(City)).scalars().all()
-    return city_jobs
+def get_city_jobs(request: Request, db: Session = Depends(get_db_gen)):
+    def build() -> bytes:
+        city_jobs = db.execute(select(City)).scalars().all()
+        return CITY_LIST.dump_json(CITY_LIST.validate_python(city_jobs, from_attributes=True))
+
+    return _cached_json(request, ("jobs",), build)
+
+
+@app.get("/jobs/load", response_model=ScheduleLoadSchema)
+def get_schedule_load(seconds: int = Query(default=7200, ge=1, le=86400), db: Session = Depends(get_db_gen)):
+    # Computed from the per-city offsets, so it shows how evenly jobs are spread whether or not they are running
+    jobs = db.execute(select(City.id, City.interval_hours)).all()
+    start = datetime.now(timezone.utc).replace(microsecond=0)
+    load = expected_load(jobs, start.timestamp(), seconds)
+
+    return ScheduleLoadSchema(
+        start=start,
+        jobs=len(jobs),
+        jitter_seconds=config.SCHEDULER_JITTER_SECONDS,
+        peak=max(load),
+        mean=sum(load) / seconds,
+        load=load,
+    )
 
 
 @app.post("/reports/", response_model=list[WeatherObservationRequestSchema])
-def get_city_temperatures(request_weather_observation: WeatherObservationRequest, db: Session = Depends(get_db_gen)):
-    stmt = select(WeatherObservation).where(WeatherObservation.city_id == request_weather_observation.city_id)
-    existing_weather_observations_in_db = db.execute(stmt).scalars().all()
+def get_city_temperatures(request_weather_observation: WeatherObservationRequest, response: Response, db: Session = Depends(get_db_gen)):
+    stmt = observations_query(
+        request_weather_observation.city_id,
+        request_weather_observation.start,
+        request_weather_observation.end,
+    )
+
+    if request_weather_observation.cursor:
+        # Keyset pagination: continue after the last (time, id) of the previous page
+        last_time, last_id = decode_cursor(request_weather_observation.cursor)
+        stmt = stmt.where(
+            WeatherObservation.observed_at >= last_time,
+            or_(WeatherObservation.observed_at > last_time, WeatherObservation.id > last_id),
+        )
+
+    if request_weather_observation.limit:
+        # One extra row tells whether another page follows
+        stmt = stmt.limit(request_weather_observation.limit + 1)
+
+    existing_weather_observations_in_db = db.execute(stmt).all()
 
     if not existing_weather_observations_in_db:
         raise NOT_FOUND
 
-    results = []
-    for weather_observation in existing_weather_observations_in_db:
-        temperature = weather_observation.temperature_c
+    if request_weather_observation.limit and len(existing_weather_observations_in_db) > request_weather_observation.limit:
+        existing_weather_observations_in_db = existing_weather_observations_in_db[: request_weather_observation.limit]
+        last = existing_weather_observations_in_db[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.observed_at, last.id)
+
+    timestamps, temperatures = convert_observations(
+        [weather_observation.observed_at for weather_observation in existing_weather_observations_in_db],
+        [weather_observation.temperature_c for weather_observation in existing_weather_observations_in_db],
+        request_weather_observation.temperature_unit,
+        request_weather_observation.timezone,
+    )
+
+    results = [
+        {
+            "id": weather_observation.id,
+            "city_id": request_weather_observation.city_id,
+            "temperature_unit": request_weather_observation.temperature_unit,
+            "temperature": temperature,
+            "timezone": request_weather_observation.timezone,
+            "timestamp": timestamp,
+        }
+        for weather_observation, timestamp, temperature in zip(existing_weather_observations_in_db, timestamps, temperatures)
+    ]
 
-        if request_weather_observation.temperature_unit != "C":
-            temperature = celsius_to_fahrenheit(temperature)
+    return results
 
-        timestamp = convert_utc_iso_to_target_timezone(
-            weather_observation.utc_iso_time,
-            request_weather_observation.timezone,
-        )
 
-        results.append(
-            {
-                "id": weather_observation.id,
-                "city_id": request_weather_observation.city_id,
-                "temperature_unit": request_weather_observation.temperature_unit,
-                "temperature": temperature,
-                "timezone": request_weather_observation.timezone,
-                "timestamp": timestamp,
-            }
-        )
+def _export_response(export_request: WeatherObservationExportRequest, chunks, name: str) -> responses.StreamingResponse:
+    stream = stream_csv if export_request.format == "csv" else stream_ndjson
+    media_type = "text/csv" if export_request.format == "csv" else "application/x-ndjson"
+    filename = f"city_{export_request.city_id}_{name}.{export_request.format}"
 
-    return results
+    return responses.StreamingResponse(
+        stream(chunks),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.post("/reports/export")
+def export_city_temperatures(export_request: WeatherObservationExportRequest, db: Session = Depends(get_db_gen)):
+    stmt = observations_query(export_request.city_id, export_request.start, export_request.end)
+
+    if not db.execute(stmt.limit(1)).first():
+        raise NOT_FOUND
+
+    chunks = iter_converted_rows(stmt, export_request.city_id, export_request.temperature_unit, export_request.timezone)
+    return _export_response(export_request, chunks, "observations")
+
+
+@app.post("/reports/archive")
+def export_archived_temperatures(export_request: WeatherObservationExportRequest):
+    start = to_epoch(export_request.start) if export_request.start else None
+    end = to_epoch(export_request.end) if export_request.end else None
+    archived = iter_archived_observations(export_request.city_id, start, end)
+
+    first = next(archived, None)
+    if first is None:
+        raise NOT_FOUND
+
+    def chunks():
+        # The first month was read to check that there is anything archived
+        for rows in itertools.chain([first], archived):
+            yield convert_rows(rows, export_request.city_id, export_request.temperature_unit, export_request.timezone)
+
+    return _export_response(export_request, chunks(), "archive")
+
+
+@app.post("/reports/columnar")
+def export_columnar_temperatures(columnar_request: WeatherObservationColumnarRequest, db: Session = Depends(get_db_gen)):
+    if not columnar_available():
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="Columnar exports need pyarrow ('analytics' extra)")
+
+    stmt = columnar_query(columnar_request.city_ids, columnar_request.start, columnar_request.end)
+
+    if not db.execute(stmt.limit(1)).first():
+        raise NOT_FOUND
+
+    parquet = columnar_request.format == "parquet"
+    media_type = "application/vnd.apache.parquet" if parquet else "application/vnd.apache.arrow.stream"
+    filename = "observations.parquet" if parquet else "observations.arrows"
+
+    return responses.StreamingResponse(
+        stream_columnar(stmt, columnar_request.temperature_unit, columnar_request.timezone, columnar_request.format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.post("/aggregates/", response_model=list[WeatherAggregateSchema])
+def get_city_aggregates(aggregate_request: WeatherAggregateRequest, db: Session = Depends(get_db_gen)):
+    stmt = (
+        select(WeatherRollup)
+        .where(WeatherRollup.city_id == aggregate_request.city_id, WeatherRollup.period == aggregate_request.period)
+        .order_by(WeatherRollup.bucket_start)
+    )
+
+    if aggregate_request.start:
+        stmt = stmt.where(WeatherRollup.bucket_start >= to_epoch(aggregate_request.start))
+
+    if aggregate_request.end:
+        stmt = stmt.where(WeatherRollup.bucket_start < to_epoch(aggregate_request.end))
+
+    rollups = db.execute(stmt).scalars().all()
+
+    if not rollups:
+        raise NOT_FOUND
+
+    bucket_starts, means = convert_observations(
+        [rollup.bucket_start for rollup in rollups],
+        [round(rollup.sum_c / rollup.count, 2) for rollup in rollups],
+        aggregate_request.temperature_unit,
+        aggregate_request.timezone,
+    )
+    to_unit = celsius_to_fahrenheit if aggregate_request.temperature_unit == "F" else (lambda celsius: celsius)
+
+    return [
+        {
+            "city_id": aggregate_request.city_id,
+            "temperature_unit": aggregate_request.temperature_unit,
+            "timezone": aggregate_request.timezone,
+            "period": aggregate_request.period,
+            "bucket_start": bucket_start,
+            "count": rollup.count,
+            "min": to_unit(rollup.min_c),
+            "max": to_unit(rollup.max_c),
+            "mean": mean,
+        }
+        for rollup, bucket_start, mean in zip(rollups, bucket_starts, means)
+    ]
 
 
 @app.exception_handler(status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,236 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections.abc import Callable, Sequence
+from concurrent.futures import Future
+
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED, JobEvent
+from sqlalchemy import Engine, event
+
+from . import config
+
+# Seconds, from a fast SQLite commit to a slow upstream call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: list["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Sequence[str], labels: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(ABC):
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}", *self._samples()]
+
+    @abstractmethod
+    def _samples(self) -> list[str]: ...
+
+
+class MetricCounter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in values]
+
+
+class Histogram(_Metric):
+    """Counts observations per bucket, rendered as Prometheus' cumulative '_bucket', '_sum' and '_count' series."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # Per label values: a count per bucket plus one for +Inf, and the sum
+        self._values: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(labels) or self._values.setdefault(labels, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = [(labels, list(counts), total[0]) for labels, (counts, total) in self._values.items()]
+
+        lines = []
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, f'le="{bound}"')} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """A value read from 'function' when the metrics are rendered."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, function: Callable[[], float]):
+        super().__init__(name, help)
+        self._function = function
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name} {self._function()}"]
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+upstream_seconds = Histogram("weather_upstream_request_seconds", "Open-Meteo call latency.", ["endpoint"])
+commit_seconds = Histogram("weather_db_commit_seconds", "SQLite commit latency.")
+request_seconds = Histogram("weather_http_request_seconds", "API request latency.", ["method", "route"])
+job_results = MetricCounter("weather_scheduler_jobs_total", "Scheduled job runs by result.", ["result"])
+
+# Returned by a job that did not run its fetch because Open-Meteo was unavailable, counted apart from successes and errors
+JOB_DEFERRED = "deferred"
+
+# Jobs handed to the scheduler's thread pool that have not finished, running or waiting for a thread
+_jobs_in_flight = 0
+# Fetches handed over to the async fetch engine by a finished job, that have not finished themselves
+_async_in_flight = 0
+_jobs_lock = threading.Lock()
+
+Gauge("weather_scheduler_jobs_in_flight", "Jobs submitted to the scheduler's thread pool that have not finished.", lambda: _jobs_in_flight)
+Gauge("weather_async_fetches_in_flight", "Fetches handed to the async fetch engine that have not finished.", lambda: _async_in_flight)
+Gauge(
+    "weather_scheduler_queue_depth",
+    "Jobs waiting for a free scheduler thread.",
+    lambda: max(0, _jobs_in_flight - config.SCHEDULER_MAX_WORKERS),
+)
+Gauge(
+    "weather_scheduler_pool_saturation",
+    "Share of scheduler threads running a job, 1 when all are busy.",
+    lambda: min(_jobs_in_flight, config.SCHEDULER_MAX_WORKERS) / config.SCHEDULER_MAX_WORKERS,
+)
+
+SCHEDULER_EVENTS = EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED
+
+
+def _job_result(retval) -> str:
+    if retval is False:
+        return "error"
+    if retval == JOB_DEFERRED:
+        return JOB_DEFERRED
+    return "success"
+
+
+def _async_fetch_done(future: Future) -> None:
+    global _async_in_flight
+
+    with _jobs_lock:
+        _async_in_flight = max(0, _async_in_flight - 1)
+
+    if future.cancelled() or future.exception() is not None:
+        job_results.inc("error")
+    else:
+        job_results.inc(_job_result(future.result()))
+
+
+def on_job_event(job_event: JobEvent) -> None:
+    """
+    APScheduler listener for 'SCHEDULER_EVENTS'.
+
+    A job that returns False, like a failed fetch, counts as an error and one that returns 'JOB_DEFERRED' as deferred.
+    A job that returns a future, like an async fetch, is counted by the future's result once it is done.
+    """
+    global _jobs_in_flight, _async_in_flight
+
+    if job_event.code == EVENT_JOB_SUBMITTED:
+        with _jobs_lock:
+            _jobs_in_flight += 1
+        return
+
+    if job_event.code == EVENT_JOB_MISSED:
+        job_results.inc("misfire")
+        return
+
+    with _jobs_lock:
+        _jobs_in_flight = max(0, _jobs_in_flight - 1)
+
+    if job_event.code == EVENT_JOB_ERROR:
+        job_results.inc("error")
+    elif isinstance(job_event.retval, Future):
+        with _jobs_lock:
+            _async_in_flight += 1
+        # Runs right away if the future is already done
+        job_event.retval.add_done_callback(_async_fetch_done)
+    else:
+        job_results.inc(_job_result(job_event.retval))
+
+
+def _commit_started(connection) -> None:
+    connection.info["commit_started"] = time.perf_counter()
+
+
+def _connection_checked_in(dbapi_connection, connection_record) -> None:
+    # The commit has finished when its connection is back in the pool. The commit event shares 'info' with the record.
+    started = connection_record.info.pop("commit_started", None) if connection_record is not None else None
+    if started is not None:
+        commit_seconds.observe(time.perf_counter() - started)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Times the commits of 'engine', from the commit to the return of its connection to the pool."""
+    event.listen(engine, "commit", _commit_started)
+    event.listen(engine.pool, "checkin", _connection_checked_in)
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware timing every request by its route template, e.g. '/job/{city_id}', until its body is sent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = scope.get("route")
+            request_seconds.observe(time.perf_counter() - start, scope["method"], route.path if route else "unmatched")
@@ -0,0 +1,149 @@
+from sqlalchemy import Engine, inspect, text
+from sqlalchemy.orm import Session
+
+from . import db
+from .db import LEGACY_OBSERVATIONS, Base, WeatherRollup
+from .logging import get_logger
+from .rollups import rebuild_rollups
+
+logger = get_logger(__name__)
+
+# Non-unique index replaced by 'uq_weather_observations_city_id_observed_at'
+_OBSERVATIONS_TIME_INDEX = "ix_weather_observations_city_id_observed_at"
+
+# Converts a legacy row: ISO-formatted UTC string to epoch seconds, celsius float to integer hundredths.
+# Batches, and the rows within them, are copied newest first, so of several rows with the same city and time the
+# newest (highest id) is kept, like in 'dedupe_observations'.
+_COPY_LEGACY_BATCH = text(
+    f"""
+    INSERT OR IGNORE INTO weather_observations (id, city_id, observed_at, temperature_c)
+    SELECT id, city_id, CAST(strftime('%s', utc_iso_time) AS INTEGER), CAST(ROUND(temperature_c * 100) AS INTEGER)
+    FROM {LEGACY_OBSERVATIONS}
+    WHERE id IN (SELECT id FROM {LEGACY_OBSERVATIONS} ORDER BY id DESC LIMIT :batch_size)
+    ORDER BY id DESC
+    """
+)
+_DELETE_LEGACY_BATCH = text(
+    f"DELETE FROM {LEGACY_OBSERVATIONS} WHERE id IN (SELECT id FROM {LEGACY_OBSERVATIONS} ORDER BY id DESC LIMIT :batch_size)"
+)
+
+
+def prepare_observation_migration(engine: Engine | None = None) -> int | None:
+    """
+    Switches a database with ISO-string observation times over to the epoch-seconds schema.
+
+    The old table is renamed and an empty table with the new schema takes its place, so the app can start right away.
+    Only the newest legacy row is copied here, which makes new observations get ids above every legacy id.
+    The remaining rows are copied by 'copy_legacy_observations' while the app is running.
+    Must run before 'init_db'.
+
+    Returns:
+        int | None: The number of legacy rows copied here if more are waiting for 'copy_legacy_observations',
+        otherwise None.
+    """
+    engine = engine or db.engine
+    inspector = inspect(engine)
+
+    if inspector.has_table("weather_observations"):
+        columns = {column["name"] for column in inspector.get_columns("weather_observations")}
+
+        if "utc_iso_time" in columns:
+            logger.warning("Migrating 'weather_observations' to epoch-second timestamps")
+            # Indexes move with the renamed table, they are dropped so the new table can use their names
+            indexes = [index["name"] for index in inspector.get_indexes("weather_observations")]
+            with engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE weather_observations RENAME TO {LEGACY_OBSERVATIONS}"))
+                for index in indexes:
+                    connection.execute(text(f'DROP INDEX IF EXISTS "{index}"'))
+
+    if inspector.has_table("weather_rollups"):
+        bucket_start = next(column for column in inspector.get_columns("weather_rollups") if column["name"] == "bucket_start")
+
+        if str(bucket_start["type"]) != "INTEGER":
+            # Rollups are derived data, they are rebuilt from the observations
+            WeatherRollup.__table__.drop(bind=engine)
+
+    if not inspect(engine).has_table(LEGACY_OBSERVATIONS):
+        return None
+
+    Base.metadata.create_all(bind=engine)
+    copied = copy_legacy_observations(engine, batch_size=1, max_batches=1)
+    # A single legacy row is already copied, and its table dropped
+    return copied if inspect(engine).has_table(LEGACY_OBSERVATIONS) else None
+
+
+def dedupe_observations(engine: Engine | None = None) -> int:
+    """
+    Removes duplicate observations (same city and time, the newest one is kept) so the unique index can be created.
+
+    Only runs on databases that still have the old non-unique index, which it drops. Must run before 'init_db'.
+
+    Returns:
+        int: The number of observations removed.
+    """
+    engine = engine or db.engine
+    inspector = inspect(engine)
+
+    if not inspector.has_table("weather_observations"):
+        return 0
+    if _OBSERVATIONS_TIME_INDEX not in {index["name"] for index in inspector.get_indexes("weather_observations")}:
+        return 0
+
+    with engine.begin() as connection:
+        removed = connection.execute(
+            text(
+                "DELETE FROM weather_observations WHERE id NOT IN "
+                "(SELECT MAX(id) FROM weather_observations GROUP BY city_id, observed_at)"
+            )
+        ).rowcount
+        connection.execute(text(f"DROP INDEX {_OBSERVATIONS_TIME_INDEX}"))
+
+    if removed:
+        with Session(engine) as session:
+            rebuild_rollups(session)
+    logger.warning(f"Removed {removed} duplicate observation(s)")
+    return removed
+
+
+def copy_legacy_observations(
+    engine: Engine | None = None, batch_size: int = 5000, max_batches: int | None = None, copied: int = 0
+) -> int:
+    """
+    Copies legacy observations into the current table, newest first, in small transactions.
+
+    Each batch is copied and deleted from the legacy table in one transaction, so the copy can be interrupted and
+    resumed at any point. Rows whose city and time are already stored are skipped, so the copy stops once the legacy
+    table is empty rather than on a short copy. The emptied legacy table is dropped and the rollups are rebuilt.
+
+    Args:
+        copied (int): Rows already copied by an earlier call, such as 'prepare_observation_migration', counted in the total.
+
+    Returns:
+        int: The number of rows copied, 'copied' included.
+    """
+    engine = engine or db.engine
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        with engine.begin() as connection:
+            copied += connection.execute(_COPY_LEGACY_BATCH, {"batch_size": batch_size}).rowcount
+            deleted = connection.execute(_DELETE_LEGACY_BATCH, {"batch_size": batch_size}).rowcount
+
+        batches += 1
+
+        if deleted < batch_size:
+            break
+
+    if not _has_legacy_rows(engine):
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {LEGACY_OBSERVATIONS}"))
+        with Session(engine) as session:
+            rebuild_rollups(session)
+        logger.warning(f"Migrated {copied} observation(s) to epoch-second timestamps")
+
+    return copied
+
+
+def _has_legacy_rows(engine: Engine) -> bool:
+    with engine.connect() as connection:
+        return connection.execute(text(f"SELECT 1 FROM {LEGACY_OBSERVATIONS} LIMIT 1")).first() is not None
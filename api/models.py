@@ -1,9 +1,10 @@
 from datetime import datetime
-from typing import Annotated
-from zoneinfo import available_timezones
+from typing import Annotated, Literal
 
 from pydantic import BaseModel, Field, StringConstraints, field_validator
 
+from .utils import decode_cursor, valid_timezones
+
 
 # Schema used to validate incoming city creation requests from clients.
 class CityBase(BaseModel):
@@ -24,14 +25,27 @@ class CitySchema(CityBase):
     longitude: float
 
 
+# Schema used to validate bulk job creation requests, every city is created (or not) on its own.
+class CityBulkCreate(BaseModel):
+    cities: list[CityCreate] = Field(min_length=1, max_length=5000)
+
+
+# Result for one city of a bulk job creation request, in request order.
+# 'id' is set for created jobs and for cities that already had a job.
+class CityBulkResultSchema(BaseModel):
+    name: str
+    country_code: str
+    status: Literal["created", "exists", "duplicate", "not_found", "error"]
+    id: int | None = None
+
+
 # Schema for updating only the job interval
 class UpdateJobInterval(BaseModel):
     interval_hours: float = Field(ge=0.25, le=2.0)
 
 
-# Schema used to validate incoming weather report requests from clients.
-class WeatherObservationRequest(BaseModel):
-    city_id: int
+# Unit and timezone options shared by weather report requests and responses.
+class WeatherObservationOptions(BaseModel):
     temperature_unit: Annotated[
         str,
         StringConstraints(pattern="^([Cc]|[Ff])$", to_upper=True),
@@ -42,14 +56,77 @@ class WeatherObservationRequest(BaseModel):
     @field_validator("timezone")
     @classmethod
     def validate_timezone(cls, timezone: str) -> str:
-        if timezone not in available_timezones():
+        if timezone not in valid_timezones():
             raise ValueError(f"'{timezone}' is not a valid IANA timezone.")
         return timezone
 
 
+class WeatherObservationBase(WeatherObservationOptions):
+    city_id: int
+
+
+# Time range shared by weather report and export requests.
+class WeatherObservationRange(WeatherObservationBase):
+    start: datetime | None = Field(default=None, description="Only observations at or after this time (UTC if naive)")
+    end: datetime | None = Field(default=None, description="Only observations before this time (UTC if naive)")
+
+
+# Schema used to validate incoming weather report requests from clients.
+# 'cursor' is the opaque 'X-Next-Cursor' header value of the previous page.
+class WeatherObservationRequest(WeatherObservationRange):
+    limit: int | None = Field(default=None, ge=1, le=10_000, description="Maximum number of observations to return")
+    cursor: str | None = Field(default=None, description="Continue after the last observation of a previous page")
+
+    @field_validator("cursor")
+    @classmethod
+    def validate_cursor(cls, cursor: str | None) -> str | None:
+        if cursor is not None:
+            decode_cursor(cursor)
+        return cursor
+
+
+# Schema used to validate incoming bulk export requests from clients.
+class WeatherObservationExportRequest(WeatherObservationRange):
+    format: Literal["ndjson", "csv"] = Field(default="ndjson", description="Newline-delimited JSON or CSV")
+
+
+# Schema used to validate incoming columnar export requests, for several cities at once.
+class WeatherObservationColumnarRequest(WeatherObservationOptions):
+    city_ids: list[int] = Field(min_length=1, max_length=1000)
+    start: datetime | None = Field(default=None, description="Only observations at or after this time (UTC if naive)")
+    end: datetime | None = Field(default=None, description="Only observations before this time (UTC if naive)")
+    format: Literal["arrow", "parquet"] = Field(default="arrow", description="Arrow IPC stream or Parquet file")
+
+
 # Schema returned to clients.
 # 'id' is assigned by the database. Used for documentation in /docs endpoint
-class WeatherObservationRequestSchema(WeatherObservationRequest):
+class WeatherObservationRequestSchema(WeatherObservationBase):
     id: int
     timestamp: datetime
     temperature: float
+
+
+# Schema used to validate incoming aggregate requests from clients.
+# Buckets are UTC hours, days or months, 'timezone' only changes how 'bucket_start' is shown.
+class WeatherAggregateRequest(WeatherObservationRange):
+    period: Literal["hour", "day", "month"] = Field(default="day", description="Bucket size")
+
+
+# Schema returned to clients for one aggregate bucket.
+class WeatherAggregateSchema(WeatherObservationBase):
+    period: str
+    bucket_start: datetime
+    count: int
+    min: float
+    max: float
+    mean: float
+
+
+# Schema returned to clients for the expected scheduler load, one count of due jobs per second from 'start'.
+class ScheduleLoadSchema(BaseModel):
+    start: datetime
+    jobs: int
+    jitter_seconds: int
+    peak: int
+    mean: float
+    load: list[int]
@@ -0,0 +1,178 @@
+import random
+import threading
+import time
+from collections import Counter
+
+import httpx
+import requests
+
+from . import config
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+# 'retries': attempts repeated after a transient error, 'rate_limited': calls that waited for a token,
+# 'rejected': calls that would have waited longer than 'OUTBOUND_MAX_WAIT_SECONDS', 'short_circuited': calls refused
+# while the circuit was open, 'circuit_opened': times the circuit opened
+outbound_stats: Counter[str] = Counter()
+
+
+class UpstreamUnavailable(requests.RequestException):
+    """Raised instead of calling Open-Meteo, when the circuit is open or no rate limit token is available in time."""
+
+
+class TokenBucket:
+    """
+    Rate limit shared by every outbound call: 'rate' calls per second on average, with bursts of up to 'burst' calls.
+
+    A caller reserves the next token and then waits for it outside the lock, so sync and async callers share the bucket.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> float:
+        """Takes a token and returns the seconds to wait for it. Raises 'UpstreamUnavailable' if that is over 'max_wait'."""
+        if self.rate <= 0:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # A negative balance is the queue of callers already waiting for a token
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                outbound_stats["rejected"] += 1
+                raise UpstreamUnavailable(f"Outbound rate limit, no token within {max_wait} second(s)")
+            self._tokens -= 1
+
+        if wait:
+            outbound_stats["rate_limited"] += 1
+        return wait
+
+
+class CircuitBreaker:
+    """
+    Stops calling Open-Meteo during an outage.
+
+    After 'failure_threshold' transient failures in a row the circuit opens and calls fail right away for
+    'reset_seconds'. Then one trial call is let through: its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: float | None = None
+        # When the trial call was let through, a trial that never reports back is replaced after 'reset_seconds'
+        self._trial_at: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> None:
+        if self.failure_threshold <= 0:
+            return
+
+        with self._lock:
+            if self._opened_at is None:
+                return
+            now = time.monotonic()
+            if now - self._opened_at >= self.reset_seconds and (self._trial_at is None or now - self._trial_at >= self.reset_seconds):
+                self._trial_at = now
+                return
+
+        outbound_stats["short_circuited"] += 1
+        raise UpstreamUnavailable("Open-Meteo circuit is open, the call is deferred")
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.warning("Open-Meteo circuit closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_at = None
+
+    def record_failure(self) -> None:
+        if self.failure_threshold <= 0:
+            return
+
+        with self._lock:
+            self._failures += 1
+            if self._trial_at is not None or (self._opened_at is None and self._failures >= self.failure_threshold):
+                if self._opened_at is None:
+                    outbound_stats["circuit_opened"] += 1
+                    logger.warning(f"Open-Meteo circuit opened after {self._failures} failure(s)")
+                self._opened_at = time.monotonic()
+                self._trial_at = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_at = None
+
+
+rate_limiter = TokenBucket(config.OUTBOUND_RATE_PER_SECOND, config.OUTBOUND_BURST)
+circuit_breaker = CircuitBreaker(config.CIRCUIT_FAILURE_THRESHOLD, config.CIRCUIT_RESET_SECONDS)
+
+
+def requests_timeout() -> tuple[float, float]:
+    return config.OUTBOUND_CONNECT_TIMEOUT_SECONDS, config.OUTBOUND_READ_TIMEOUT_SECONDS
+
+
+def httpx_timeout() -> httpx.Timeout:
+    return httpx.Timeout(config.OUTBOUND_READ_TIMEOUT_SECONDS, connect=config.OUTBOUND_CONNECT_TIMEOUT_SECONDS)
+
+
+def before_call() -> float:
+    """Checks the circuit and takes a rate limit token, returns the seconds to wait before calling."""
+    circuit_breaker.allow()
+    return rate_limiter.reserve(config.OUTBOUND_MAX_WAIT_SECONDS)
+
+
+def after_success() -> None:
+    circuit_breaker.record_success()
+
+
+def after_failure(e: Exception, attempt: int) -> float | None:
+    """
+    Records a failed attempt (0 for the first) and returns the seconds to wait before retrying, or None to give up.
+
+    Connection errors, timeouts, 429 and 5xx responses are transient: they count towards opening the circuit and are
+    retried with exponential backoff and full jitter, or after the 'Retry-After' of a 429. Other errors are not retried.
+    """
+    response = getattr(e, "response", None)
+    status_code = getattr(response, "status_code", None)
+    transient = (
+        isinstance(e, (requests.ConnectionError, requests.Timeout, httpx.TransportError))
+        or status_code == 429
+        or (status_code is not None and status_code >= 500)
+    )
+    if not transient:
+        # Open-Meteo answered, e.g. a 400 for a bad request, so it is not down
+        circuit_breaker.record_success()
+        return None
+
+    circuit_breaker.record_failure()
+    if attempt >= config.OUTBOUND_RETRIES or circuit_breaker.state != "closed":
+        return None
+
+    outbound_stats["retries"] += 1
+    retry_after = response.headers.get("Retry-After") if status_code == 429 else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), config.OUTBOUND_BACKOFF_MAX_SECONDS)
+    return random.uniform(0, min(config.OUTBOUND_BACKOFF_MAX_SECONDS, config.OUTBOUND_BACKOFF_BASE_SECONDS * 2**attempt))
+
+
+def snapshot() -> dict:
+    return {"circuit": circuit_breaker.state, **outbound_stats}
@@ -0,0 +1,77 @@
+import csv
+import io
+import json
+from collections.abc import Iterator, Sequence
+from datetime import datetime
+
+from sqlalchemy import Select
+
+from . import config
+from .db import WeatherObservation, get_db, select
+from .utils import convert_observations, to_epoch
+
+EXPORT_FIELDS = ["id", "city_id", "temperature_unit", "temperature", "timezone", "timestamp"]
+
+
+def observations_query(city_id: int, start: datetime | None = None, end: datetime | None = None) -> Select:
+    """Selects a city's observations in time order, optionally within [start, end)."""
+    stmt = (
+        select(WeatherObservation.id, WeatherObservation.observed_at, WeatherObservation.temperature_c)
+        .where(WeatherObservation.city_id == city_id)
+        .order_by(WeatherObservation.observed_at, WeatherObservation.id)
+    )
+
+    if start:
+        stmt = stmt.where(WeatherObservation.observed_at >= to_epoch(start))
+
+    if end:
+        stmt = stmt.where(WeatherObservation.observed_at < to_epoch(end))
+
+    return stmt
+
+
+def convert_rows(rows: Sequence[tuple[int, int, float]], city_id: int, temperature_unit: str, timezone: str) -> list[list]:
+    """Converts (id, observed_at, temperature_c) rows to export rows, see 'EXPORT_FIELDS'."""
+    timestamps, temperatures = convert_observations(
+        [observed_at for _, observed_at, _ in rows],
+        [temperature_c for _, _, temperature_c in rows],
+        temperature_unit,
+        timezone,
+    )
+    return [
+        [row[0], city_id, temperature_unit, temperature, timezone, timestamp.isoformat() if timestamp else None]
+        for row, timestamp, temperature in zip(rows, timestamps, temperatures)
+    ]
+
+
+def iter_converted_rows(stmt: Select, city_id: int, temperature_unit: str, timezone: str) -> Iterator[list[list]]:
+    # Opens its own session, the request's session is closed before a streaming response is sent.
+    # yield_per fetches and converts one chunk at a time, so memory stays flat however long the history is.
+    db = get_db()
+    try:
+        result = db.execute(stmt.execution_options(yield_per=config.EXPORT_CHUNK_SIZE, stream_results=True))
+        for partition in result.partitions():
+            yield convert_rows(partition, city_id, temperature_unit, timezone)
+    finally:
+        db.close()
+
+
+def stream_ndjson(chunks: Iterator[list[list]]) -> Iterator[str]:
+    for rows in chunks:
+        yield "".join(json.dumps(dict(zip(EXPORT_FIELDS, row))) + "\n" for row in rows)
+
+
+def stream_csv(chunks: Iterator[list[list]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        # Header only, there were no rows
+        yield buffer.getvalue()
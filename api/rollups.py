@@ -0,0 +1,121 @@
+from collections.abc import Iterable
+from datetime import datetime, timezone
+
+from sqlalchemy import Integer, cast, func, literal, literal_column, type_coerce
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from .archive import archived_until
+from .db import WeatherObservation, WeatherRollup, select
+
+PERIODS = ("hour", "day", "month")
+
+# Temperatures are stored as integer hundredths, SQL that aggregates them in the database has to scale them itself
+_SQL_TEMPERATURE_C = type_coerce(WeatherObservation.temperature_c, Integer) / literal_column("100.0")
+
+# SQL equivalents of 'bucket_start'
+_SQL_BUCKET_STARTS = {
+    "hour": WeatherObservation.observed_at - WeatherObservation.observed_at % 3600,
+    "day": WeatherObservation.observed_at - WeatherObservation.observed_at % 86400,
+    "month": cast(func.strftime("%s", WeatherObservation.observed_at, "unixepoch", "start of month"), Integer),
+}
+
+
+def bucket_start(observed_at: int, period: str) -> int:
+    """Returns the start (UTC epoch seconds) of the hour, day or month containing 'observed_at'."""
+    if period == "hour":
+        return observed_at - observed_at % 3600
+
+    if period == "day":
+        return observed_at - observed_at % 86400
+
+    utc_dt = datetime.fromtimestamp(observed_at, timezone.utc)
+    return int(utc_dt.replace(day=1, hour=0, minute=0, second=0).timestamp())
+
+
+def update_rollups(db: Session, observations: Iterable[tuple[int, int, float]]) -> None:
+    """
+    Adds observations to their hourly, daily and monthly buckets, as part of the caller's transaction.
+
+    Args:
+        db (Session): The session to execute in, the caller commits.
+        observations (Iterable[tuple[int, int, float]]): (city_id, UTC epoch seconds, temperature in celsius) per observation.
+    """
+    buckets: dict[tuple[int, str, int], dict] = {}
+    for city_id, observed_at, temperature_c in observations:
+        for period in PERIODS:
+            key = (city_id, period, bucket_start(observed_at, period))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = {
+                    "city_id": city_id,
+                    "period": period,
+                    "bucket_start": key[2],
+                    "count": 1,
+                    "sum_c": temperature_c,
+                    "min_c": temperature_c,
+                    "max_c": temperature_c,
+                }
+            else:
+                bucket["count"] += 1
+                bucket["sum_c"] += temperature_c
+                bucket["min_c"] = min(bucket["min_c"], temperature_c)
+                bucket["max_c"] = max(bucket["max_c"], temperature_c)
+
+    if not buckets:
+        return
+
+    stmt = insert(WeatherRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[WeatherRollup.city_id, WeatherRollup.period, WeatherRollup.bucket_start],
+        set_={
+            "count": WeatherRollup.count + stmt.excluded.count,
+            "sum_c": WeatherRollup.sum_c + stmt.excluded.sum_c,
+            "min_c": func.min(WeatherRollup.min_c, stmt.excluded.min_c),
+            "max_c": func.max(WeatherRollup.max_c, stmt.excluded.max_c),
+        },
+    )
+    db.execute(stmt, list(buckets.values()))
+
+
+def rebuild_rollups(db: Session, keep_archived: bool = True) -> None:
+    """
+    Recomputes the rollups from 'weather_observations', e.g. after a migration changed the observations.
+
+    With 'keep_archived', buckets from before the end of the latest archived month are kept as they are, as the
+    observations they were built from may only be in the archive now. Every bucket lines up with a month start, so
+    buckets are either kept or recomputed whole.
+    """
+    since = archived_until() if keep_archived else None
+    if since is None:
+        db.query(WeatherRollup).delete()
+    else:
+        db.query(WeatherRollup).filter(WeatherRollup.bucket_start >= since).delete()
+
+    for period, bucket in _SQL_BUCKET_STARTS.items():
+        stmt = select(
+            WeatherObservation.city_id,
+            literal(period),
+            bucket,
+            func.count(),
+            func.sum(_SQL_TEMPERATURE_C),
+            func.min(_SQL_TEMPERATURE_C),
+            func.max(_SQL_TEMPERATURE_C),
+        )
+        if since is not None:
+            stmt = stmt.where(WeatherObservation.observed_at >= since)
+        stmt = stmt.group_by(WeatherObservation.city_id, bucket)
+        columns = ["city_id", "period", "bucket_start", "count", "sum_c", "min_c", "max_c"]
+        db.execute(insert(WeatherRollup).from_select(columns, stmt))
+
+    db.commit()
+
+
+def ensure_rollups(db: Session) -> None:
+    """Builds the rollups once if observations exist but no rollups do."""
+    has_rollups = db.execute(select(WeatherRollup.city_id).limit(1)).first()
+    has_observations = db.execute(select(WeatherObservation.id).limit(1)).first()
+
+    if has_observations and not has_rollups:
+        # There are no rollups to keep, every observation still in the database is counted
+        rebuild_rollups(db, keep_archived=False)
@@ -1,26 +1,151 @@
-from collections.abc import Callable
+from collections import Counter
+from collections.abc import Callable, Iterable
+from datetime import datetime, timezone
 
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.interval import IntervalTrigger
 
+from . import config, db
 from .logging import get_logger
+from .metrics import SCHEDULER_EVENTS, on_job_event
 
 logger = get_logger(__name__)
-scheduler = BackgroundScheduler()
+scheduler = BackgroundScheduler(executors={"default": ThreadPoolExecutor(config.SCHEDULER_MAX_WORKERS)})
+scheduler.add_listener(on_job_event, SCHEDULER_EVENTS)
+
+# Fractional part of the golden ratio, consecutive multiples of it spread evenly over [0, 1)
+_GOLDEN_RATIO_FRACTION = 0.6180339887498949
 
 
 def start_scheduler():
+    # City jobs go to the "default" store, internal jobs are recreated on every start and stay in memory
+    if config.SCHEDULER_PERSIST_JOBS:
+        default_store = SQLAlchemyJobStore(engine=db.engine, tablename="apscheduler_jobs")
+    else:
+        default_store = MemoryJobStore()
+
+    # Replaces the whole configuration, a new executor is also needed when a stopped scheduler is started again
+    scheduler.configure(
+        executors={"default": ThreadPoolExecutor(config.SCHEDULER_MAX_WORKERS)},
+        jobstores={"default": default_store, "memory": MemoryJobStore()},
+        job_defaults={"coalesce": True, "misfire_grace_time": config.SCHEDULER_MISFIRE_GRACE_SECONDS},
+    )
     scheduler.start()
 
 
 def shutdown_scheduler():
-    scheduler.shutdown()
+    if scheduler.running:
+        scheduler.shutdown()
+
+
+def job_phase(job_id: int, interval_seconds: int) -> int:
+    """
+    The offset in seconds, within its interval, at which a city job runs.
+
+    Offsets are deterministic, so a job keeps its slot across restarts, and consecutive job IDs land far apart,
+    so jobs with the same interval do not all run in the same second.
+    """
+    return int((job_id * _GOLDEN_RATIO_FRACTION) % 1 * interval_seconds)
+
+
+def hourly_series_mode(interval_hours: float) -> bool:
+    """Whether a city with this interval is fetched every 'HOURLY_SERIES_HOURS' hours, storing each hourly temperature."""
+    return config.HOURLY_SERIES_HOURS > 0 and interval_hours >= 1
+
+
+def scheduled_interval_seconds(interval_hours: float) -> int:
+    """How often the job of a city with this interval runs."""
+    if hourly_series_mode(interval_hours):
+        interval_hours = max(interval_hours, config.HOURLY_SERIES_HOURS)
+    return int(interval_hours * 3600)
+
+
+def city_trigger(job_id: int, interval_hours: float) -> IntervalTrigger:
+    interval_seconds = scheduled_interval_seconds(interval_hours)
+    # Anchored at the epoch, the job runs at 'phase + n * interval' seconds whenever it was added
+    return IntervalTrigger(
+        seconds=interval_seconds,
+        start_date=datetime.fromtimestamp(job_phase(job_id, interval_seconds), timezone.utc),
+        jitter=config.SCHEDULER_JITTER_SECONDS or None,
+    )
 
 
 def add_job(job_id: int, interval_hours: float, callback: Callable[..., None], *args) -> None:
-    scheduler.add_job(callback, "interval", seconds=int(interval_hours * 3600), id=str(job_id), args=args)
+    scheduler.add_job(callback, city_trigger(job_id, interval_hours), id=str(job_id), args=args, replace_existing=True)
     logger.info(f"Scheduled '{callback.__name__}' for job ID '{job_id}' with interval '{interval_hours}' hour(s)")
 
 
+def reconcile_jobs(jobs: Iterable[tuple[int, float]], callback: Callable[..., None]) -> Counter[str]:
+    """
+    Brings the scheduled city jobs in line with 'jobs', touching only the ones that differ.
+
+    Jobs that are already scheduled with the right interval are kept as they are, so they keep their next run time.
+    Missing jobs are added, jobs with a changed interval are replaced, and jobs not in 'jobs' are removed.
+    Each job is called as 'callback(job_id)'.
+
+    Args:
+        jobs (Iterable[tuple[int, float]]): (job ID, interval in hours) pairs, can be a lazily fetched result.
+        callback (Callable[..., None]): The function the jobs run.
+
+    Returns:
+        Counter[str]: How many jobs were "kept", "added", "updated" and "removed".
+    """
+    stats: Counter[str] = Counter()
+    scheduled = {job.id: job.trigger.interval_length for job in scheduler.get_jobs(jobstore="default")}
+
+    for job_id, interval_hours in jobs:
+        interval_seconds = scheduled.pop(str(job_id), None)
+
+        if interval_seconds == scheduled_interval_seconds(interval_hours):
+            stats["kept"] += 1
+            continue
+
+        add_job(job_id, interval_hours, callback, job_id)
+        stats["added" if interval_seconds is None else "updated"] += 1
+
+    for job_id in scheduled:
+        remove_job(job_id)
+        stats["removed"] += 1
+
+    return stats
+
+
+def expected_load(jobs: Iterable[tuple[int, float]], start: float, seconds: int) -> list[int]:
+    """
+    Counts the city jobs due in each second of the window [start, start + seconds), leaving out jitter.
+
+    Args:
+        jobs (Iterable[tuple[int, float]]): (job ID, interval in hours) pairs.
+        start (float): Epoch seconds the window starts at.
+        seconds (int): Length of the window.
+
+    Returns:
+        list[int]: The number of jobs due in each second of the window.
+    """
+    load = [0] * seconds
+    start = int(start)
+
+    for job_id, interval_hours in jobs:
+        interval_seconds = scheduled_interval_seconds(interval_hours)
+        if interval_seconds <= 0:
+            continue
+        # First run at or after the start of the window
+        run = start + (job_phase(job_id, interval_seconds) - start) % interval_seconds
+        for second in range(run - start, seconds, interval_seconds):
+            load[second] += 1
+
+    return load
+
+
+def add_interval_job(job_id: str, seconds: float, callback: Callable[..., None], *args) -> None:
+    """Schedules an internal (non-city) job, such as flushing queued batch fetches."""
+    scheduler.add_job(callback, "interval", seconds=seconds, id=job_id, args=args, jobstore="memory", replace_existing=True)
+    logger.info(f"Scheduled '{callback.__name__}' as '{job_id}' every '{seconds}' second(s)")
+
+
 def remove_job(job_id: int):
     try:
         scheduler.remove_job(str(job_id))
@@ -32,4 +157,4 @@ def remove_job(job_id: int):
 def update_job_interval(job_id: int, interval_hours: float, callback: Callable[..., None], *args):
     logger.info(f"Updating interval for job ID '{job_id}'")
     remove_job(job_id)
-    add_job(job_id, interval_hours, callback, args)
+    add_job(job_id, interval_hours, callback, *args)
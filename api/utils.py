@@ -1,7 +1,37 @@
+import base64
+import json
+from collections.abc import Sequence
 from datetime import datetime, timezone
+from functools import cache, lru_cache
 from zoneinfo import ZoneInfo, available_timezones
 
 
+@cache
+def valid_timezones() -> frozenset[str]:
+    """Returns the IANA timezone names, 'available_timezones()' walks the tz database on disk so it is only called once."""
+    return frozenset(available_timezones())
+
+
+@lru_cache(maxsize=1024)
+def get_timezone(timezone_str: str) -> ZoneInfo:
+    return ZoneInfo(timezone_str)
+
+
+def _parse_utc_iso(utc_iso_str: str) -> datetime | None:
+    try:
+        if utc_iso_str.endswith("Z"):
+            utc_iso_str = utc_iso_str.replace("Z", "+00:00")
+
+        utc_dt = datetime.fromisoformat(utc_iso_str)
+    except ValueError:
+        return
+
+    if utc_dt.tzinfo is not timezone.utc:
+        return
+
+    return utc_dt
+
+
 def convert_utc_iso_to_target_timezone(utc_iso_str: str, target_timezone_str: str) -> datetime | None:
     """
     Converts an ISO-formatted UTC string to a datetime object in the specified target timezone.
@@ -14,26 +44,86 @@ def convert_utc_iso_to_target_timezone(utc_iso_str: str, target_timezone_str: st
         datetime | None: A timezone-aware datetime object in the target timezone if the input is valid and the timezone is recognized.
                          Returns None if the input string is malformed or not in ISO UTC format.
     """
-    if target_timezone_str not in available_timezones():
+    if target_timezone_str not in valid_timezones():
         return
 
-    try:
-        if utc_iso_str.endswith("Z"):
-            utc_iso_str = utc_iso_str.replace("Z", "+00:00")
-
-        utc_dt = datetime.fromisoformat(utc_iso_str)
-    except ValueError:
-        return
-
-    if utc_dt.tzinfo is not timezone.utc:
-        return
+    utc_dt = _parse_utc_iso(utc_iso_str)
 
-    if target_timezone_str.upper() in ("UTC", "GMT"):
+    if utc_dt is None or target_timezone_str.upper() in ("UTC", "GMT"):
         return utc_dt
 
-    target_timezone = ZoneInfo(target_timezone_str)
-    return utc_dt.astimezone(target_timezone)
+    return utc_dt.astimezone(get_timezone(target_timezone_str))
 
 
 def celsius_to_fahrenheit(celsius: float) -> float:
     return round((celsius * 1.8) + 32, 2)
+
+
+def convert_observations(
+    epoch_times: Sequence[int],
+    temperatures_c: Sequence[float],
+    temperature_unit: str,
+    target_timezone_str: str,
+) -> tuple[list[datetime | None], list[float]]:
+    """
+    Converts a column of stored observations to the requested temperature unit and timezone.
+
+    The timezone is validated and resolved once for the whole column instead of once per row,
+    and timestamps are built straight from epoch seconds without any string parsing.
+
+    Args:
+        epoch_times (Sequence[int]): UTC times as epoch seconds.
+        temperatures_c (Sequence[float]): Temperatures in celsius, same length as 'epoch_times'.
+        temperature_unit (str): "C" or "F".
+        target_timezone_str (str): The target timezone name (e.g., 'America/New_York').
+
+    Returns:
+        tuple[list[datetime | None], list[float]]: The timestamps in the target timezone (None if the timezone is unknown),
+                                                   and the temperatures in the requested unit.
+    """
+    if temperature_unit == "F":
+        temperatures = [celsius_to_fahrenheit(celsius) for celsius in temperatures_c]
+    else:
+        temperatures = list(temperatures_c)
+
+    if target_timezone_str not in valid_timezones():
+        return [None] * len(epoch_times), temperatures
+
+    if target_timezone_str.upper() in ("UTC", "GMT"):
+        target_timezone = timezone.utc
+    else:
+        target_timezone = get_timezone(target_timezone_str)
+
+    fromtimestamp = datetime.fromtimestamp
+    timestamps = [fromtimestamp(epoch_time, target_timezone) for epoch_time in epoch_times]
+    return timestamps, temperatures
+
+
+def to_epoch(dt: datetime) -> int:
+    """Converts a datetime to epoch seconds, naive datetimes are taken to be UTC."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def encode_cursor(observed_at: int, observation_id: int) -> str:
+    """Encodes the position of the last returned observation as an opaque, URL-safe pagination cursor."""
+    return base64.urlsafe_b64encode(json.dumps([observed_at, observation_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+    """
+    Decodes a cursor created by 'encode_cursor'.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        observed_at, observation_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Malformed cursor") from e
+
+    if not isinstance(observed_at, int) or not isinstance(observation_id, int):
+        raise ValueError("Malformed cursor")
+
+    return observed_at, observation_id
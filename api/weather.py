@@ -1,35 +1,318 @@
+import asyncio
+import atexit
+import itertools
+import math
+import threading
+import time
+from collections import Counter
+from collections.abc import Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Literal
+from typing import Literal, TypeVar
+from urllib.parse import urlsplit
 
+import httpx
 import requests
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
 
+from . import config, fetcher, outbound
+from .batching import BatchWriter
+from .cache import LRUCache, geocode_cache
 from .db import City, WeatherObservation, get_db, select
 from .logging import get_logger
+from .metrics import JOB_DEFERRED, upstream_seconds
 from .models import CityCreate
+from .rollups import update_rollups
+from .scheduler import hourly_series_mode
 
-WEATHER_API = "https://api.open-meteo.com/v1/forecast"
-GEOCODE_API = "https://geocoding-api.open-meteo.com/v1/search"
+WEATHER_API = config.WEATHER_API_URL
+GEOCODE_API = config.GEOCODE_API_URL
+# 'endpoint' label of the upstream latency metric
+_API_ENDPOINTS = {WEATHER_API: "forecast", GEOCODE_API: "geocode"}
 
 
 logger = get_logger(__name__)
 
+T = TypeVar("T")
+
+# Counters for batched fetching, 'calls_saved' is how many per-city requests the batches replaced
+batch_stats: Counter[str] = Counter()
+# 'skipped_current': fetches skipped because the city's observation is current, 'duplicates': observations already stored,
+# 'grid_deduplicated': cities served by another city's fetch of the same grid cell,
+# 'deferred': fetches not made because the Open-Meteo circuit was open or no rate limit token was available,
+# 'backfilled': hourly temperatures fetched for the time since a city's latest observation
+fetch_stats: Counter[str] = Counter()
+
+# Current weather per (grid cell, slot), for the other cities of a cell fetched in the same slot
+cell_weather = LRUCache(config.GRID_CACHE_SIZE)
+
+_pending_city_ids: set[int] = set()
+_pending_lock = threading.Lock()
+
+# Shared session so sync fetches reuse keep-alive connections instead of a new TCP+TLS handshake per call
+_session = requests.Session()
+
 
 def call_api(url: str, query_params: dict):
-    response = requests.get(url, params=query_params)
-    response.raise_for_status()
-    return response
+    """
+    GET from Open-Meteo through the shared outbound limits: the circuit breaker, the rate limit, a timeout per request
+    and retries of transient errors. Raises 'UpstreamUnavailable' without calling when the circuit is open.
+    """
+    endpoint = _API_ENDPOINTS.get(url, url)
+    for attempt in itertools.count():
+        time.sleep(outbound.before_call())
+        start = time.perf_counter()
+        try:
+            response = _session.get(url, params=query_params, timeout=outbound.requests_timeout())
+            response.raise_for_status()
+        except requests.RequestException as e:
+            delay = outbound.after_failure(e, attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        finally:
+            upstream_seconds.observe(time.perf_counter() - start, endpoint)
+
+        outbound.after_success()
+        return response
+
+
+async def call_api_async(url: str, query_params: dict) -> httpx.Response:
+    """Async counterpart of 'call_api', waiting for tokens and retries on the event loop."""
+    endpoint = _API_ENDPOINTS.get(url, url)
+    for attempt in itertools.count():
+        await asyncio.sleep(outbound.before_call())
+        async with fetcher.host_limit(urlsplit(url).netloc):
+            start = time.perf_counter()
+            try:
+                response = await fetcher.get_client().get(url, params=query_params)
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                delay = outbound.after_failure(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                outbound.after_success()
+                return response
+            finally:
+                upstream_seconds.observe(time.perf_counter() - start, endpoint)
+        # Waits for the retry without holding the host's slot
+        await asyncio.sleep(delay)
 
 
 def get_coordinates(city_name: str, country_code: str) -> tuple[float, float] | None:
+    cached, coordinates = geocode_cache.get(city_name, country_code)
+    if cached:
+        return coordinates
+
     query_params = {"name": city_name, "countryCode": country_code}
     data: dict = call_api(GEOCODE_API, query_params).json()
     results: list[dict[str, str]] | None = data.get("results")
+    coordinates = None
 
     if results:
         first = results[0]
-        return float(first["latitude"]), float(first["longitude"])
+        coordinates = float(first["latitude"]), float(first["longitude"])
+
+    geocode_cache.set(city_name, country_code, coordinates)
+    return coordinates
+
+
+def get_coordinates_many(cities: Sequence[tuple[str, str]]) -> list[tuple[float, float] | None | requests.RequestException]:
+    """
+    Geocodes many (city_name, country_code) pairs concurrently, on at most 'BULK_GEOCODE_WORKERS' threads.
+
+    Returns:
+        list[tuple[float, float] | None | requests.RequestException]: The coordinates of each pair in order,
+        None if the city was not found, or the exception if the lookup failed.
+    """
+
+    def lookup(city: tuple[str, str]) -> tuple[float, float] | None | requests.RequestException:
+        try:
+            return get_coordinates(*city)
+        except requests.RequestException as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=config.BULK_GEOCODE_WORKERS) as pool:
+        return list(pool.map(lookup, cities))
+
+
+def _weather_query_params(latitude: float | str, longitude: float | str, past_hours: int = 0) -> dict:
+    query_params = {
+        "latitude": latitude,
+        "longitude": longitude,
+        "current_weather": True,
+        "timezone": "UTC",
+    }
+    if past_hours:
+        # The hourly series from 'past_hours' before the current hour, up to and including the current hour
+        query_params.update(hourly="temperature_2m", past_hours=past_hours, forecast_hours=1)
+    return query_params
+
+
+def _epoch_seconds(utc_time: str) -> int:
+    # The weather API provides a naive (timezone-unaware) ISO-formatted string in UTC (we request timezone=UTC).
+    # It is stored as integer epoch seconds, which are converted to the requested timezone by the '/reports/' API endpoint.
+    #
+    # Example:
+    #   Weather API response: '2025-08-29T15:30'
+    #   Stored in database: 1756481400
+    utc_dt = datetime.fromisoformat(utc_time).replace(tzinfo=timezone.utc)
+    return int(utc_dt.timestamp())
+
+
+def _observed_at(current_weather: dict) -> int:
+    return _epoch_seconds(current_weather["time"])
+
+
+def _to_observation(city_id: int, current_weather: dict) -> tuple[int, int, float]:
+    return city_id, _observed_at(current_weather), current_weather["temperature"]
+
+
+def _series_observations(
+    city_id: int, location: dict, last_observed_at: int | None, current_weather: dict
+) -> list[tuple[int, int, float]]:
+    """The hourly temperatures of a location after the city's latest stored observation and before the current weather."""
+    hourly: dict = location.get("hourly") or {}
+    after = last_observed_at or 0
+    before = _observed_at(current_weather)
+    observations = []
+
+    for utc_time, temperature in zip(hourly.get("time", []), hourly.get("temperature_2m", [])):
+        observed_at = _epoch_seconds(utc_time)
+        if temperature is not None and after < observed_at < before:
+            observations.append((city_id, observed_at, temperature))
+
+    fetch_stats["backfilled"] += len(observations)
+    return observations
+
+
+def write_observations(db, observations: Sequence[tuple[int, int, float]]) -> int:
+    """
+    Inserts (city_id, UTC epoch seconds, temperature) observations and updates their rollups, the caller commits.
+
+    Observations that are already stored for the same city and time are skipped, and are left out of the rollups.
+
+    Returns:
+        int: The number of observations inserted.
+    """
+    stmt = (
+        insert(WeatherObservation)
+        .on_conflict_do_nothing(index_elements=["city_id", "observed_at"])
+        .returning(WeatherObservation.city_id, WeatherObservation.observed_at, WeatherObservation.temperature_c)
+    )
+    rows = [
+        {"city_id": city_id, "observed_at": observed_at, "temperature_c": temperature_c}
+        for city_id, observed_at, temperature_c in observations
+    ]
+    inserted = [tuple(row) for row in db.execute(stmt, rows)]
+
+    fetch_stats["duplicates"] += len(observations) - len(inserted)
+    if inserted:
+        update_rollups(db, inserted)
+    return len(inserted)
+
+
+def _slot_start(epoch_seconds: int) -> int:
+    return epoch_seconds // config.OBSERVATION_SLOT_SECONDS * config.OBSERVATION_SLOT_SECONDS
+
 
-    return None
+def _last_observed_at(db, city_ids: Sequence[int]) -> dict[int, int | None]:
+    """The epoch seconds of the latest stored observation of each city among 'city_ids', None for cities without one."""
+    # A correlated max() is one seek in the (city_id, observed_at) index per city
+    latest = select(func.max(WeatherObservation.observed_at)).where(WeatherObservation.city_id == City.id).scalar_subquery()
+    return dict(db.execute(select(City.id, latest).where(City.id.in_(city_ids))).tuples().all())
+
+
+def _is_current(last_observed_at: int | None) -> bool:
+    """Whether the city already has an observation from the current Open-Meteo slot."""
+    if not config.OBSERVATION_SLOT_SECONDS or last_observed_at is None:
+        return False
+    return last_observed_at >= _slot_start(int(time.time()))
+
+
+def backfill_hours(interval_hours: float, last_observed_at: int | None) -> int:
+    """
+    Hours of the hourly temperature series to fetch with the current weather, 0 to fetch only the current weather.
+
+    A city in hourly series mode fetches every hour since its latest observation. Any other city fetches the gap
+    after it missed a run, because the scheduler was down or Open-Meteo was unavailable, up to 'BACKFILL_MAX_HOURS'.
+    """
+    now = int(time.time())
+
+    if hourly_series_mode(interval_hours):
+        gap = now - last_observed_at if last_observed_at else config.HOURLY_SERIES_HOURS * 3600
+        return min(math.ceil(gap / 3600), max(config.HOURLY_SERIES_HOURS, config.BACKFILL_MAX_HOURS))
+
+    if not config.BACKFILL_MAX_HOURS or last_observed_at is None:
+        return 0
+
+    gap = now - last_observed_at
+    # The scheduler's jitter can delay a run, a gap of two intervals means a run was missed
+    if gap <= 2 * interval_hours * 3600:
+        return 0
+    return min(math.ceil(gap / 3600), config.BACKFILL_MAX_HOURS)
+
+
+def grid_cell(latitude: float, longitude: float) -> tuple[float, int, int] | tuple[float, float]:
+    """The key of the 'GRID_RESOLUTION_DEG' grid cell a location falls in, or the location itself with the grid disabled."""
+    resolution = config.GRID_RESOLUTION_DEG
+    if not resolution:
+        return latitude, longitude
+    return resolution, round(latitude / resolution), round(longitude / resolution)
+
+
+def _cached_cell_weather(cell: tuple) -> dict | None:
+    """Current weather already fetched for a grid cell in the current slot."""
+    if not config.OBSERVATION_SLOT_SECONDS:
+        return None
+    return cell_weather.get((cell, _slot_start(int(time.time()))))
+
+
+def _cache_cell_weather(cell: tuple, current_weather: dict) -> None:
+    # Kept under the slot of the observation, so weather that lags behind the current slot is not shared
+    if config.OBSERVATION_SLOT_SECONDS:
+        cell_weather.set((cell, _slot_start(_observed_at(current_weather))), current_weather)
+
+
+def _write_observation_batch(observations: list[tuple[int, int, float]]) -> None:
+    # A failed batch is rolled back and retried by the writer, stored observations are skipped on the retry
+    db = get_db()
+    try:
+        write_observations(db, observations)
+        db.commit()
+    finally:
+        db.close()
+
+
+# Write-behind buffer: fetches hand observations over and one thread inserts them in bulk, one transaction per flush
+observation_writer = BatchWriter(
+    "observation-writer",
+    _write_observation_batch,
+    batch_size=config.OBSERVATION_BATCH_SIZE,
+    flush_interval=config.OBSERVATION_FLUSH_INTERVAL_MS / 1000,
+    max_queue=config.OBSERVATION_QUEUE_SIZE,
+    drop_policy="block",
+    retries=config.OBSERVATION_FLUSH_RETRIES,
+    logger=logger,
+)
+atexit.register(observation_writer.stop)
+
+
+def _store_observations(db, observations: Sequence[tuple[int, int, float]]) -> None:
+    # With 'WRITE_BEHIND' the observations are queued for the writer thread, otherwise they join the caller's transaction
+    if config.WRITE_BEHIND:
+        for observation in observations:
+            observation_writer.put(observation)
+        return
+
+    write_observations(db, observations)
+
+
+def _store_observation(db, city_id: int, current_weather: dict) -> None:
+    _store_observations(db, [_to_observation(city_id, current_weather)])
 
 
 def fetch_weather_job(city_id: int):
@@ -41,45 +324,284 @@ def fetch_weather_job(city_id: int):
             logger.error(f"City ID '{city_id}' not found")
             return
 
-        # The weather API provides a naive (timezone-unaware) ISO-formatted string.
-        # To accommodate SQLite's datetime limitations, we store it as a timezone-aware ISO-formatted string in the database.
-        #
-        # Example:
-        #   Weather API response: '2025-08-29T15:30'
-        #   Stored in database: '2025-08-29T15:30:00+00:00'
-        #
-        # This string is post-processed when a user requests a different timezone format via the '/reports/' API endpoint.
-
-        query_params = {
-            "latitude": city.latitude,
-            "longitude": city.longitude,
-            "current_weather": True,
-            "timezone": "UTC",
-        }
-        data: dict = call_api(WEATHER_API, query_params).json()
-        current_weather = data.get("current_weather")
-
-        if not current_weather:
-            logger.error(f"No current weather data for city ID '{city_id}'")
+        last_observed_at = _last_observed_at(db, [city_id])[city_id]
+        if _is_current(last_observed_at):
+            fetch_stats["skipped_current"] += 1
+            logger.info(f"Weather for city ID '{city_id}' is already current")
             return
 
-        utc_iso_time: str = datetime.fromisoformat(current_weather["time"]).replace(tzinfo=timezone.utc).isoformat()
-        weather_obs_in_db = WeatherObservation(
-            city_id=city_id,
-            utc_iso_time=utc_iso_time,
-            temperature_c=current_weather["temperature"],
-        )
-        db.add(weather_obs_in_db)
+        cell = grid_cell(city.latitude, city.longitude)
+        past_hours = backfill_hours(city.interval_hours, last_observed_at)
+        # The cell's cached current weather carries no hourly series
+        current_weather = None if past_hours else _cached_cell_weather(cell)
+        observations = []
+
+        if current_weather:
+            fetch_stats["grid_deduplicated"] += 1
+        else:
+            query_params = _weather_query_params(city.latitude, city.longitude, past_hours)
+            data: dict = call_api(WEATHER_API, query_params).json()
+            current_weather = data.get("current_weather")
+
+            if not current_weather:
+                logger.error(f"No current weather data for city ID '{city_id}'")
+                return
+
+            _cache_cell_weather(cell, current_weather)
+            if past_hours:
+                observations = _series_observations(city_id, data, last_observed_at, current_weather)
+
+        _store_observations(db, [*observations, _to_observation(city_id, current_weather)])
         db.commit()
 
         logger.info(f"Updated weather for city ID '{city_id}'")
         return True
 
+    except outbound.UpstreamUnavailable as e:
+        # Open-Meteo is down or the rate limit is exhausted, the city is fetched on its next run
+        fetch_stats["deferred"] += 1
+        logger.info(f"Fetch for city ID '{city_id}' deferred: '{str(e)}'")
+        return JOB_DEFERRED
+
     except requests.RequestException as e:
         logger.error(f"Error fetching weather for city ID '{city_id}': '{str(e)}'")
+        return False
 
     except Exception as e:
         logger.critical(f"Unexpected error for city ID '{city_id}': '{str(e)}'")
+        return False
 
     finally:
         db.close()
+
+
+def _get_city_fetch(city_id: int) -> tuple[float, float, int, int | None] | Literal["current"] | None:
+    """
+    The city's coordinates, the hours of its hourly series to fetch and the epoch seconds of its latest observation,
+    or "current" if it needs no fetch.
+    """
+    db = get_db()
+    try:
+        row = db.execute(select(City.latitude, City.longitude, City.interval_hours).where(City.id == city_id)).first()
+        if not row:
+            return None
+        last_observed_at = _last_observed_at(db, [city_id])[city_id]
+        if _is_current(last_observed_at):
+            return "current"
+        return row.latitude, row.longitude, backfill_hours(row.interval_hours, last_observed_at), last_observed_at
+    finally:
+        db.close()
+
+
+def _save_observations(observations: list[tuple[int, int, float]]) -> None:
+    if config.WRITE_BEHIND:
+        for observation in observations:
+            observation_writer.put(observation)
+        return
+
+    db = get_db()
+    try:
+        _store_observations(db, observations)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def fetch_weather_job_async(city_id: int):
+    """Async counterpart of 'fetch_weather_job', the HTTP wait happens on the fetch engine's event loop."""
+    try:
+        city_fetch = await asyncio.to_thread(_get_city_fetch, city_id)
+
+        if not city_fetch:
+            logger.error(f"City ID '{city_id}' not found")
+            return
+
+        if city_fetch == "current":
+            fetch_stats["skipped_current"] += 1
+            logger.info(f"Weather for city ID '{city_id}' is already current")
+            return
+
+        latitude, longitude, past_hours, last_observed_at = city_fetch
+        cell = grid_cell(latitude, longitude)
+        current_weather = None if past_hours else _cached_cell_weather(cell)
+        observations = []
+
+        if current_weather:
+            fetch_stats["grid_deduplicated"] += 1
+        else:
+            response = await call_api_async(WEATHER_API, _weather_query_params(latitude, longitude, past_hours))
+            data: dict = response.json()
+            current_weather = data.get("current_weather")
+
+            if not current_weather:
+                logger.error(f"No current weather data for city ID '{city_id}'")
+                return
+
+            _cache_cell_weather(cell, current_weather)
+            if past_hours:
+                observations = _series_observations(city_id, data, last_observed_at, current_weather)
+
+        await asyncio.to_thread(_save_observations, [*observations, _to_observation(city_id, current_weather)])
+
+        logger.info(f"Updated weather for city ID '{city_id}'")
+        return True
+
+    except outbound.UpstreamUnavailable as e:
+        fetch_stats["deferred"] += 1
+        logger.info(f"Fetch for city ID '{city_id}' deferred: '{str(e)}'")
+        return JOB_DEFERRED
+
+    except (httpx.HTTPError, requests.RequestException) as e:
+        logger.error(f"Error fetching weather for city ID '{city_id}': '{str(e)}'")
+        return False
+
+    except Exception as e:
+        logger.critical(f"Unexpected error for city ID '{city_id}': '{str(e)}'")
+        return False
+
+
+def _chunks(items: Sequence[T], size: int) -> Iterator[Sequence[T]]:
+    for start in range(0, len(items), max(size, 1)):
+        yield items[start : start + size]
+
+
+def fetch_weather_batch(city_ids: Sequence[int]) -> int:
+    """
+    Fetches current weather for many cities using one Open-Meteo request per chunk of grid cells.
+
+    Args:
+        city_ids (Sequence[int]): IDs of the cities to fetch.
+
+    Returns:
+        int: The number of observations stored.
+    """
+    stored = 0
+    try:
+        db = get_db()
+        cities = db.execute(select(City).where(City.id.in_(city_ids)).order_by(City.id)).scalars().all()
+
+        missing_city_ids = set(city_ids) - {city.id for city in cities}
+        for city_id in sorted(missing_city_ids):
+            logger.error(f"City ID '{city_id}' not found")
+
+        last_observed_at = _last_observed_at(db, [city.id for city in cities])
+        current_city_ids = {city.id for city in cities if _is_current(last_observed_at[city.id])}
+        if current_city_ids:
+            fetch_stats["skipped_current"] += len(current_city_ids)
+            cities = [city for city in cities if city.id not in current_city_ids]
+        past_hours = {city.id: backfill_hours(city.interval_hours, last_observed_at[city.id]) for city in cities}
+
+        # One location per grid cell, its weather is fanned out to every city in the cell
+        cells: dict[tuple, list[City]] = {}
+        for city in cities:
+            cells.setdefault(grid_cell(city.latitude, city.longitude), []).append(city)
+
+        observations = []
+        cells_to_fetch = []
+        for cell, cell_cities in cells.items():
+            # The cell's cached current weather carries no hourly series
+            backfill = any(past_hours[city.id] for city in cell_cities)
+            current_weather = None if backfill else _cached_cell_weather(cell)
+            if current_weather:
+                fetch_stats["grid_deduplicated"] += len(cell_cities)
+                observations += [_to_observation(city.id, current_weather) for city in cell_cities]
+            else:
+                fetch_stats["grid_deduplicated"] += len(cell_cities) - 1
+                cells_to_fetch.append((cell, cell_cities))
+
+        if observations:
+            _store_observations(db, observations)
+            db.commit()
+        stored += len(observations)
+
+        for chunk in _chunks(cells_to_fetch, config.BATCH_CHUNK_SIZE):
+            # The locations of a request share one series length, the longest gap of the chunk
+            query_params = _weather_query_params(
+                ",".join(str(cell_cities[0].latitude) for _, cell_cities in chunk),
+                ",".join(str(cell_cities[0].longitude) for _, cell_cities in chunk),
+                max(past_hours[city.id] for _, cell_cities in chunk for city in cell_cities),
+            )
+            try:
+                data: dict | list[dict] = call_api(WEATHER_API, query_params).json()
+            except outbound.UpstreamUnavailable as e:
+                # Queued again, and fetched with the cities that come due meanwhile once Open-Meteo is back
+                city_ids_in_chunk = [city.id for _, cell_cities in chunk for city in cell_cities]
+                with _pending_lock:
+                    _pending_city_ids.update(city_ids_in_chunk)
+                fetch_stats["deferred"] += len(city_ids_in_chunk)
+                logger.info(f"Fetch for city IDs {city_ids_in_chunk} deferred: '{str(e)}'")
+                continue
+            except requests.RequestException as e:
+                city_ids_in_chunk = [city.id for _, cell_cities in chunk for city in cell_cities]
+                logger.error(f"Error fetching weather for city IDs {city_ids_in_chunk}: '{str(e)}'")
+                continue
+
+            batch_stats["requests"] += 1
+            batch_stats["cities"] += sum(len(cell_cities) for _, cell_cities in chunk)
+            batch_stats["calls_saved"] += len(chunk) - 1
+
+            # Open-Meteo answers a single location with an object and several locations with a list, in request order
+            locations = data if isinstance(data, list) else [data]
+            observations = []
+            for (cell, cell_cities), location in zip(chunk, locations):
+                current_weather = location.get("current_weather")
+
+                if not current_weather:
+                    logger.error(f"No current weather data for city IDs {[city.id for city in cell_cities]}")
+                    continue
+
+                _cache_cell_weather(cell, current_weather)
+                for city in cell_cities:
+                    if past_hours[city.id]:
+                        observations += _series_observations(city.id, location, last_observed_at[city.id], current_weather)
+                    observations.append(_to_observation(city.id, current_weather))
+
+            if observations:
+                _store_observations(db, observations)
+                db.commit()
+            stored += len(observations)
+
+        batch_stats["batches"] += 1
+        logger.info(f"Updated weather for {stored} of {len(city_ids)} cities, saved {batch_stats['calls_saved']} call(s) so far")
+
+    except Exception as e:
+        logger.critical(f"Unexpected error for city IDs {list(city_ids)}: '{str(e)}'")
+
+    finally:
+        db.close()
+
+    return stored
+
+
+def queue_weather_job(city_id: int) -> None:
+    with _pending_lock:
+        _pending_city_ids.add(city_id)
+
+
+def flush_weather_batch() -> int:
+    """Fetches every city queued since the last flush, the scheduler calls this once per grouping window."""
+    with _pending_lock:
+        city_ids = sorted(_pending_city_ids)
+        _pending_city_ids.clear()
+
+    if not city_ids:
+        return 0
+
+    return fetch_weather_batch(city_ids)
+
+
+def run_weather_job(city_id: int):
+    """
+    Scheduler entry point for a city, dispatches on 'FETCH_MODE'.
+
+    In "sync" mode the city is fetched on the calling scheduler thread, in "batch" mode it is queued for the next flush,
+    and in "async" mode the fetch is handed to the async engine and a future is returned without waiting.
+    """
+    if config.FETCH_MODE == "batch":
+        queue_weather_job(city_id)
+        return
+
+    if config.FETCH_MODE == "async":
+        return fetcher.submit(fetch_weather_job_async(city_id))
+
+    return fetch_weather_job(city_id)
@@ -1,11 +1,16 @@
 #!/usr/bin/env python3
 
 import argparse
+import csv
 import json
+import sys
+from collections import Counter
 
 import requests
 import uvicorn
 
+from benchmarks import bench_load, simulate
+
 
 def start_server(host: str, port: int, reload: bool):
     """Start the FastAPI server"""
@@ -33,6 +38,10 @@ def make_request(method: str, base_url: str, endpoint: str, params: dict | None
             exit(1)
 
         response.raise_for_status()
+
+        if "X-Next-Cursor" in response.headers:
+            print(f"More results, continue with: --cursor {response.headers['X-Next-Cursor']}", file=sys.stderr)
+
         return response.json()
     except requests.RequestException as e:
         print(str(e))
@@ -43,6 +52,44 @@ def make_request(method: str, base_url: str, endpoint: str, params: dict | None
         exit(1)
 
 
+def stream_to_file(base_url: str, endpoint: str, params: dict, output: str | None) -> None:
+    """Stream a (possibly large) response body to a file or stdout without loading it into memory"""
+    url = f"{base_url}{endpoint}"
+    try:
+        with requests.post(url, json=params, stream=True) as response:
+            response.raise_for_status()
+            out = open(output, "w", encoding="utf-8", newline="") if output else sys.stdout
+            try:
+                for chunk in response.iter_content(chunk_size=65536, decode_unicode=True):
+                    out.write(chunk)
+            finally:
+                if output:
+                    out.close()
+    except requests.RequestException as e:
+        print(str(e))
+        exit(1)
+
+
+def import_cities(base_url: str, path: str, chunk_size: int) -> dict:
+    """Create jobs for every city in a CSV file with 'name', 'country_code' and optional 'interval_hours' columns"""
+    with open(path, newline="", encoding="utf-8") as file:
+        cities = []
+        for row in csv.DictReader(file):
+            city = {"name": row["name"], "country_code": row["country_code"]}
+            if row.get("interval_hours"):
+                city["interval_hours"] = float(row["interval_hours"])
+            cities.append(city)
+
+    results = []
+    for start in range(0, len(cities), chunk_size):
+        results += make_request("POST", base_url, "/jobs/bulk", {"cities": cities[start : start + chunk_size]})
+
+    return {
+        "summary": Counter(result["status"] for result in results),
+        "not_created": [result for result in results if result["status"] not in ("created", "exists")],
+    }
+
+
 def parse_args():
     parser = argparse.ArgumentParser(description="Weather API Control Tool")
     parser.add_argument("--host", default="127.0.0.1", help="Server host (default: 127.0.0.1)")
@@ -76,11 +123,48 @@ def parse_args():
     update_parser.add_argument("city_id", type=int, help="City ID")
     update_parser.add_argument("interval", type=float, help="New update interval hours (float)")
 
+    # Import cities command
+    import_parser = subparsers.add_parser("import", help="Create jobs for every city in a CSV file")
+    import_parser.add_argument("file", help="CSV file with 'name', 'country_code' and optional 'interval_hours' columns")
+    import_parser.add_argument("--chunk-size", type=int, default=1000, help="Cities per request (default: 1000)")
+
     # Get temperature reports command
     reports_parser = subparsers.add_parser("temps", help="Get city temperatures")
     reports_parser.add_argument("city_id", type=int, help="City ID")
     reports_parser.add_argument("--tz", type=str, help="Optional timezone")
     reports_parser.add_argument("--unit", type=str, choices=["c", "f", "C", "F"], help="Optional temperature unit")
+    reports_parser.add_argument("--start", type=str, help="Optional start time (ISO format, UTC if no offset)")
+    reports_parser.add_argument("--end", type=str, help="Optional end time (ISO format, UTC if no offset)")
+    reports_parser.add_argument("--limit", type=int, help="Optional maximum number of observations")
+    reports_parser.add_argument("--cursor", type=str, help="Optional cursor to continue from a previous page")
+
+    # Get aggregated temperatures command
+    aggregates_parser = subparsers.add_parser("aggregates", help="Get hourly, daily or monthly min/max/mean temperatures")
+    aggregates_parser.add_argument("city_id", type=int, help="City ID")
+    aggregates_parser.add_argument("--period", type=str, choices=["hour", "day", "month"], help="Optional bucket size (default: day)")
+    aggregates_parser.add_argument("--tz", type=str, help="Optional timezone")
+    aggregates_parser.add_argument("--unit", type=str, choices=["c", "f", "C", "F"], help="Optional temperature unit")
+    aggregates_parser.add_argument("--start", type=str, help="Optional start time (ISO format, UTC if no offset)")
+    aggregates_parser.add_argument("--end", type=str, help="Optional end time (ISO format, UTC if no offset)")
+
+    # Export observation history command
+    export_parser = subparsers.add_parser("export", help="Export a city's full observation history")
+    export_parser.add_argument("city_id", type=int, help="City ID")
+    export_parser.add_argument("--format", type=str, choices=["ndjson", "csv"], default="ndjson", help="Output format (default: ndjson)")
+    export_parser.add_argument("--output", type=str, help="Optional output file (default: stdout)")
+    export_parser.add_argument("--tz", type=str, help="Optional timezone")
+    export_parser.add_argument("--unit", type=str, choices=["c", "f", "C", "F"], help="Optional temperature unit")
+    export_parser.add_argument("--start", type=str, help="Optional start time (ISO format, UTC if no offset)")
+    export_parser.add_argument("--end", type=str, help="Optional end time (ISO format, UTC if no offset)")
+    export_parser.add_argument("--archive", action="store_true", help="Export archived observations instead of those in the database")
+
+    # Load benchmark command
+    bench_parser = subparsers.add_parser("bench", help="Run the load benchmark against a local Open-Meteo stand-in")
+    bench_load.add_arguments(bench_parser)
+
+    # Capacity simulation command
+    simulate_parser = subparsers.add_parser("simulate", help="Replay the job schedule on a virtual clock for capacity planning")
+    simulate.add_arguments(simulate_parser)
 
     args = parser.parse_args()
     return args
@@ -94,6 +178,12 @@ def main():
     if args.command == "server":
         start_server(args.host, args.port, reload=args.reload)
 
+    elif args.command == "bench":
+        sys.exit(bench_load.run(args))
+
+    elif args.command == "simulate":
+        sys.exit(simulate.run(args))
+
     elif args.command == "add":
         data = {"name": args.name, "country_code": args.country_code}
 
@@ -114,6 +204,9 @@ def main():
     elif args.command == "update":
         result = make_request("PUT", base_url, f"/job/{args.city_id}", {"interval_hours": args.interval})
 
+    elif args.command == "import":
+        result = import_cities(base_url, args.file, args.chunk_size)
+
     elif args.command == "temps":
         data = {"city_id": args.city_id}
 
@@ -123,8 +216,42 @@ def main():
         if args.unit:
             data["temperature_unit"] = args.unit
 
+        for option in ("start", "end", "limit", "cursor"):
+            if getattr(args, option):
+                data[option] = getattr(args, option)
+
         result = make_request("POST", base_url, "/reports/", data)
 
+    elif args.command == "aggregates":
+        data = {"city_id": args.city_id}
+
+        if args.tz:
+            data["timezone"] = args.tz
+
+        if args.unit:
+            data["temperature_unit"] = args.unit
+
+        for option in ("period", "start", "end"):
+            if getattr(args, option):
+                data[option] = getattr(args, option)
+
+        result = make_request("POST", base_url, "/aggregates/", data)
+
+    elif args.command == "export":
+        data = {"city_id": args.city_id, "format": args.format}
+
+        if args.tz:
+            data["timezone"] = args.tz
+
+        if args.unit:
+            data["temperature_unit"] = args.unit
+
+        for option in ("start", "end"):
+            if getattr(args, option):
+                data[option] = getattr(args, option)
+
+        stream_to_file(base_url, "/reports/archive" if args.archive else "/reports/export", data, args.output)
+
     if result is not None:
         print(json.dumps(result, indent=2))
 
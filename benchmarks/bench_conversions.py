@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the '/reports/' unit and timezone conversions.
+
+Compares the original per-row path (an ISO string parse, a tz database scan and a new ZoneInfo for every row)
+with the batch path in 'api.utils.convert_observations', which builds timestamps straight from stored epoch seconds.
+The original path takes milliseconds per row, so it only runs on '--original-rows' rows and its time is scaled up to '--rows'.
+
+    python -m benchmarks.bench_conversions [--rows 2000] [--original-rows 20] [--timezone Europe/Stockholm]
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, available_timezones
+
+from api.utils import celsius_to_fahrenheit, convert_observations, convert_utc_iso_to_target_timezone
+
+
+def per_row_original(utc_iso_str: str, celsius: float, target_timezone_str: str) -> tuple[datetime | None, float]:
+    # The conversion as it was before the batch path: every row re-scans the tz database on disk.
+    if target_timezone_str not in available_timezones():
+        return None, celsius
+    utc_dt = datetime.fromisoformat(utc_iso_str)
+    return utc_dt.astimezone(ZoneInfo(target_timezone_str)), celsius_to_fahrenheit(celsius)
+
+
+def best_of(repeats: int, func, *args) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark report conversions")
+    parser.add_argument("--rows", type=int, default=2000, help="Observations per run (default: 2000)")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per variant, the best is reported (default: 5)")
+    parser.add_argument(
+        "--original-rows", type=int, default=20, help="Observations per run of the original variant, extrapolated (default: 20)"
+    )
+    parser.add_argument("--timezone", default="Europe/Stockholm", help="Target timezone (default: Europe/Stockholm)")
+    args = parser.parse_args()
+
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    utc_iso_times = [(start + timedelta(minutes=15 * i)).isoformat() for i in range(args.rows)]
+    epoch_times = [int((start + timedelta(minutes=15 * i)).timestamp()) for i in range(args.rows)]
+    temperatures_c = [(i % 400) / 10 - 10 for i in range(args.rows)]
+    rows = list(zip(utc_iso_times, temperatures_c))
+    original_rows = rows[: args.original_rows]
+
+    # Variant name -> (function, number of rows it converts)
+    variants = {
+        "per-row (original)": (lambda: [per_row_original(t, c, args.timezone) for t, c in original_rows], len(original_rows)),
+        "per-row (cached timezones)": (
+            lambda: [(convert_utc_iso_to_target_timezone(t, args.timezone), celsius_to_fahrenheit(c)) for t, c in rows],
+            len(rows),
+        ),
+        "batch (epoch seconds)": (lambda: convert_observations(epoch_times, temperatures_c, "F", args.timezone), len(rows)),
+    }
+
+    baseline = None
+    print(f"{'variant':<28} {'total ms':>10} {'us/row':>10} {'speedup':>9}")
+    for name, (func, converted) in variants.items():
+        # Scaled to '--rows', for the original variant this is an estimate
+        elapsed = best_of(args.repeats, func) * args.rows / converted
+        baseline = baseline or elapsed
+        print(f"{name:<28} {elapsed * 1000:>10.2f} {elapsed / args.rows * 1e6:>10.2f} {baseline / elapsed:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark of the API server against a local Open-Meteo stand-in.
+
+Starts the fake Open-Meteo server and the API (uvicorn, a fresh database in a temporary directory), creates N cities
+through 'POST /job/' while reader threads run a '/reports/' and '/job/{city_id}' mix, and keeps reading until the
+duration is over while the scheduler fetches. Reports request throughput, p50/p99 latencies, scheduled jobs per second
+(from '/metrics') and database growth as JSON. With '--baseline' the run is compared with an earlier report and the
+exit code is 1 if anything regressed by more than '--max-regression'.
+
+    python -m benchmarks.bench_load [--cities 1000] [--duration 60] [--latency-ms 50] [--error-rate 0.01]
+    python app_ctl.py bench --output bench.json
+    python app_ctl.py bench --baseline bench.json
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+from benchmarks.fake_open_meteo import start_fake_server
+
+ROOT = Path(__file__).parent.parent
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def _summary(latencies: list[float], errors: int, seconds: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "per_second": round(len(latencies) / seconds, 2) if seconds else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def _job_counts(base_url: str) -> dict[str, float]:
+    counts = {"success": 0.0, "error": 0.0, "deferred": 0.0, "misfire": 0.0}
+    for line in requests.get(f"{base_url}/metrics").text.splitlines():
+        if line.startswith("weather_scheduler_jobs_total{"):
+            labels, value = line.rsplit(" ", 1)
+            counts[labels.split('"')[1]] = float(value)
+    return counts
+
+
+def _db_bytes(database: Path) -> int:
+    return sum(path.stat().st_size for path in database.parent.glob(f"{database.name}*"))
+
+
+class _Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {"create": [], "report": [], "job": []}
+        self.errors = dict.fromkeys(self.latencies, 0)
+        self.lock = threading.Lock()
+
+    def timed(self, operation: str, call) -> requests.Response | None:
+        start = time.perf_counter()
+        try:
+            response = call()
+            # A 404 for a city without observations yet is an answer, server errors are not
+            ok = response.status_code < 500
+        except requests.RequestException:
+            response, ok = None, False
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            if ok:
+                self.latencies[operation].append(elapsed)
+            else:
+                self.errors[operation] += 1
+        return response
+
+
+def _start_api(base_env: dict, port: int) -> subprocess.Popen:
+    command = [sys.executable, "-m", "uvicorn", "api.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    process = subprocess.Popen(command, cwd=ROOT, env=base_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("The API server did not start")
+
+
+def run_benchmark(args: argparse.Namespace) -> dict:
+    fake = start_fake_server(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate, seed=args.seed)
+    directory = tempfile.TemporaryDirectory(prefix="weather-bench-")
+    database = Path(directory.name) / "bench.db"
+    port = _free_port()
+    env = {
+        **os.environ,
+        "DATABASE_FILE": str(database),
+        "WEATHER_API_URL": f"{fake.url}/v1/forecast",
+        "GEOCODE_API_URL": f"{fake.url}/v1/search",
+        "FETCH_MODE": args.fetch_mode,
+    }
+    base_url = f"http://127.0.0.1:{port}"
+    process = _start_api(env, port)
+    recorder = _Recorder()
+    created: list[int] = []
+
+    try:
+        db_before = _db_bytes(database)
+        jobs_before = _job_counts(base_url)
+        start = time.perf_counter()
+        deadline = start + args.duration
+        names = [f"BENCH CITY {i}" for i in range(args.cities)]
+        next_name = iter(names)
+        names_lock = threading.Lock()
+
+        def writer():
+            session = requests.Session()
+            while True:
+                with names_lock:
+                    name = next(next_name, None)
+                if name is None or time.perf_counter() > deadline:
+                    return
+                data = {"name": name, "country_code": "SE", "interval_hours": args.interval_hours}
+                response = recorder.timed("create", lambda: session.post(f"{base_url}/job/", json=data))
+                if response is not None and response.status_code == 200:
+                    with names_lock:
+                        created.append(response.json()["id"])
+
+        def reader(index: int):
+            session = requests.Session()
+            rng = random.Random(args.seed * 1000 + index)
+            while time.perf_counter() < deadline:
+                if not created:
+                    time.sleep(0.01)
+                    continue
+                city_id = created[rng.randrange(len(created))]
+                if rng.random() < args.report_share:
+                    data = {"city_id": city_id, "limit": 100}
+                    recorder.timed("report", lambda: session.post(f"{base_url}/reports/", json=data))
+                else:
+                    recorder.timed("job", lambda: session.get(f"{base_url}/job/{city_id}"))
+
+        writers = [threading.Thread(target=writer) for _ in range(args.writers)]
+        readers = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+        for thread in writers + readers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        create_seconds = time.perf_counter() - start
+        for thread in readers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        jobs_after = _job_counts(base_url)
+        db_after = _db_bytes(database)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        fake.shutdown()
+        directory.cleanup()
+
+    jobs = {result: int(jobs_after[result] - jobs_before[result]) for result in jobs_after}
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("baseline", "output", "command", "host", "port")},
+        "create": _summary(recorder.latencies["create"], recorder.errors["create"], create_seconds),
+        "report": _summary(recorder.latencies["report"], recorder.errors["report"], elapsed),
+        "job": _summary(recorder.latencies["job"], recorder.errors["job"], elapsed),
+        "scheduler": {
+            **jobs,
+            "jobs_per_second": round((jobs["success"] + jobs["error"]) / elapsed, 2),
+            # Every city runs once per interval once the schedule is in its steady state
+            "expected_jobs_per_second": round(len(created) / (args.interval_hours * 3600), 2),
+        },
+        "upstream_requests": fake.requests,
+        "db_bytes": {
+            "before": db_before,
+            "after": db_after,
+            "growth": db_after - db_before,
+            "per_city": round((db_after - db_before) / len(created)) if created else 0,
+        },
+        "seconds": round(elapsed, 2),
+    }
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> list[str]:
+    """Throughputs that dropped or p99 latencies that grew by more than 'max_regression' (a fraction) since 'baseline'."""
+    regressions = []
+    for operation in ("create", "report", "job"):
+        old, new = baseline[operation], report[operation]
+        if old["per_second"] and new["per_second"] < old["per_second"] * (1 - max_regression):
+            regressions.append(f"{operation} throughput {old['per_second']}/s -> {new['per_second']}/s")
+        if old["p99_ms"] and new["p99_ms"] > old["p99_ms"] * (1 + max_regression):
+            regressions.append(f"{operation} p99 {old['p99_ms']} ms -> {new['p99_ms']} ms")
+
+    old_jobs, new_jobs = baseline["scheduler"]["jobs_per_second"], report["scheduler"]["jobs_per_second"]
+    if old_jobs and new_jobs < old_jobs * (1 - max_regression):
+        regressions.append(f"scheduled jobs {old_jobs}/s -> {new_jobs}/s")
+    return regressions
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--cities", type=int, default=1000, help="Cities created through 'POST /job/' (default: 1000)")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds the run lasts, creating included (default: 60)")
+    parser.add_argument("--writers", type=int, default=4, help="Threads creating cities (default: 4)")
+    parser.add_argument("--readers", type=int, default=4, help="Threads reading reports and jobs (default: 4)")
+    parser.add_argument("--report-share", type=float, default=0.8, help="Share of reads that are '/reports/' (default: 0.8)")
+    parser.add_argument("--interval-hours", type=float, default=0.25, help="Job interval of the cities (default: 0.25)")
+    parser.add_argument("--fetch-mode", choices=["sync", "batch", "async"], default="sync", help="FETCH_MODE of the server (default: sync)")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Fake Open-Meteo mean latency (default: 50)")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="Fake Open-Meteo latency variation (default: 20)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake Open-Meteo requests that fail (default: 0)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the read mix and the fake server (default: 0)")
+    parser.add_argument("--output", type=str, help="Optional file the JSON report is written to")
+    parser.add_argument("--baseline", type=str, help="Optional earlier JSON report to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed regression against the baseline (default: 0.2)")
+
+
+def run(args: argparse.Namespace) -> int:
+    report = run_benchmark(args)
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if baseline["config"] != report["config"]:
+            print("Warning: the baseline was run with other options, the comparison may not be meaningful", file=sys.stderr)
+        regressions = compare(report, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark against a local Open-Meteo stand-in")
+    add_arguments(parser)
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Concurrent read/write throughput of the SQLite engine profiles.
+
+Writer processes insert observations one small transaction at a time, like scheduled fetch jobs,
+while reader processes run '/reports/'-style range queries. Separate processes keep the GIL out of
+the measurement, so what is compared is SQLite's locking. Each profile gets a fresh database file.
+
+    python -m benchmarks.bench_sqlite [--seconds 5] [--writers 4] [--readers 4]
+"""
+
+import argparse
+import multiprocessing
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from api.db import Base, City, create_db_engine
+from api.reports import observations_query
+from api.weather import write_observations
+
+START_TIME = datetime(2025, 1, 1, tzinfo=timezone.utc)
+START_EPOCH = int(START_TIME.timestamp())
+
+
+def _worker(role: str, worker: int, url: str, profile: str, cities: int, deadline: float, results) -> None:
+    engine = create_db_engine(url, profile=profile)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    done = errors = 0
+    i = 0
+
+    while time.time() < deadline:
+        city_id = (worker * 7919 + i) % cities + 1
+        try:
+            with Session() as db:
+                if role == "writer":
+                    write_observations(db, [(city_id, START_EPOCH + 900 * (i + worker * 1_000_000), 20.0)])
+                    db.commit()
+                else:
+                    db.execute(observations_query(city_id, START_TIME, START_TIME + timedelta(days=1))).all()
+            done += 1
+        except OperationalError:
+            errors += 1
+        i += 1
+
+    engine.dispose()
+    results.put((role, done, errors))
+
+
+def run_profile(profile: str, directory: Path, seconds: float, writers: int, readers: int, cities: int) -> dict[str, float]:
+    url = f"sqlite:///{directory / f'{profile}.db'}"
+    engine = create_db_engine(url, profile=profile)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add_all(City(name=f"CITY {i}", country_code="SE", latitude=0, longitude=0, interval_hours=0.25) for i in range(cities))
+        db.commit()
+    engine.dispose()
+
+    results = multiprocessing.Queue()
+    deadline = time.time() + 1 + seconds  # One second for the processes to start
+    roles = ["writer"] * writers + ["reader"] * readers
+    processes = [
+        multiprocessing.Process(target=_worker, args=(role, n, url, profile, cities, deadline, results)) for n, role in enumerate(roles)
+    ]
+    for process in processes:
+        process.start()
+
+    totals = {"writes": 0, "reads": 0, "errors": 0}
+    for _ in processes:
+        role, done, errors = results.get()
+        totals["writes" if role == "writer" else "reads"] += done
+        totals["errors"] += errors
+    for process in processes:
+        process.join()
+
+    return {key: value / seconds for key, value in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQLite engine profiles under concurrent reads and writes")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration per profile (default: 5)")
+    parser.add_argument("--writers", type=int, default=4, help="Writer processes (default: 4)")
+    parser.add_argument("--readers", type=int, default=4, help="Reader processes (default: 4)")
+    parser.add_argument("--cities", type=int, default=100, help="Cities to spread writes over (default: 100)")
+    args = parser.parse_args()
+
+    print(f"{'profile':<12} {'writes/s':>10} {'reads/s':>10} {'errors/s':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in ("default", "production"):
+            result = run_profile(profile, Path(directory), args.seconds, args.writers, args.readers, args.cities)
+            print(f"{profile:<12} {result['writes']:>10.0f} {result['reads']:>10.0f} {result['errors']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Open-Meteo geocoding and forecast APIs, with configurable latency and error rate.
+
+Answers are deterministic: a city's coordinates are derived from its name, and the current weather (and the hourly
+series, when 'hourly' is requested) of a location from its coordinates and the time. Point the API at it with
+WEATHER_API_URL and GEOCODE_API_URL.
+
+    python -m benchmarks.fake_open_meteo [--port 8081] [--latency-ms 50] [--jitter-ms 20] [--error-rate 0.01]
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+SLOT_SECONDS = 900
+
+
+def _coordinates(name: str, country_code: str) -> tuple[float, float]:
+    seed = zlib.crc32(f"{name}|{country_code}".encode())
+    return round((seed % 17_000) / 100 - 85, 4), round((seed // 17_000 % 36_000) / 100 - 180, 4)
+
+
+def _utc_time(epoch_seconds: int) -> str:
+    return datetime.fromtimestamp(epoch_seconds, timezone.utc).strftime("%Y-%m-%dT%H:%M")
+
+
+def _temperature(latitude: str, longitude: str, epoch_seconds: int) -> float:
+    return round(zlib.crc32(f"{latitude},{longitude},{epoch_seconds}".encode()) % 6000 / 100 - 20, 1)
+
+
+def _current_weather(latitude: str, longitude: str) -> dict:
+    slot = int(time.time()) // SLOT_SECONDS * SLOT_SECONDS
+    seed = zlib.crc32(f"{latitude},{longitude},{slot}".encode())
+    return {
+        "time": _utc_time(slot),
+        "interval": SLOT_SECONDS,
+        "temperature": _temperature(latitude, longitude, slot),
+        "windspeed": round((seed // 6000 % 400) / 10, 1),
+    }
+
+
+def _hourly(latitude: str, longitude: str, past_hours: int, forecast_hours: int) -> dict:
+    hour = int(time.time()) // 3600 * 3600
+    hours = range(hour - past_hours * 3600, hour + forecast_hours * 3600, 3600)
+    return {"time": [_utc_time(h) for h in hours], "temperature_2m": [_temperature(latitude, longitude, h) for h in hours]}
+
+
+class FakeOpenMeteoServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0, seed: int = 0):
+        super().__init__(address, FakeOpenMeteoHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.requests = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def draw(self) -> tuple[float, bool]:
+        """The delay (seconds) and whether to fail the next request."""
+        with self.random_lock:
+            self.requests += 1
+            delay = max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            return delay, self.random.random() < self.error_rate
+
+
+class FakeOpenMeteoHandler(BaseHTTPRequestHandler):
+    server: FakeOpenMeteoServer
+
+    def do_GET(self):
+        delay, fail = self.server.draw()
+        time.sleep(delay)
+
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if fail:
+            return self._reply(503, {"error": True, "reason": "Injected error"})
+
+        if url.path == "/v1/search":
+            latitude, longitude = _coordinates(params.get("name", ""), params.get("countryCode", ""))
+            return self._reply(200, {"results": [{"id": 1, "name": params.get("name"), "latitude": latitude, "longitude": longitude}]})
+
+        if url.path == "/v1/forecast":
+            latitudes = params.get("latitude", "0").split(",")
+            longitudes = params.get("longitude", "0").split(",")
+            locations = [{"current_weather": _current_weather(lat, lon)} for lat, lon in zip(latitudes, longitudes)]
+            if params.get("hourly"):
+                past_hours, forecast_hours = int(params.get("past_hours", 0)), int(params.get("forecast_hours", 24))
+                for location, lat, lon in zip(locations, latitudes, longitudes):
+                    location["hourly"] = _hourly(lat, lon, past_hours, forecast_hours)
+            # Like Open-Meteo, several locations are answered with a list
+            return self._reply(200, locations if len(locations) > 1 else locations[0])
+
+        self._reply(404, {"error": True, "reason": "Not found"})
+
+    def _reply(self, status: int, body) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_server(
+    host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0, seed: int = 0
+) -> FakeOpenMeteoServer:
+    """Starts the server on a background thread, port 0 picks a free port. Stop it with 'shutdown()'."""
+    server = FakeOpenMeteoServer((host, port), latency_ms, jitter_ms, error_rate, seed)
+    threading.Thread(target=server.serve_forever, name="fake-open-meteo", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Open-Meteo stand-in")
+    parser.add_argument("--host", default="127.0.0.1", help="Host (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8081, help="Port (default: 8081)")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Mean response latency (default: 50)")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="Latency varies uniformly by up to this much (default: 20)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 503 (default: 0)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of latencies and errors (default: 0)")
+    args = parser.parse_args()
+
+    server = FakeOpenMeteoServer((args.host, args.port), args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    print(f"Fake Open-Meteo on {server.url}: WEATHER_API_URL={server.url}/v1/forecast GEOCODE_API_URL={server.url}/v1/search")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
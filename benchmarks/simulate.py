@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Capacity simulation of the scheduler on a virtual clock.
+
+Replays a day (or '--hours') of the city job schedule in minutes. Every job's run times come from the same
+'api.scheduler.city_trigger' as the server's. The execution side is not APScheduler's: the scheduler's thread pool and
+the SQLite write lock are a hand-written event model. It has 'SCHEDULER_MAX_WORKERS' threads taking jobs in order,
+APScheduler's one-instance-per-job rule, and the misfire grace time, checked when a thread picks the job up. A run takes
+a simulated Open-Meteo latency plus its local work.
+
+The local work is measured, not modelled: for a sample of the cities ('--execute-cities') every run calls the real
+'fetch_weather_job' against a temporary SQLite database, with the clock of 'api.weather' set to the virtual time and
+Open-Meteo answered in-process. The other runs draw their local time from these measurements. Local work is counted
+as holding the database write lock, so the write contention reported is an upper bound. The database, clock and
+Open-Meteo patches of 'api.db' and 'api.weather' only last for the run, they are restored when 'simulate' returns.
+
+    python -m benchmarks.simulate [--cities 100000] [--hours 24] [--interval-hours 0.25] [--workers 10] [--latency-ms 50]
+    python app_ctl.py simulate --cities 100000
+"""
+
+import argparse
+import heapq
+import json
+import logging
+import random
+import sys
+import tempfile
+import time
+from collections import deque
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import requests
+from sqlalchemy import func, insert
+from sqlalchemy.orm import sessionmaker
+
+from api import config
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class VirtualClock:
+    """Stands in for the 'time' module of 'api.weather', so slots and cached cell weather follow the virtual time."""
+
+    def __init__(self, now: float):
+        self.now = now
+        self.perf_counter = time.perf_counter
+
+    def time(self) -> float:
+        return self.now
+
+
+class SimulatedOpenMeteo:
+    """Answers 'call_api' in-process with the weather of the virtual slot and any hourly series, failing at 'error_rate'."""
+
+    def __init__(self, clock: VirtualClock, error_rate: float, rng: random.Random):
+        self.clock = clock
+        self.error_rate = error_rate
+        self.rng = rng
+        self.calls = 0
+
+    def __call__(self, url: str, query_params: dict):
+        self.calls += 1
+        if self.rng.random() < self.error_rate:
+            raise requests.HTTPError("Simulated upstream error")
+        slot = int(self.clock.now) // 900 * 900
+        current_weather = {"time": _utc_time(slot), "interval": 900, "temperature": 10.0}
+        data = {"current_weather": current_weather}
+        if query_params.get("past_hours"):
+            hour = int(self.clock.now) // 3600 * 3600
+            hours = range(hour - query_params["past_hours"] * 3600, hour + 3600, 3600)
+            data["hourly"] = {"time": [_utc_time(h) for h in hours], "temperature_2m": [10.0] * len(hours)}
+        return SimpleNamespace(json=lambda: data)
+
+
+def _utc_time(epoch_seconds: int) -> str:
+    return datetime.fromtimestamp(epoch_seconds, timezone.utc).strftime("%Y-%m-%dT%H:%M")
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def _db_bytes(engine, database: Path) -> int:
+    # Checkpointed first, so the size is that of the stored rows rather than of the write-ahead log
+    with engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    return sum(path.stat().st_size for path in database.parent.glob(f"{database.name}*"))
+
+
+def _create_cities(session_factory, args: argparse.Namespace, rng: random.Random) -> list[tuple[int, float]]:
+    from api.db import City, select
+
+    cells = [(rng.uniform(-60, 60), rng.uniform(-180, 180)) for _ in range(args.cells)]
+    rows = []
+    for i in range(args.cities):
+        latitude, longitude = rng.choice(cells) if cells else (rng.uniform(-60, 60), rng.uniform(-180, 180))
+        interval_hours = args.interval_hours[i % len(args.interval_hours)]
+        rows.append({"name": f"SIM CITY {i}", "country_code": "SE", "latitude": latitude, "longitude": longitude, "interval_hours": interval_hours})
+
+    with session_factory() as session:
+        for start in range(0, len(rows), 10_000):
+            session.execute(insert(City), rows[start : start + 10_000])
+        session.commit()
+        return list(session.execute(select(City.id, City.interval_hours).order_by(City.id)))
+
+
+def simulate(args: argparse.Namespace) -> dict:
+    """Runs the simulation and returns its report, the patched modules are restored when it ends."""
+    with ExitStack() as stack:
+        return _simulate(args, stack)
+
+
+def _simulate(args: argparse.Namespace, stack: ExitStack) -> dict:
+    # Imported here, so 'app_ctl.py' does not open the database for its other commands
+    from api import db, scheduler, weather
+    from api.db import Base, WeatherObservation, create_db_engine, select
+
+    rng = random.Random(args.seed)
+    directory = tempfile.TemporaryDirectory(prefix="weather-sim-")
+    database = Path(directory.name) / "simulation.db"
+    engine = create_db_engine(f"sqlite:///{database}")
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    clock = VirtualClock(START.timestamp())
+    upstream = SimulatedOpenMeteo(clock, args.error_rate, random.Random(args.seed + 1))
+
+    # Everything patched for the run is put back afterwards, also when it fails
+    stack.callback(directory.cleanup)
+    stack.callback(engine.dispose)
+    stack.callback(random.setstate, random.getstate())
+    stack.callback(logging.disable, logging.NOTSET)
+    stack.enter_context(patch.multiple(db, engine=engine, SessionLocal=session_factory))
+    stack.enter_context(patch.multiple(weather, time=clock, call_api=upstream))
+    stack.callback(weather.cell_weather.clear)
+
+    # Jitter of the real triggers
+    random.seed(args.seed)
+    logging.disable(logging.ERROR)
+    Base.metadata.create_all(bind=engine)
+    weather.cell_weather.clear()
+
+    wall_start = time.perf_counter()
+    jobs = _create_cities(session_factory, args, rng)
+    executed = {city_id for city_id, _ in rng.sample(jobs, min(args.execute_cities, len(jobs)))}
+    db_before = _db_bytes(engine, database)
+
+    start = START.timestamp()
+    end = start + args.hours * 3600
+    grace = config.SCHEDULER_MISFIRE_GRACE_SECONDS
+    latency = args.latency_ms / 1000
+    jitter = args.jitter_ms / 1000
+
+    # Next fire time of every job, from the real triggers
+    triggers = {}
+    events = []
+    for city_id, interval_hours in jobs:
+        trigger = scheduler.city_trigger(city_id, interval_hours)
+        fire_time = trigger.get_next_fire_time(None, START)
+        triggers[city_id] = trigger
+        events.append((fire_time.timestamp(), city_id, fire_time))
+    heapq.heapify(events)
+
+    free_workers = [start] * args.workers
+    running: list[float] = []  # End times of runs on a thread
+    queued: deque[float] = deque()  # Start times of runs waiting for a thread
+    busy_until: dict[int, float] = {}
+    db_free_at = start
+    local_samples: list[float] = []
+    # Share of the real runs that called Open-Meteo, the rest were current or shared their grid cell's fetch
+    executed_calls = 0
+    upstream_ratio = 1.0
+    counts = {"scheduled": 0, "started": 0, "misfired": 0, "skipped_running": 0, "errors": 0, "upstream_calls": 0, "db_over_busy_timeout": 0}
+    start_delays: list[float] = []
+    write_waits: list[float] = []
+    peak_running = peak_queued = 0
+    busy_seconds = db_busy_seconds = 0.0
+
+    while events and events[0][0] < end:
+        fire_at, city_id, fire_time = heapq.heappop(events)
+        next_time = triggers[city_id].get_next_fire_time(fire_time, fire_time)
+        if next_time is not None:
+            heapq.heappush(events, (next_time.timestamp(), city_id, next_time))
+        counts["scheduled"] += 1
+
+        # APScheduler submits no second instance of a job that is still queued or running
+        if busy_until.get(city_id, 0) > fire_at:
+            counts["skipped_running"] += 1
+            continue
+
+        thread_free_at = heapq.heappop(free_workers)
+        started = max(fire_at, thread_free_at)
+
+        while running and running[0] <= started:
+            heapq.heappop(running)
+        while queued and queued[0] <= fire_at:
+            queued.popleft()
+        if started > fire_at:
+            queued.append(started)
+        peak_queued = max(peak_queued, len(queued))
+
+        if started - fire_at > grace:
+            # The thread drops the run as soon as it picks it up
+            counts["misfired"] += 1
+            heapq.heappush(free_workers, started)
+            busy_until[city_id] = started
+            continue
+
+        counts["started"] += 1
+        start_delays.append(started - fire_at)
+
+        if city_id in executed:
+            clock.now = started
+            calls = upstream.calls
+            local_start = time.perf_counter()
+            result = weather.fetch_weather_job(city_id)
+            local = time.perf_counter() - local_start
+            local_samples.append(local)
+            called = upstream.calls > calls
+            failed = result is False
+            executed_calls += called
+            upstream_ratio = executed_calls / len(local_samples)
+        else:
+            local = local_samples[rng.randrange(len(local_samples))] if local_samples else 0.001
+            called = rng.random() < upstream_ratio
+            failed = called and rng.random() < args.error_rate
+
+        counts["upstream_calls"] += called
+        counts["errors"] += failed
+        ready = started + (max(0.0, rng.uniform(latency - jitter, latency + jitter)) if called else 0.0)
+        if failed:
+            finished = ready
+        else:
+            acquired = max(ready, db_free_at)
+            write_waits.append(acquired - ready)
+            if acquired - ready > config.SQLITE_BUSY_TIMEOUT_MS / 1000:
+                counts["db_over_busy_timeout"] += 1
+            db_free_at = finished = acquired + local
+            db_busy_seconds += local
+
+        busy_seconds += finished - started
+        heapq.heappush(free_workers, finished)
+        heapq.heappush(running, finished)
+        peak_running = max(peak_running, len(running))
+        busy_until[city_id] = finished
+
+    with session_factory() as session:
+        stored = session.execute(select(func.count()).select_from(WeatherObservation)).scalar()
+    db_after = _db_bytes(engine, database)
+
+    growth = db_after - db_before
+    return {
+        "config": {
+            **{key: value for key, value in vars(args).items() if key not in ("output", "command", "host", "port")},
+            "misfire_grace_seconds": grace,
+            "jitter_seconds": config.SCHEDULER_JITTER_SECONDS,
+            "grid_resolution_deg": config.GRID_RESOLUTION_DEG,
+        },
+        "wall_seconds": round(time.perf_counter() - wall_start, 1),
+        "runs": counts,
+        "concurrency": {
+            "peak_running": peak_running,
+            "peak_queued": peak_queued,
+            "thread_utilization": round(busy_seconds / (args.workers * (end - start)), 4),
+            "start_delay_p50_ms": round(_percentile(start_delays, 0.5) * 1000, 2),
+            "start_delay_p99_ms": round(_percentile(start_delays, 0.99) * 1000, 2),
+            "start_delay_max_ms": round(max(start_delays, default=0) * 1000, 2),
+        },
+        "write_contention": {
+            "db_utilization": round(db_busy_seconds / (end - start), 4),
+            "wait_p50_ms": round(_percentile(write_waits, 0.5) * 1000, 2),
+            "wait_p99_ms": round(_percentile(write_waits, 0.99) * 1000, 2),
+            "wait_max_ms": round(max(write_waits, default=0) * 1000, 2),
+            "local_work_p50_ms": round(_percentile(local_samples, 0.5) * 1000, 3),
+            "local_work_p99_ms": round(_percentile(local_samples, 0.99) * 1000, 3),
+        },
+        "storage": {
+            "executed_cities": len(executed),
+            "stored_observations": stored,
+            "growth_bytes": growth,
+            # The sampled cities' growth, scaled to every city
+            "projected_growth_bytes": round(growth * len(jobs) / len(executed)),
+            "projected_bytes_per_day": round(growth * len(jobs) / len(executed) * 24 / args.hours),
+        },
+    }
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--cities", type=int, default=100_000, help="Scheduled cities (default: 100000)")
+    parser.add_argument("--hours", type=float, default=24, help="Virtual hours to replay (default: 24)")
+    parser.add_argument("--interval-hours", type=float, nargs="+", default=[0.25], help="Job intervals, given to the cities in turn (default: 0.25)")
+    parser.add_argument("--workers", type=int, default=config.SCHEDULER_MAX_WORKERS, help="Scheduler threads (default: SCHEDULER_MAX_WORKERS)")
+    parser.add_argument("--cells", type=int, default=0, help="Place the cities in this many grid cells, 0 spreads them out, shared with GRID_RESOLUTION_DEG set (default: 0)")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Mean simulated Open-Meteo latency (default: 50)")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="Simulated latency variation (default: 20)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of simulated Open-Meteo calls that fail (default: 0)")
+    parser.add_argument("--execute-cities", type=int, default=100, help="Cities whose runs call the real fetch job (default: 100)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--output", type=str, help="Optional file the JSON report is written to")
+
+
+def run(args: argparse.Namespace) -> int:
+    report = simulate(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Virtual-clock capacity simulation of the scheduler")
+    add_arguments(parser)
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,10 @@ import pytest
 from requests import RequestException
 from sqlalchemy.pool import StaticPool
 
+from api.cache import geocode_cache, response_cache
 from api.db import Base, City, WeatherObservation, create_engine, sessionmaker
-from api.weather import GEOCODE_API, WEATHER_API
+from api.logging import shutdown_logging
+from api.weather import GEOCODE_API, WEATHER_API, cell_weather, observation_writer
 
 TEST_SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
 test_engine = create_engine(TEST_SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool)
@@ -31,26 +33,37 @@ def mock_call_api(url: str, params: dict):
         return MockResponseObject()
     if url == GEOCODE_API:
         return MockResponseObject(GEOCODE_API_EXAMPLE_RESPONSE)
+    if url == WEATHER_API and "," in str(params.get("latitude")):
+        locations = str(params["latitude"]).split(",")
+        return MockResponseObject([WEATHER_API_EXAMPLE_RESPONSE for _ in locations])
     if url == WEATHER_API:
         return MockResponseObject(WEATHER_API_EXAMPLE_RESPONSE)
     raise ValueError("Something went wrong!")
 
 
+async def mock_call_api_async(url: str, params: dict):
+    return mock_call_api(url, params)
+
+
 @pytest.fixture(scope="function")
 def in_memory_test_db(monkeypatch):
     monkeypatch.setattr("api.db.engine", test_engine)
     monkeypatch.setattr("api.db.SessionLocal", TestingSessionLocal)
 
     Base.metadata.create_all(bind=test_engine)
+    geocode_cache.clear()
+    response_cache.clear()
+    cell_weather.clear()
 
     try:
         db = TestingSessionLocal()
         city_1 = City(name="NEW YORK", country_code="US", latitude=0.5, longitude=-0.5, interval_hours=0.25)
         city_2 = City(name="STOCKHOLM", country_code="SE", latitude=0.3, longitude=0.2, interval_hours=0.5)
 
-        now = datetime.now(timezone.utc).isoformat()
-        obs_1 = WeatherObservation(city_id=1, temperature_c=9, utc_iso_time=now)
-        obs_2 = WeatherObservation(city_id=2, temperature_c=9, utc_iso_time=now)
+        # An hour old, so fetches for the cities are due
+        observed_at = int(datetime.now(timezone.utc).timestamp()) - 3600
+        obs_1 = WeatherObservation(city_id=1, temperature_c=9, observed_at=observed_at)
+        obs_2 = WeatherObservation(city_id=2, temperature_c=9, observed_at=observed_at)
 
         db.add_all([city_1, city_2, obs_1, obs_2])
         db.commit()
@@ -60,16 +73,20 @@ def in_memory_test_db(monkeypatch):
 
     yield  # Run the test
 
-    # Teardown on test finish
+    # Teardown on test finish, queued rows are written before the tables go away
+    observation_writer.stop()
+    shutdown_logging()
     Base.metadata.drop_all(bind=test_engine)
 
 
 @pytest.fixture(scope="function")
 def mock_external_api_requests(monkeypatch):
     monkeypatch.setattr("api.weather.call_api", mock_call_api)
+    monkeypatch.setattr("api.weather.call_api_async", mock_call_api_async)
 
 
 @pytest.fixture(scope="function")
 def mock_scheduler(monkeypatch):
     dummy_scheduler = Mock()
+    dummy_scheduler.get_jobs.return_value = []
     monkeypatch.setattr("api.scheduler.scheduler", dummy_scheduler)
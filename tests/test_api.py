@@ -1,14 +1,23 @@
-from datetime import datetime
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
 
 import pytest
 from fastapi.testclient import TestClient
 
+from api.archive import archive_observations
+from api.db import WeatherObservation, get_db
 from api.main import app
+from api.rollups import rebuild_rollups
+from api.weather import _store_observation
 
 
 @pytest.fixture(scope="function")
 def client(in_memory_test_db, mock_external_api_requests, mock_scheduler):
     with TestClient(app) as c:
+        # The test database has a single connection, tests start once the job schedule is reconciled
+        app.state.job_reconciler.join()
         yield c
 
 
@@ -72,6 +81,34 @@ def test_create_city_job(client: TestClient):
     assert response.status_code == 500
 
 
+def test_get_stats(client: TestClient):
+    before = client.get("/stats/").json()["geocode_cache"]
+
+    # The second lookup of a not-found city is answered by the cache
+    test_city = {"name": "NOT FOUND", "country_code": "SE"}
+    assert client.post("/job/", json=test_city).status_code == 404
+    assert client.post("/job/", json=test_city).status_code == 404
+
+    response = client.get("/stats/")
+    assert response.status_code == 200
+    after = response.json()["geocode_cache"]
+    assert after["misses"] - before["misses"] == 1
+    assert after["memory_hits"] - before["memory_hits"] == 1
+
+
+def test_get_schedule_load(client: TestClient):
+    response = client.get("/jobs/load", params={"seconds": 3600})
+    assert response.status_code == 200
+    load = response.json()
+    # New York runs every 15 minutes, Stockholm every 30 minutes, at different offsets
+    assert load["jobs"] == 2
+    assert len(load["load"]) == 3600
+    assert sum(load["load"]) == 4 + 2
+    assert load["peak"] == 1
+
+    assert client.get("/jobs/load", params={"seconds": 0}).status_code == 422
+
+
 def test_update_city_job(client: TestClient):
     # Get existing New York city
     response = client.get("/job/1")
@@ -120,6 +157,60 @@ def test_get_city_jobs(client: TestClient):
     assert len(result) == 2
 
 
+def test_create_city_jobs_bulk(client: TestClient, monkeypatch):
+    # The in-memory test database is a single shared connection, so lookups must not overlap
+    monkeypatch.setattr("api.config.BULK_GEOCODE_WORKERS", 1)
+    cities = [
+        {"name": "Gothenburg", "country_code": "se", "interval_hours": 1.0},
+        {"name": "stockholm", "country_code": "SE"},
+        {"name": "NOT FOUND", "country_code": "SE"},
+        {"name": "RAISE EXCEPTION", "country_code": "SE"},
+        {"name": "GOTHENBURG", "country_code": "SE"},
+        {"name": "MALMO", "country_code": "SE"},
+    ]
+    response = client.post("/jobs/bulk", json={"cities": cities})
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["status"] for result in results] == ["created", "exists", "not_found", "error", "duplicate", "created"]
+    assert [result["id"] for result in results] == [3, 2, None, None, None, 4]
+
+    jobs = client.get("/jobs/").json()
+    assert [(job["name"], job["interval_hours"]) for job in jobs[2:]] == [("GOTHENBURG", 1.0), ("MALMO", 2.0)]
+
+    assert client.post("/jobs/bulk", json={"cities": []}).status_code == 422
+
+
+def test_job_response_cache(client: TestClient):
+    before = client.get("/stats/").json()["response_cache"]
+    response = client.get("/jobs/")
+    etag = response.headers["ETag"]
+
+    # Unchanged jobs are served from the cache, and a poller that has the current ETag gets no body
+    assert client.get("/jobs/").json() == response.json()
+    response = client.get("/jobs/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert client.get("/job/1", headers={"If-None-Match": client.get("/job/1").headers["ETag"]}).status_code == 304
+
+    # Every change invalidates the list and the changed job
+    assert client.put("/job/1", json={"interval_hours": 1.0}).status_code == 200
+    response = client.get("/jobs/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()[0]["interval_hours"] == 1.0
+    assert client.get("/job/1").json()["interval_hours"] == 1.0
+
+    assert client.delete("/job/2").status_code == 200
+    assert client.get("/job/2").status_code == 404
+    assert len(client.get("/jobs/").json()) == 1
+    assert client.post("/job/", json={"name": "STOCKHOLM", "country_code": "SE"}).status_code == 200
+    assert len(client.get("/jobs/").json()) == 2
+
+    after = client.get("/stats/").json()["response_cache"]
+    assert after["hits"] - before["hits"] == 3
+    assert after["not_modified"] - before["not_modified"] == 2
+    assert 0 < after["hit_ratio"] < 1
+
+
 def test_get_city_temperatures(client: TestClient):
     # Test getting weather reports
     data = {"city_id": 1, "temperature_unit": "C", "timezone": "Europe/Stockholm"}
@@ -159,3 +250,192 @@ def test_get_city_temperatures(client: TestClient):
     data = {"city_id": 1, "temperature_unit": "C", "timezone": "Invalid/Timezone"}
     response = client.post("/reports/", json=data)
     assert response.status_code == 422
+
+
+def test_get_city_temperatures_time_range_and_pagination(client: TestClient):
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    db = get_db()
+    try:
+        db.add_all(
+            WeatherObservation(city_id=2, temperature_c=i, observed_at=int((start + timedelta(minutes=15 * i)).timestamp()))
+            for i in range(10)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    # Time bounds: start is inclusive, end is exclusive, naive datetimes are UTC
+    data = {"city_id": 2, "start": "2025-01-01T00:30:00", "end": "2025-01-01T01:30:00+00:00"}
+    response = client.post("/reports/", json=data)
+    assert response.status_code == 200
+    assert [obs["temperature"] for obs in response.json()] == [2, 3, 4, 5]
+    assert "X-Next-Cursor" not in response.headers
+
+    # Walk all pages of the range
+    data = {"city_id": 2, "start": "2025-01-01T00:00:00Z", "end": "2025-01-02T00:00:00Z", "limit": 4}
+    temperatures = []
+    while True:
+        response = client.post("/reports/", json=data)
+        assert response.status_code == 200
+        temperatures += [obs["temperature"] for obs in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        data["cursor"] = response.headers["X-Next-Cursor"]
+    assert temperatures == list(range(10))
+
+    # Test sending a malformed cursor
+    data = {"city_id": 2, "cursor": "not-a-cursor"}
+    response = client.post("/reports/", json=data)
+    assert response.status_code == 422
+
+    # Test a range without observations
+    data = {"city_id": 2, "start": "2024-01-01T00:00:00Z", "end": "2024-01-02T00:00:00Z"}
+    response = client.post("/reports/", json=data)
+    assert response.status_code == 404
+
+
+def test_export_city_temperatures(client: TestClient, monkeypatch):
+    # Several chunks per export
+    monkeypatch.setattr("api.config.EXPORT_CHUNK_SIZE", 3)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    db = get_db()
+    try:
+        db.add_all(
+            WeatherObservation(city_id=2, temperature_c=i, observed_at=int((start + timedelta(hours=i)).timestamp()))
+            for i in range(10)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    data = {"city_id": 2, "temperature_unit": "F", "timezone": "Europe/Stockholm", "end": "2025-01-02T00:00:00Z"}
+    response = client.post("/reports/export", json=data)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["temperature"] for row in rows] == [celsius * 1.8 + 32 for celsius in range(10)]
+    assert rows[0]["timestamp"] == "2025-01-01T01:00:00+01:00"
+    assert rows[0]["city_id"] == 2
+
+    # The same rows as CSV, with a header
+    data["format"] = "csv"
+    response = client.post("/reports/export", json=data)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    csv_rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(csv_rows) == 10
+    assert csv_rows[0]["timestamp"] == rows[0]["timestamp"]
+    assert float(csv_rows[-1]["temperature"]) == rows[-1]["temperature"]
+
+    # Test exporting non-existing weather reports
+    response = client.post("/reports/export", json={"city_id": 9999})
+    assert response.status_code == 404
+
+    # Test sending an unknown format
+    response = client.post("/reports/export", json={"city_id": 2, "format": "xml"})
+    assert response.status_code == 422
+
+
+def test_get_city_aggregates(client: TestClient):
+    db = get_db()
+    try:
+        for time, temperature in [("2025-01-01T10:00", 1.0), ("2025-01-01T10:15", 3.0), ("2025-01-01T23:45", -4.0), ("2025-01-02T00:00", 8.0)]:
+            _store_observation(db, 2, {"time": time, "temperature": temperature})
+        db.commit()
+    finally:
+        db.close()
+
+    data = {"city_id": 2, "period": "day", "end": "2025-02-01T00:00:00Z"}
+    response = client.post("/aggregates/", json=data)
+    assert response.status_code == 200
+    days = response.json()
+    assert [(day["count"], day["min"], day["max"], day["mean"]) for day in days] == [(3, -4.0, 3.0, 0.0), (1, 8.0, 8.0, 8.0)]
+    assert days[0]["bucket_start"] == "2025-01-01T00:00:00Z"
+
+    data = {"city_id": 2, "period": "hour", "end": "2025-02-01T00:00:00Z", "temperature_unit": "F", "timezone": "Europe/Stockholm"}
+    hours = client.post("/aggregates/", json=data).json()
+    assert len(hours) == 3
+    assert hours[0]["bucket_start"] == "2025-01-01T11:00:00+01:00"
+    assert (hours[0]["min"], hours[0]["max"], hours[0]["mean"]) == (33.8, 37.4, 35.6)
+
+    # Rebuilding from the observations gives the same rollups as the incremental updates
+    data = {"city_id": 2, "period": "month"}
+    months = client.post("/aggregates/", json=data).json()
+    db = get_db()
+    try:
+        rebuild_rollups(db)
+    finally:
+        db.close()
+    assert client.post("/aggregates/", json=data).json() == months
+
+    # Test getting non-existing aggregates
+    response = client.post("/aggregates/", json={"city_id": 9999})
+    assert response.status_code == 404
+
+    # Test sending an unknown period
+    response = client.post("/aggregates/", json={"city_id": 2, "period": "week"})
+    assert response.status_code == 422
+
+
+def test_export_archived_temperatures(client: TestClient, tmp_path, monkeypatch):
+    monkeypatch.setattr("api.config.ARCHIVE_DIR", str(tmp_path))
+    data = {"city_id": 2, "temperature_unit": "F", "format": "csv"}
+    assert client.post("/reports/archive", json=data).status_code == 404
+
+    # Everything older than a minute, the fixture's observation included
+    archive_observations(int(datetime.now(timezone.utc).timestamp()) - 60)
+    assert client.post("/reports/export", json=data).status_code == 404
+
+    response = client.post("/reports/archive", json=data)
+    assert response.status_code == 200
+    csv_rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [(row["city_id"], float(row["temperature"])) for row in csv_rows] == [("2", 9 * 1.8 + 32)]
+
+
+def test_export_columnar_temperatures(client: TestClient, monkeypatch):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.setattr("api.config.EXPORT_CHUNK_SIZE", 3)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    db = get_db()
+    try:
+        db.add_all(
+            WeatherObservation(city_id=city_id, temperature_c=i + 0.25, observed_at=int((start + timedelta(hours=i)).timestamp()))
+            for city_id in (1, 2)
+            for i in range(5)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    data = {"city_ids": [1, 2], "temperature_unit": "F", "timezone": "Europe/Stockholm", "end": "2025-01-02T00:00:00Z"}
+    response = client.post("/reports/columnar", json=data)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column("city_id").to_pylist() == [1] * 5 + [2] * 5
+    assert table.column("temperature").to_pylist()[:5] == [round((i + 0.25) * 1.8 + 32, 2) for i in range(5)]
+    assert table.column("timestamp").to_pylist()[0].isoformat() == "2025-01-01T01:00:00+01:00"
+    assert table.schema.metadata[b"temperature_unit"] == b"F"
+
+    # The same rows as Parquet, which stores second timestamps as milliseconds
+    data["format"] = "parquet"
+    response = client.post("/reports/columnar", json=data)
+    assert response.status_code == 200
+    assert pq.read_table(io.BytesIO(response.content)).to_pylist() == table.to_pylist()
+
+    assert client.post("/reports/columnar", json={"city_ids": [99]}).status_code == 404
+    monkeypatch.setattr("api.columnar.pa", None)
+    assert client.post("/reports/columnar", json=data).status_code == 501
+
+
+def test_metrics(client: TestClient):
+    client.get("/job/1")
+    client.get("/job/2")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    # Requests are labeled by their route template, not by the path
+    assert 'weather_http_request_seconds_count{method="GET",route="/job/{city_id}"}' in response.text
+    assert "/job/1" not in response.text
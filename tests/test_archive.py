@@ -0,0 +1,140 @@
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from api.archive import archive_logs, archive_observations, archived_until, iter_archived_observations, run_retention
+from api.db import LEGACY_OBSERVATIONS, Log, WeatherObservation, WeatherRollup, get_db, select
+from api.rollups import rebuild_rollups
+
+
+def _add_observations(city_id: int, start: datetime, count: int) -> None:
+    db = get_db()
+    try:
+        db.add_all(
+            WeatherObservation(city_id=city_id, temperature_c=i / 2, observed_at=int((start + timedelta(days=i)).timestamp()))
+            for i in range(count)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_archive_observations(in_memory_test_db, tmp_path, monkeypatch):
+    monkeypatch.setattr("api.config.ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr("api.config.RETENTION_BATCH_PAUSE_MS", 0)
+    # January 20th to February 8th
+    _add_observations(2, datetime(2025, 1, 20, tzinfo=timezone.utc), 20)
+    cutoff = int(datetime(2025, 2, 5, tzinfo=timezone.utc).timestamp())
+
+    # Several batches, partitioned by month and city
+    assert archive_observations(cutoff, batch_size=4) == 16
+    assert sorted(path.relative_to(tmp_path).as_posix() for path in tmp_path.rglob("*.gz")) == [
+        "observations/2025-01/city_2.ndjson.gz",
+        "observations/2025-02/city_2.ndjson.gz",
+    ]
+
+    db = get_db()
+    try:
+        remaining = db.execute(select(WeatherObservation.observed_at).where(WeatherObservation.city_id == 2)).scalars().all()
+    finally:
+        db.close()
+    # The four newest and the fixture's recent observation stay in the database
+    assert len(remaining) == 5
+    assert min(remaining) >= cutoff
+
+    rows = [row for chunk in iter_archived_observations(2) for row in chunk]
+    assert [temperature for _, _, temperature in rows] == [i / 2 for i in range(16)]
+
+    # A batch that is archived again, e.g. after a crash before its delete, is read once
+    with gzip.open(tmp_path / "observations/2025-01/city_2.ndjson.gz", "at", encoding="utf-8") as file:
+        file.write(json.dumps({"id": rows[0][0], "city_id": 2, "observed_at": rows[0][1], "temperature_c": rows[0][2]}) + "\n")
+
+    start = int(datetime(2025, 1, 25, tzinfo=timezone.utc).timestamp())
+    end = int(datetime(2025, 2, 2, tzinfo=timezone.utc).timestamp())
+    assert len([row for chunk in iter_archived_observations(2) for row in chunk]) == 16
+    assert [temperature for chunk in iter_archived_observations(2, start, end) for _, _, temperature in chunk] == [i / 2 for i in range(5, 13)]
+    assert list(iter_archived_observations(1)) == []
+
+
+def test_rebuild_rollups_keeps_archived_buckets(in_memory_test_db, tmp_path, monkeypatch):
+    monkeypatch.setattr("api.config.ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr("api.config.RETENTION_BATCH_PAUSE_MS", 0)
+    # January 20th to March 10th
+    _add_observations(2, datetime(2025, 1, 20, tzinfo=timezone.utc), 50)
+    january = int(datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp())
+    february = int(datetime(2025, 2, 1, tzinfo=timezone.utc).timestamp())
+    march = int(datetime(2025, 3, 1, tzinfo=timezone.utc).timestamp())
+
+    def month_counts() -> dict[int, int]:
+        stmt = select(WeatherRollup.bucket_start, WeatherRollup.count).where(
+            WeatherRollup.city_id == 2, WeatherRollup.period == "month", WeatherRollup.bucket_start < march
+        )
+        return dict(db.execute(stmt).tuples().all())
+
+    db = get_db()
+    try:
+        assert archived_until() is None
+        rebuild_rollups(db)
+        assert month_counts() == {january: 12, february: 28}
+
+        assert archive_observations(int(datetime(2025, 2, 5, tzinfo=timezone.utc).timestamp())) == 16
+        # February is archived in part, its remaining rows are not counted twice
+        assert archived_until() == march
+
+        # e.g. rebuilt by a migration after the rows were archived
+        rebuild_rollups(db)
+        assert month_counts() == {january: 12, february: 28}
+        day = db.execute(
+            select(WeatherRollup.count).where(WeatherRollup.period == "day", WeatherRollup.bucket_start == january + 19 * 86400)
+        ).scalar_one()
+        assert day == 1
+    finally:
+        db.close()
+
+
+def test_retention_waits_for_legacy_copy(in_memory_test_db, tmp_path, monkeypatch):
+    monkeypatch.setattr("api.config.ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr("api.config.OBSERVATION_RETENTION_DAYS", 30)
+    monkeypatch.setattr("api.config.RETENTION_BATCH_PAUSE_MS", 0)
+    _add_observations(2, datetime(2025, 1, 20, tzinfo=timezone.utc), 5)
+
+    db = get_db()
+    try:
+        db.execute(text(f"CREATE TABLE {LEGACY_OBSERVATIONS} (id INTEGER PRIMARY KEY)"))
+        db.commit()
+        run_retention()
+        assert archived_until() is None
+
+        db.execute(text(f"DROP TABLE {LEGACY_OBSERVATIONS}"))
+        db.commit()
+        run_retention()
+        assert archived_until() == int(datetime(2025, 2, 1, tzinfo=timezone.utc).timestamp())
+    finally:
+        db.close()
+
+
+def test_archive_logs(in_memory_test_db, tmp_path, monkeypatch):
+    monkeypatch.setattr("api.config.ARCHIVE_DIR", str(tmp_path))
+    now = datetime.now()
+    db = get_db()
+    try:
+        db.add_all(Log(timestamp=now - timedelta(days=days), level="WARNING", message=f"{days} days old") for days in (1, 40, 41))
+        db.commit()
+    finally:
+        db.close()
+
+    assert archive_logs(now - timedelta(days=30)) == 2
+
+    db = get_db()
+    try:
+        assert db.execute(select(Log.message)).scalars().all() == ["1 days old"]
+    finally:
+        db.close()
+
+    messages = []
+    for path in (tmp_path / "logs").glob("*.ndjson.gz"):
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            messages += [json.loads(line)["message"] for line in file]
+    assert sorted(messages) == ["40 days old", "41 days old"]
@@ -0,0 +1,104 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from api.db import Base, WeatherObservation, WeatherRollup, create_db_engine, select
+from api.migrations import copy_legacy_observations, dedupe_observations, prepare_observation_migration
+
+
+def test_create_db_engine_profiles(tmp_path):
+    production = create_db_engine(f"sqlite:///{tmp_path / 'production.db'}", profile="production")
+    with production.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert connection.execute(text("PRAGMA cache_size")).scalar() == -20_000
+    assert production.pool.size() == 15
+
+    default = create_db_engine(f"sqlite:///{tmp_path / 'default.db'}", profile="default")
+    with default.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "delete"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 2  # FULL
+
+    production.dispose()
+    default.dispose()
+
+
+def test_migrate_legacy_observations(in_memory_test_db, tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'legacy.db'}", profile="default")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE cities (id INTEGER PRIMARY KEY, name VARCHAR, country_code VARCHAR, latitude FLOAT, longitude FLOAT, interval_hours FLOAT)"))
+        connection.execute(text("CREATE TABLE weather_observations (id INTEGER PRIMARY KEY, city_id INTEGER, utc_iso_time VARCHAR, temperature_c FLOAT)"))
+        connection.execute(text("CREATE INDEX ix_weather_observations_city_id ON weather_observations (city_id)"))
+        connection.execute(text("INSERT INTO cities VALUES (1, 'STOCKHOLM', 'SE', 0, 0, 1)"))
+        connection.execute(
+            text(
+                "INSERT INTO weather_observations (city_id, utc_iso_time, temperature_c) VALUES "
+                "(1, '2025-01-01T10:00:00+00:00', 1.5), (1, '2025-01-01T10:15:00.123456+00:00', 17.63), (1, '2025-01-01T23:45:00', -4.0)"
+            )
+        )
+
+    assert prepare_observation_migration(engine) == 1
+
+    # Only the newest row is copied at startup, new rows get ids after every legacy id
+    with Session(engine) as db:
+        assert db.execute(select(WeatherObservation.id)).scalars().all() == [3]
+        db.add(WeatherObservation(city_id=1, observed_at=1735776000, temperature_c=8.0))
+        db.commit()
+
+    assert copy_legacy_observations(engine, batch_size=1, copied=1) == 3
+    with Session(engine) as db:
+        rows = db.execute(select(WeatherObservation.id, WeatherObservation.observed_at, WeatherObservation.temperature_c)).all()
+        assert [tuple(row) for row in rows] == [(1, 1735725600, 1.5), (2, 1735726500, 17.63), (3, 1735775100, -4.0), (4, 1735776000, 8.0)]
+        assert db.execute(select(WeatherRollup.count).where(WeatherRollup.period == "month")).scalar() == 4
+    assert not inspect(engine).has_table("weather_observations_legacy")
+
+    # An up to date database is left as it is
+    assert not prepare_observation_migration(engine)
+    engine.dispose()
+
+
+def test_migrate_legacy_observations_with_duplicates(in_memory_test_db, tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'legacy_duplicates.db'}", profile="default")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE weather_observations (id INTEGER PRIMARY KEY, city_id INTEGER, utc_iso_time VARCHAR, temperature_c FLOAT)"))
+        # 20 unique (city, time) pairs, half of them stored twice, the newer row a degree warmer
+        for minute in range(20):
+            for extra in range(2 if minute % 2 else 1):
+                connection.execute(
+                    text("INSERT INTO weather_observations (city_id, utc_iso_time, temperature_c) VALUES (1, :time, :temperature)"),
+                    {"time": f"2025-01-01T10:{minute:02d}:00+00:00", "temperature": minute + extra},
+                )
+
+    assert prepare_observation_migration(engine) == 1
+
+    # Batches that are partly duplicates copy fewer rows than their size, the copy still goes on to the end.
+    # Of two rows with the same time the newest is kept, like 'dedupe_observations' does.
+    assert copy_legacy_observations(engine, batch_size=4, copied=1) == 20
+    with Session(engine) as db:
+        rows = db.execute(select(WeatherObservation.observed_at, WeatherObservation.temperature_c).order_by(WeatherObservation.observed_at)).all()
+        assert [tuple(row) for row in rows] == [(1735725600 + minute * 60, minute + minute % 2) for minute in range(20)]
+    assert not inspect(engine).has_table("weather_observations_legacy")
+    engine.dispose()
+
+
+def test_dedupe_observations(in_memory_test_db, tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'duplicates.db'}", profile="default")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE weather_observations (id INTEGER PRIMARY KEY, city_id INTEGER, observed_at INTEGER, temperature_c INTEGER)"))
+        connection.execute(text("CREATE INDEX ix_weather_observations_city_id_observed_at ON weather_observations (city_id, observed_at)"))
+        connection.execute(text("INSERT INTO weather_observations (city_id, observed_at, temperature_c) VALUES (1, 900, 150), (1, 900, 160), (1, 1800, 200), (2, 900, 150)"))
+
+    Base.metadata.create_all(bind=engine)  # Leaves the existing observations table as it is
+    assert dedupe_observations(engine) == 1
+    for index in WeatherObservation.__table__.indexes:
+        index.create(bind=engine)
+    indexes = {index["name"]: index["unique"] for index in inspect(engine).get_indexes("weather_observations")}
+    assert indexes["uq_weather_observations_city_id_observed_at"]
+    assert "ix_weather_observations_city_id_observed_at" not in indexes
+    with Session(engine) as db:
+        # The newest of the duplicates is kept
+        assert db.execute(select(WeatherObservation.id)).scalars().all() == [2, 3, 4]
+        assert db.execute(select(WeatherRollup.count).where(WeatherRollup.city_id == 1, WeatherRollup.period == "month")).scalar() == 2
+
+    assert dedupe_observations(engine) == 0
+    engine.dispose()
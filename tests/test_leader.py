@@ -0,0 +1,52 @@
+from fastapi.testclient import TestClient
+
+from api import scheduler
+from api.db import SchedulerLease, get_db, select
+from api.leader import LeaderElection, take_job_events
+from api.main import app
+
+
+def test_leader_election_and_failover(in_memory_test_db):
+    events = []
+    first = LeaderElection("test", lambda: events.append("first elected"), lambda: events.append("first demoted"))
+    second = LeaderElection("test", lambda: events.append("second elected"), lambda: events.append("second demoted"))
+
+    first.heartbeat()
+    second.heartbeat()
+    first.heartbeat()
+    assert (first.is_leader, second.is_leader) == (True, False)
+
+    # The leader stops renewing (e.g. the process died), the lease expires and another process takes over
+    db = get_db()
+    try:
+        db.execute(select(SchedulerLease).where(SchedulerLease.name == "test")).scalar().expires_at = 0
+        db.commit()
+    finally:
+        db.close()
+    second.heartbeat()
+    first.heartbeat()
+    assert (first.is_leader, second.is_leader) == (False, True)
+
+    # Stopping releases the lease right away
+    second.stop()
+    first.heartbeat()
+    assert first.is_leader
+    assert events == ["first elected", "second elected", "first demoted", "second demoted", "first elected"]
+
+
+def test_follower_publishes_job_changes(in_memory_test_db, mock_external_api_requests, mock_scheduler, monkeypatch):
+    monkeypatch.setattr("api.config.LEADER_ELECTION", True)
+    # A worker that never wins the election
+    monkeypatch.setattr("api.main.LeaderElection.start", lambda self: None)
+
+    with TestClient(app) as client:
+        city = client.post("/job/", json={"name": "GOTHENBURG", "country_code": "SE", "interval_hours": 1.0}).json()
+        assert client.put(f"/job/{city['id']}", json={"interval_hours": 2.0}).status_code == 200
+        assert client.delete("/job/1").status_code == 200
+        assert client.get("/stats/").json()["scheduler"] == {"leader_election": True, "leader": False}
+
+    # Only the leader changes the schedule, it gets the latest change per city
+    scheduler.scheduler.add_job.assert_not_called()
+    scheduler.scheduler.remove_job.assert_not_called()
+    assert take_job_events() == {city["id"]: 2.0, 1: None}
+    assert take_job_events() == {}
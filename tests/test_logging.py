@@ -0,0 +1,107 @@
+import threading
+from unittest.mock import Mock
+
+from api.batching import BatchWriter
+from api.db import Log, get_db, select
+from api.logging import get_logger, log_writer, shutdown_logging
+
+
+def test_db_handler_writes_in_batches(in_memory_test_db):
+    logger = get_logger("tests.logging")
+    flushes = log_writer.stats["flushes"]
+
+    for i in range(20):
+        logger.warning(f"batched record {i}")
+    logger.info("not stored, below WARNING")
+
+    # Nothing is written on the logging thread, shutdown flushes what is queued
+    shutdown_logging()
+    db = get_db()
+    try:
+        messages = db.execute(select(Log.message).where(Log.message.contains("record"))).scalars().all()
+    finally:
+        db.close()
+
+    assert len(messages) == 20
+    assert messages[0].endswith("batched record 0")
+    assert log_writer.stats["flushes"] - flushes < 20
+
+
+def test_batch_writer_drop_policy():
+    release = threading.Event()
+    flushed = []
+
+    def flush(batch):
+        release.wait(timeout=5)
+        flushed.extend(batch)
+
+    for drop_policy, expected in [("newest", [0, 1, 2]), ("oldest", [0, 2, 3])]:
+        release.clear()
+        flushed.clear()
+        writer = BatchWriter("test-writer", flush, batch_size=1, flush_interval=0.01, max_queue=2, drop_policy=drop_policy)
+
+        # The first item is taken by the (blocked) writer thread, the next two fill the queue
+        assert writer.put(0)
+        while writer.queue_depth:
+            pass
+        assert writer.put(1)
+        assert writer.put(2)
+        assert not writer.put(3)
+        assert writer.stats["dropped"] == 1
+
+        release.set()
+        writer.stop()
+        assert flushed == expected
+
+
+def test_batch_writer_put_while_stopping():
+    release = threading.Event()
+    flushed = []
+
+    def flush(batch):
+        release.wait(timeout=5)
+        flushed.extend(batch)
+
+    writer = BatchWriter("test-stopping-writer", flush, batch_size=1, flush_interval=0.01, max_queue=10)
+    writer.put(0)
+    while writer.queue_depth:
+        pass
+
+    stopper = threading.Thread(target=writer.stop)
+    stopper.start()
+    while not writer._stopping:
+        pass
+
+    # A put during the stop queues its item without starting a second writer thread
+    writer.put(1)
+    assert writer._thread is None
+    release.set()
+    stopper.join()
+
+    assert flushed == [0, 1]
+    assert not [thread for thread in threading.enumerate() if thread.name == "test-stopping-writer"]
+
+
+def test_batch_writer_retries_failed_flushes():
+    attempts = []
+    failures = [RuntimeError("database is locked")] * 2
+
+    def flush(batch):
+        attempts.append(list(batch))
+        if failures:
+            raise failures.pop()
+
+    logger = Mock()
+    writer = BatchWriter("test-retry-writer", flush, batch_size=10, flush_interval=0.01, max_queue=10, retries=2, retry_delay=0, logger=logger)
+    writer.put(0)
+    writer.stop()
+    assert attempts == [[0], [0], [0]]
+    assert writer.stats["flushed"] == 1 and writer.stats["retries"] == 2
+    logger.error.assert_not_called()
+
+    # Once the retries are used up the batch is counted as failed and logged
+    failures.extend([RuntimeError("database is locked")] * 3)
+    writer.put(1)
+    writer.stop()
+    assert writer.stats["failed"] == 1 and writer.stats["retries"] == 4
+    logger.error.assert_called_once()
@@ -0,0 +1,66 @@
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from unittest.mock import Mock
+
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED, JobExecutionEvent, JobSubmissionEvent
+from sqlalchemy import create_engine, text
+
+from api import metrics
+from api.metrics import JOB_DEFERRED, commit_seconds, instrument_engine, job_results, on_job_event, render_metrics, upstream_seconds
+from api.weather import WEATHER_API, call_api
+
+
+def test_job_events():
+    now = datetime.now(timezone.utc)
+    before = {result: job_results.value(result) for result in ("success", "error", "misfire", "deferred")}
+
+    on_job_event(JobSubmissionEvent(EVENT_JOB_SUBMITTED, "1", "default", [now]))
+    on_job_event(JobSubmissionEvent(EVENT_JOB_SUBMITTED, "2", "default", [now]))
+    assert metrics._jobs_in_flight >= 2
+
+    on_job_event(JobExecutionEvent(EVENT_JOB_EXECUTED, "1", "default", now, retval=True))
+    # A fetch that failed and returned False
+    on_job_event(JobExecutionEvent(EVENT_JOB_EXECUTED, "2", "default", now, retval=False))
+    on_job_event(JobExecutionEvent(EVENT_JOB_MISSED, "3", "default", now))
+
+    assert job_results.value("success") - before["success"] == 1
+    assert job_results.value("error") - before["error"] == 1
+    assert job_results.value("misfire") - before["misfire"] == 1
+
+    on_job_event(JobSubmissionEvent(EVENT_JOB_SUBMITTED, "4", "default", [now]))
+    on_job_event(JobExecutionEvent(EVENT_JOB_ERROR, "4", "default", now, exception=ValueError()))
+    assert job_results.value("error") - before["error"] == 2
+
+    # A fetch deferred while Open-Meteo is unavailable is neither a success nor an error
+    on_job_event(JobExecutionEvent(EVENT_JOB_EXECUTED, "5", "default", now, retval=JOB_DEFERRED))
+    assert job_results.value("deferred") - before["deferred"] == 1
+
+    # An async fetch is counted when its future is done, not when the job hands it over
+    futures = [Future(), Future()]
+    for future in futures:
+        on_job_event(JobExecutionEvent(EVENT_JOB_EXECUTED, "6", "default", now, retval=future))
+    assert metrics._async_in_flight >= 2
+    assert job_results.value("success") - before["success"] == 1
+    futures[0].set_result(False)
+    futures[1].set_exception(ValueError())
+    assert job_results.value("error") - before["error"] == 4
+    assert job_results.value("success") - before["success"] == 1
+
+
+def test_commit_and_upstream_latency(monkeypatch):
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    commits = commit_seconds.count()
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE t (x INTEGER)"))
+    assert commit_seconds.count() == commits + 1
+
+    monkeypatch.setattr("api.weather._session.get", Mock(return_value=Mock()))
+    calls = upstream_seconds.count("forecast")
+    call_api(WEATHER_API, {})
+    assert upstream_seconds.count("forecast") == calls + 1
+
+    text_format = render_metrics()
+    assert "# TYPE weather_upstream_request_seconds histogram" in text_format
+    assert 'weather_upstream_request_seconds_bucket{endpoint="forecast",le="+Inf"}' in text_format
+    assert "weather_scheduler_pool_saturation " in text_format
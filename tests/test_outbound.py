@@ -0,0 +1,100 @@
+from unittest.mock import Mock
+
+import pytest
+import requests
+
+from api import outbound
+from api.metrics import JOB_DEFERRED
+from api.outbound import CircuitBreaker, TokenBucket, UpstreamUnavailable, outbound_stats
+from api.weather import WEATHER_API, call_api, fetch_stats, fetch_weather_job
+
+
+def _response(status_code: int, headers: dict | None = None) -> Mock:
+    response = Mock(status_code=status_code, headers=headers or {})
+    if status_code >= 400:
+        response.raise_for_status.side_effect = requests.HTTPError(f"{status_code}", response=response)
+    return response
+
+
+@pytest.fixture
+def breaker(in_memory_test_db, monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=60)
+    monkeypatch.setattr("api.outbound.circuit_breaker", breaker)
+    monkeypatch.setattr("api.config.OUTBOUND_BACKOFF_BASE_SECONDS", 0)
+    return breaker
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve(max_wait=1) == 0
+    assert bucket.reserve(max_wait=1) == 0
+    # The burst is used up, the next callers queue for tokens at 10 per second
+    assert bucket.reserve(max_wait=1) == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve(max_wait=1) == pytest.approx(0.2, abs=0.01)
+    with pytest.raises(UpstreamUnavailable):
+        bucket.reserve(max_wait=0.1)
+
+    assert TokenBucket(rate=0, burst=1).reserve(max_wait=0) == 0
+
+
+def test_circuit_breaker(in_memory_test_db, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("api.outbound.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+
+    breaker.record_failure()
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(UpstreamUnavailable):
+        breaker.allow()
+
+    # One trial call after the reset time, a failed trial opens the circuit again
+    now[0] += 30
+    breaker.allow()
+    with pytest.raises(UpstreamUnavailable):
+        breaker.allow()
+    breaker.record_failure()
+    with pytest.raises(UpstreamUnavailable):
+        breaker.allow()
+
+    now[0] += 30
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.allow()
+
+
+def test_call_api_retries_transient_errors(breaker, monkeypatch):
+    get = Mock(side_effect=[_response(503), _response(429, {"Retry-After": "0"}), _response(200)])
+    monkeypatch.setattr("api.weather._session.get", get)
+    retries = outbound_stats["retries"]
+
+    assert call_api(WEATHER_API, {}).status_code == 200
+    assert get.call_count == 3
+    assert outbound_stats["retries"] - retries == 2
+    # Every request has a timeout
+    assert get.call_args.kwargs["timeout"] == outbound.requests_timeout()
+
+    # Client errors are not retried
+    get = Mock(return_value=_response(400))
+    monkeypatch.setattr("api.weather._session.get", get)
+    with pytest.raises(requests.HTTPError):
+        call_api(WEATHER_API, {})
+    assert get.call_count == 1
+
+
+def test_fetch_deferred_while_circuit_is_open(breaker, monkeypatch):
+    monkeypatch.setattr("api.config.OUTBOUND_RETRIES", 0)
+    get = Mock(side_effect=requests.ConnectionError("down"))
+    monkeypatch.setattr("api.weather._session.get", get)
+
+    for _ in range(3):
+        assert fetch_weather_job(1) is False
+    assert breaker.state == "open"
+
+    # Open-Meteo is not called while the circuit is open
+    deferred = fetch_stats["deferred"]
+    assert fetch_weather_job(1) == JOB_DEFERRED
+    assert fetch_stats["deferred"] - deferred == 1
+    assert get.call_count == 3
@@ -0,0 +1,85 @@
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from api import config, db, scheduler, weather
+from api.db import create_db_engine
+from api.scheduler import add_job, expected_load, job_phase, reconcile_jobs, start_scheduler, update_job_interval
+
+
+def test_job_phases_are_spread_over_the_interval():
+    interval_seconds = 900
+    phases = [job_phase(job_id, interval_seconds) for job_id in range(1, 901)]
+
+    assert phases == [job_phase(job_id, interval_seconds) for job_id in range(1, 901)]
+    assert all(0 <= phase < interval_seconds for phase in phases)
+    # 900 jobs on a 15 minute interval, no second of it gets more than a few
+    load = expected_load([(job_id, 0.25) for job_id in range(1, 901)], 0, interval_seconds)
+    assert sum(load) == 900
+    assert max(load) <= 3
+
+
+def test_expected_load_window():
+    phase = job_phase(1, 900)
+    # Every run of a job inside the window is counted, relative to the window start
+    load = expected_load([(1, 0.25)], phase - 10, 1800)
+    assert [second for second, count in enumerate(load) if count] == [10, 910]
+
+
+def test_add_job_staggers_and_update_keeps_args(mock_scheduler, monkeypatch):
+    monkeypatch.setattr("api.config.SCHEDULER_JITTER_SECONDS", 5)
+    callback = lambda city_id: None  # noqa: E731
+
+    add_job(7, 0.5, callback, 7)
+    _, trigger = scheduler.scheduler.add_job.call_args.args
+    assert trigger.interval == timedelta(minutes=30)
+    assert trigger.jitter == 5
+    assert trigger.start_date == datetime.fromtimestamp(job_phase(7, 1800), timezone.utc)
+    assert scheduler.scheduler.add_job.call_args.kwargs["args"] == (7,)
+
+    update_job_interval(7, 1.0, callback, 7)
+    scheduler.scheduler.remove_job.assert_called_with("7")
+    assert scheduler.scheduler.add_job.call_args.kwargs["args"] == (7,)
+
+
+def scheduled_city_job(city_id: int):
+    pass
+
+
+def test_persisted_jobs_are_reconciled(tmp_path, monkeypatch):
+    monkeypatch.setattr("api.db.engine", create_db_engine(f"sqlite:///{tmp_path / 'jobs.db'}"))
+
+    def restart() -> BackgroundScheduler:
+        background_scheduler = BackgroundScheduler()
+        monkeypatch.setattr("api.scheduler.scheduler", background_scheduler)
+        start_scheduler()
+        background_scheduler.pause()
+        return background_scheduler
+
+    first = restart()
+    assert reconcile_jobs([(1, 0.25), (2, 0.5), (3, 1.0)], scheduled_city_job) == {"added": 3}
+    next_run_time = first.get_job("1").next_run_time
+    first.shutdown()
+
+    # Unchanged jobs keep their persisted state, the others are updated, added or removed
+    second = restart()
+    stats = reconcile_jobs([(1, 0.25), (2, 2.0), (4, 0.25)], scheduled_city_job)
+    assert stats == {"kept": 1, "updated": 1, "added": 1, "removed": 1}
+    assert second.get_job("1").next_run_time == next_run_time
+    assert second.get_job("2").trigger.interval == timedelta(hours=2)
+    assert sorted(job.id for job in second.get_jobs()) == ["1", "2", "4"]
+    assert second.get_job("1").misfire_grace_time == config.SCHEDULER_MISFIRE_GRACE_SECONDS
+    second.shutdown()
+
+
+def test_simulation_restores_patched_modules():
+    from benchmarks import simulate
+
+    before = (db.engine, db.SessionLocal, weather.time, weather.call_api)
+    parser = argparse.ArgumentParser()
+    simulate.add_arguments(parser)
+
+    report = simulate.simulate(parser.parse_args(["--cities", "50", "--hours", "0.5", "--execute-cities", "5"]))
+    assert report["runs"]["started"] == report["runs"]["scheduled"] > 0
+    assert (db.engine, db.SessionLocal, weather.time, weather.call_api) == before
@@ -1,6 +1,9 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
 from pytest import approx
 
-from api.utils import celsius_to_fahrenheit, convert_utc_iso_to_target_timezone
+from api.utils import celsius_to_fahrenheit, convert_observations, convert_utc_iso_to_target_timezone, to_epoch
 
 
 def test_utc_isoformat_to_target_timezone():
@@ -69,3 +72,32 @@ def test_celsius_to_fahrenheit():
     assert celsius_to_fahrenheit(0.0) == approx(32.0)
     assert celsius_to_fahrenheit(-5) == approx(23.0)
     assert celsius_to_fahrenheit(20) == approx(68.0)
+
+
+def test_convert_observations():
+    epoch_times = [1756468800, 1735732800, 1756468800]  # 2025-08-29T12:00:00Z, 2025-01-01T12:00:00Z
+    temperatures_c = [0, 37.5, -10.5]
+
+    # Matches the per-row functions for every row
+    timestamps, temperatures = convert_observations(epoch_times, temperatures_c, "F", "Europe/Stockholm")
+    assert [timestamp.isoformat() for timestamp in timestamps] == [
+        "2025-08-29T14:00:00+02:00",
+        "2025-01-01T13:00:00+01:00",
+        "2025-08-29T14:00:00+02:00",
+    ]
+    assert timestamps[0] == convert_utc_iso_to_target_timezone("2025-08-29T12:00:00+00:00", "Europe/Stockholm")
+    assert temperatures == [celsius_to_fahrenheit(celsius) for celsius in temperatures_c]
+
+    # Celsius is passed through, UTC stays UTC
+    timestamps, temperatures = convert_observations(epoch_times[:1], temperatures_c[:1], "C", "UTC")
+    assert timestamps[0].isoformat() == "2025-08-29T12:00:00+00:00"
+    assert temperatures == [0]
+
+    # Invalid timezone
+    timestamps, _ = convert_observations(epoch_times, temperatures_c, "C", "Invalid/Timezone")
+    assert timestamps == [None] * len(epoch_times)
+
+
+def test_to_epoch():
+    assert to_epoch(datetime(2025, 8, 29, 12)) == 1756468800
+    assert to_epoch(datetime(2025, 8, 29, 14, tzinfo=ZoneInfo("Europe/Stockholm"))) == 1756468800
@@ -1,7 +1,26 @@
+import time
+from datetime import datetime, timezone
+
 import pytest
 from requests import RequestException
 
-from api.weather import fetch_weather_job, get_coordinates
+from api.cache import geocode_cache
+from api.db import City, WeatherObservation, get_db, select
+from api.fetcher import stop_fetcher
+from api.scheduler import scheduled_interval_seconds
+from tests.conftest import MockResponseObject, mock_call_api
+from api.weather import (
+    backfill_hours,
+    batch_stats,
+    fetch_stats,
+    fetch_weather_batch,
+    fetch_weather_job,
+    flush_weather_batch,
+    get_coordinates,
+    observation_writer,
+    run_weather_job,
+    write_observations,
+)
 
 
 def test_create_weather_job(in_memory_test_db, mock_external_api_requests):
@@ -11,8 +30,249 @@ def test_create_weather_job(in_memory_test_db, mock_external_api_requests):
     assert fetch_weather_job(city_id=1999) is None
 
 
-def test_get_coordinates(mock_external_api_requests):
+def test_get_coordinates(in_memory_test_db, mock_external_api_requests):
     assert get_coordinates("Stockholm", "SE") == (99.99, 0.01)
     assert get_coordinates("NOT FOUND", "SE") is None
     with pytest.raises(RequestException):
         get_coordinates("RAISE EXCEPTION", "SE")
+
+
+def test_get_coordinates_cache(in_memory_test_db, mock_external_api_requests, monkeypatch):
+    calls = []
+    monkeypatch.setattr("api.weather.call_api", lambda url, params: calls.append(params) or mock_call_api(url, params))
+
+    assert get_coordinates("Stockholm", "SE") == (99.99, 0.01)
+    assert get_coordinates("NOT FOUND", "SE") is None
+    assert len(calls) == 2
+
+    # Found and not-found pairs are answered from memory, then from the database once memory is gone
+    assert get_coordinates(" stockholm", "se") == (99.99, 0.01)
+    assert get_coordinates("NOT FOUND", "SE") is None
+    geocode_cache.clear()
+    assert get_coordinates("Stockholm", "SE") == (99.99, 0.01)
+    assert get_coordinates("NOT FOUND", "SE") is None
+    assert len(calls) == 2
+
+    # Errors are never cached
+    for _ in range(2):
+        with pytest.raises(RequestException):
+            get_coordinates("RAISE EXCEPTION", "SE")
+    assert len(calls) == 4
+
+    # Expired entries are looked up again
+    monkeypatch.setattr("api.config.GEOCODE_NEGATIVE_TTL_HOURS", 0)
+    assert get_coordinates("NOT FOUND", "SE") is None
+    assert len(calls) == 5
+
+
+def test_fetch_weather_batch(in_memory_test_db, mock_external_api_requests, monkeypatch):
+    monkeypatch.setattr("api.config.BATCH_CHUNK_SIZE", 2)
+    calls_saved = batch_stats["calls_saved"]
+
+    # Both existing cities fit in one request, the unknown city is skipped
+    assert fetch_weather_batch([1, 2, 1999]) == 2
+    assert batch_stats["calls_saved"] == calls_saved + 1
+
+    db = get_db()
+    try:
+        city_ids = db.execute(select(WeatherObservation.city_id)).scalars().all()
+    finally:
+        db.close()
+    assert sorted(city_ids) == [1, 1, 2, 2]
+
+
+def test_run_weather_job_batch_mode(in_memory_test_db, mock_external_api_requests, monkeypatch):
+    monkeypatch.setattr("api.config.FETCH_MODE", "batch")
+
+    # Jobs are queued instead of fetched, then sent together on flush
+    assert run_weather_job(1) is None
+    assert run_weather_job(2) is None
+    assert flush_weather_batch() == 2
+    assert flush_weather_batch() == 0
+
+
+def test_run_weather_job_async_mode(in_memory_test_db, mock_external_api_requests, monkeypatch):
+    monkeypatch.setattr("api.config.FETCH_MODE", "async")
+    # The in-memory test database is a single shared connection, so database work must not overlap
+    monkeypatch.setattr("api.config.ASYNC_DB_WORKERS", 1)
+
+    try:
+        # The scheduler thread gets a future back instead of waiting on the request
+        futures = [run_weather_job(1), run_weather_job(2), run_weather_job(1999)]
+        assert [future.result(timeout=5) for future in futures] == [True, True, None]
+    finally:
+        stop_fetcher()
+
+
+def test_fetch_weather_job_write_behind(in_memory_test_db, mock_external_api_requests, monkeypatch):
+    monkeypatch.setattr("api.config.WRITE_BEHIND", True)
+    flushes = observation_writer.stats["flushes"]
+
+    def count_observations():
+        db = get_db()
+        try:
+            return len(db.execute(select(WeatherObservation.id)).all())
+        finally:
+            db.close()
+
+    before = count_observations()
+    assert fetch_weather_job(city_id=1) is True
+    assert fetch_weather_batch([1, 2]) == 2
+
+    # Stopping the writer flushes everything that is still buffered, city 1's second observation is a duplicate
+    observation_writer.stop()
+    assert count_observations() == before + 2
+    assert observation_writer.stats["flushes"] > flushes
+    assert observation_writer.snapshot()["queue_depth"] == 0
+
+
+def test_duplicate_and_current_observations(in_memory_test_db, mock_external_api_requests, monkeypatch):
+    duplicates = fetch_stats["duplicates"]
+    skipped = fetch_stats["skipped_current"]
+
+    def observations(city_id: int) -> list[tuple[int, float]]:
+        db = get_db()
+        try:
+            stmt = select(WeatherObservation.observed_at, WeatherObservation.temperature_c).where(WeatherObservation.city_id == city_id)
+            return [tuple(row) for row in db.execute(stmt.order_by(WeatherObservation.observed_at))]
+        finally:
+            db.close()
+
+    # Open-Meteo returns the same observation until the next 15 minute slot, it is stored once
+    assert fetch_weather_job(city_id=1) is True
+    assert fetch_weather_job(city_id=1) is True
+    assert len(observations(1)) == 2
+    assert fetch_stats["duplicates"] - duplicates == 1
+
+    # An observation from the current slot makes the fetch unnecessary
+    db = get_db()
+    try:
+        write_observations(db, [(2, int(time.time()) // 900 * 900, 20.5), (2, int(time.time()) // 900 * 900, 30.0)])
+        db.commit()
+    finally:
+        db.close()
+    assert observations(2)[-1][1] == 20.5
+    monkeypatch.setattr("api.weather.call_api", lambda *args: pytest.fail("current weather fetched again"))
+    assert fetch_weather_job(city_id=2) is None
+    assert fetch_weather_batch([2]) == 0
+    assert fetch_stats["skipped_current"] - skipped == 2
+
+
+def test_cities_in_the_same_grid_cell_share_fetches(in_memory_test_db, mock_external_api_requests, monkeypatch):
+    deduplicated = fetch_stats["grid_deduplicated"]
+    calls = []
+
+    def call_api(url: str, params: dict):
+        calls.append(params)
+        # Current weather of the running slot, so the fetched cell can be shared
+        current_weather = {"time": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M"), "temperature": 12.5}
+        return MockResponseObject({"current_weather": current_weather})
+
+    monkeypatch.setattr("api.weather.call_api", call_api)
+    monkeypatch.setattr("api.config.GRID_RESOLUTION_DEG", 0.01)
+    db = get_db()
+    try:
+        # Suburbs within a few hundred metres of cities 1 and 2
+        db.add_all(
+            [
+                City(name="SUBURB 1", country_code="US", latitude=0.501, longitude=-0.499, interval_hours=0.25),
+                City(name="SUBURB 2", country_code="SE", latitude=0.298, longitude=0.202, interval_hours=0.25),
+            ]
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    # A later fetch in the same slot reuses the weather of the city's grid cell
+    assert fetch_weather_job(city_id=1) is True
+    assert fetch_weather_job(city_id=3) is True
+    assert len(calls) == 1
+
+    # A batch requests one location per cell and stores the weather for every city in it
+    assert fetch_weather_batch([2, 4]) == 2
+    assert len(calls) == 2
+    assert "," not in str(calls[1]["latitude"])
+    assert fetch_stats["grid_deduplicated"] - deduplicated == 2
+
+
+def test_missed_runs_are_backfilled_from_the_hourly_series(in_memory_test_db, monkeypatch):
+    backfilled = fetch_stats["backfilled"]
+    now = int(time.time())
+    slot, hour = now // 900 * 900, now // 3600 * 3600
+    # City 1 (every 15 minutes) was last fetched five hours ago
+    last = hour - 5 * 3600
+    calls = []
+
+    def utc_time(epoch_seconds: int) -> str:
+        return datetime.fromtimestamp(epoch_seconds, timezone.utc).strftime("%Y-%m-%dT%H:%M")
+
+    def call_api(url: str, params: dict):
+        calls.append(params)
+        hours = range(hour - params.get("past_hours", 0) * 3600, hour + 3600, 3600)
+        return MockResponseObject(
+            {
+                "current_weather": {"time": utc_time(slot), "temperature": 12.5},
+                "hourly": {"time": [utc_time(h) for h in hours], "temperature_2m": [float(h // 3600 % 24) for h in hours]},
+            }
+        )
+
+    def observed_at(city_id: int) -> list[int]:
+        db = get_db()
+        try:
+            stmt = select(WeatherObservation.observed_at).where(WeatherObservation.city_id == city_id, WeatherObservation.observed_at >= last)
+            return list(db.execute(stmt.order_by(WeatherObservation.observed_at)).scalars())
+        finally:
+            db.close()
+
+    monkeypatch.setattr("api.weather.call_api", call_api)
+    db = get_db()
+    try:
+        db.query(WeatherObservation).delete()
+        db.add_all([WeatherObservation(city_id=1, temperature_c=9, observed_at=last), WeatherObservation(city_id=2, temperature_c=9, observed_at=last)])
+        db.commit()
+    finally:
+        db.close()
+
+    # One request fetches the gap, every hour after the latest observation and before the current one is stored
+    gap = [last] + [h for h in range(last + 3600, hour + 3600, 3600) if h < slot] + [slot]
+    assert fetch_weather_job(city_id=1) is True
+    assert len(calls) == 1 and calls[0]["past_hours"] >= 5 and calls[0]["current_weather"] is True
+    assert observed_at(1) == gap
+    assert fetch_stats["backfilled"] - backfilled == len(gap) - 2
+
+    # A batch fetches the gap of its cities as well
+    assert fetch_weather_batch([2]) == len(gap) - 1
+    assert observed_at(2) == gap
+
+    # Without a missed run, or with backfilling disabled, only the current weather is fetched
+    monkeypatch.setattr("api.config.OBSERVATION_SLOT_SECONDS", 0)
+    assert fetch_weather_job(city_id=1) is True
+    monkeypatch.setattr("api.config.BACKFILL_MAX_HOURS", 0)
+    db = get_db()
+    try:
+        db.query(WeatherObservation).filter(WeatherObservation.observed_at > last).delete()
+        db.commit()
+    finally:
+        db.close()
+    assert fetch_weather_job(city_id=1) is True
+    assert "past_hours" not in calls[2] and "past_hours" not in calls[3]
+    assert observed_at(1) == [last, slot]
+
+
+def test_hourly_series_mode(in_memory_test_db, monkeypatch):
+    now = int(time.time())
+    assert scheduled_interval_seconds(1.0) == 3600
+    assert backfill_hours(1.0, now - 3600) == 0
+
+    # Cities fetched hourly or less often run every 'HOURLY_SERIES_HOURS' and fetch every hour since their latest observation
+    monkeypatch.setattr("api.config.HOURLY_SERIES_HOURS", 6)
+    assert scheduled_interval_seconds(1.0) == scheduled_interval_seconds(2.0) == 6 * 3600
+    assert scheduled_interval_seconds(0.5) == 1800
+    assert backfill_hours(1.0, now - 6 * 3600) == 6
+    assert backfill_hours(1.0, None) == 6
+    assert backfill_hours(0.5, now - 3600) == 0
+
+    # Long gaps are capped
+    monkeypatch.setattr("api.config.BACKFILL_MAX_HOURS", 24)
+    assert backfill_hours(1.0, now - 30 * 24 * 3600) == 24
+    assert backfill_hours(0.5, now - 30 * 24 * 3600) == 24